@@ -0,0 +1,95 @@
+# core/idempotency.py
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import response, status
+
+from .models import SolicitudIdempotente
+
+
+HEADER = "Idempotency-Key"
+MAX_LONGITUD_CLAVE = 255
+
+
+def _huella(request):
+    data = request.data
+    if hasattr(data, "lists"):  # QueryDict (form/multipart)
+        data = dict(data.lists())
+    cuerpo = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True, default=str)
+    return hashlib.sha256(f"{request.method} {request.path}\n{cuerpo}".encode()).hexdigest()
+
+
+def _reproducir(solicitud, huella):
+    if solicitud.huella != huella:
+        return response.Response(
+            {"detail": f"{HEADER} ya se usó con otra petición."},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    resp = response.Response(solicitud.respuesta, status=solicitud.status_code)
+    resp["Idempotent-Replayed"] = "true"
+    return resp
+
+
+def idempotente(func):
+    """
+    Decorador para acciones POST de un ViewSet con CompanyScopedQuerysetMixin.
+
+    Si la petición trae `Idempotency-Key`, la respuesta exitosa (2xx) se guarda
+    por (empresa, clave) durante `IDEMPOTENCIA_TTL` segundos y los reintentos
+    reciben esa misma respuesta sin volver a ejecutar la acción.
+
+    La fila de la clave se inserta en la misma transacción que la acción: un
+    reintento concurrente espera en el índice único hasta que la primera termine
+    y entonces reproduce su respuesta (o, si la primera falló, ejecuta él).
+    Una clave reutilizada con otro cuerpo responde 422.
+    Sin header, o sin empresa activa, la acción se ejecuta normalmente.
+    """
+    @wraps(func)
+    def wrapper(view, request, *args, **kwargs):
+        clave = (request.headers.get(HEADER) or "").strip()
+        empresa_id = view.get_active_company_id() if clave else None
+        if not clave or not empresa_id:
+            return func(view, request, *args, **kwargs)
+        if len(clave) > MAX_LONGITUD_CLAVE:
+            return response.Response(
+                {"detail": f"{HEADER} no puede exceder {MAX_LONGITUD_CLAVE} caracteres."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        huella = _huella(request)
+        ahora = timezone.now()
+        existentes = SolicitudIdempotente.objects.filter(empresa_id=empresa_id, clave=clave)
+        previa = existentes.filter(expira_en__gt=ahora).first()
+        if previa:
+            return _reproducir(previa, huella)
+        existentes.filter(expira_en__lte=ahora).delete()
+
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    solicitud = SolicitudIdempotente.objects.create(
+                        empresa_id=empresa_id,
+                        clave=clave,
+                        ruta=request.path[:255],
+                        huella=huella,
+                        expira_en=ahora + timedelta(seconds=settings.IDEMPOTENCIA_TTL),
+                    )
+            except IntegrityError:
+                # Otra petición con la misma clave terminó mientras esperábamos.
+                return _reproducir(existentes.get(), huella)
+
+            resp = func(view, request, *args, **kwargs)
+            if status.is_success(resp.status_code) and hasattr(resp, "data"):
+                solicitud.status_code = resp.status_code
+                solicitud.respuesta = resp.data
+                solicitud.save(update_fields=["status_code", "respuesta"])
+            else:
+                solicitud.delete()
+        return resp
+    return wrapper
@@ -0,0 +1,13 @@
+# core/management/commands/purgar_idempotencia.py
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import SolicitudIdempotente
+
+
+class Command(BaseCommand):
+    help = "Elimina las respuestas guardadas por Idempotency-Key cuyo TTL ya venció."
+
+    def handle(self, *args, **options):
+        borradas, _ = SolicitudIdempotente.objects.filter(expira_en__lte=timezone.now()).delete()
+        self.stdout.write(self.style.SUCCESS(f"Solicitudes idempotentes eliminadas: {borradas}."))
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:07
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('empresas', '0002_configuracion_valorconfiguracion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SolicitudIdempotente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=255)),
+                ('ruta', models.CharField(max_length=255)),
+                ('huella', models.CharField(max_length=64)),
+                ('status_code', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('respuesta', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='creado')),
+                ('expira_en', models.DateTimeField()),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='solicitudes_idempotentes', to='empresas.empresa')),
+            ],
+            options={
+                'verbose_name': 'Solicitud idempotente',
+                'verbose_name_plural': 'Solicitudes idempotentes',
+                'indexes': [models.Index(fields=['expira_en'], name='core_solici_expira__027821_idx')],
+                'constraints': [models.UniqueConstraint(fields=('empresa', 'clave'), name='uniq_idempotencia_empresa_clave')],
+            },
+        ),
+    ]
@@ -1,6 +1,7 @@
 
 from django.db import models
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 
 
 class TimeStampedModel(models.Model):
@@ -33,3 +34,30 @@ class TimeStampedModel(models.Model):
 
     class Meta:
         abstract = True
+
+
+class SolicitudIdempotente(models.Model):
+    """
+    Respuesta guardada de una petición con header `Idempotency-Key`
+    (ver core.idempotency). Un reintento con la misma clave dentro del TTL
+    recibe esta respuesta sin volver a ejecutar la operación.
+    """
+    empresa = models.ForeignKey('empresas.Empresa', on_delete=models.CASCADE, related_name='solicitudes_idempotentes')
+    clave = models.CharField(max_length=255)
+    ruta = models.CharField(max_length=255)
+    huella = models.CharField(max_length=64)  # sha256 de método + ruta + cuerpo
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    respuesta = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="creado")
+    expira_en = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Solicitud idempotente'
+        verbose_name_plural = 'Solicitudes idempotentes'
+        constraints = [
+            models.UniqueConstraint(fields=['empresa', 'clave'], name='uniq_idempotencia_empresa_clave'),
+        ]
+        indexes = [models.Index(fields=['expira_en'])]
+
+    def __str__(self):
+        return f'{self.clave} (emp:{self.empresa_id})'
@@ -0,0 +1,104 @@
+# core/pagination.py
+from decimal import Decimal
+
+from django.core import signing
+from django.db.models import Q
+from rest_framework import exceptions, pagination, response
+from rest_framework.utils.urls import replace_query_param
+
+
+def _valor_cursor(valor):
+    # isoformat completo: DjangoJSONEncoder trunca a milisegundos y rompería el empate por fecha.
+    if hasattr(valor, "isoformat"):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return str(valor)
+    return valor
+
+
+def usa_keyset(request):
+    """Modo cursor: ?paginacion=cursor en la primera página, ?cursor=<token> en las siguientes."""
+    params = request.query_params
+    return params.get("paginacion") == "cursor" or bool(params.get("cursor"))
+
+
+class KeysetPagination(pagination.BasePagination):
+    """
+    Paginación keyset (seek) sobre `keyset_fields` de la vista, p. ej. ("-fecha", "-id").
+    Cada página filtra `(fecha, id) < (cursor)` y lee `page_size + 1` filas del
+    índice, así que el costo no crece con la profundidad (no hay OFFSET ni COUNT).
+    El último campo debe ser único (id). El cursor va firmado.
+    Respuesta: {"next": url | null, "results": [...]}.
+    """
+    page_size = 50
+    max_page_size = 1000
+    page_size_query_param = "page_size"
+    cursor_query_param = "cursor"
+    keyset_fields = ("-id",)
+    salt = "core.keyset"
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def _despues_de(self, campos, valores, desc):
+        # (a, b) < (va, vb)  ->  a <= va AND (a < va OR b < vb): el primer término usa el índice.
+        op, op_eq = ("lt", "lte") if desc else ("gt", "gte")
+        cond = Q(**{f"{campos[-1]}__{op}": valores[-1]})
+        for campo, valor in reversed(list(zip(campos[:-1], valores[:-1]))):
+            cond = Q(**{f"{campo}__{op_eq}": valor}) & (Q(**{f"{campo}__{op}": valor}) | cond)
+        return cond
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        keyset = tuple(getattr(view, "keyset_fields", None) or self.keyset_fields)
+        campos = [f.lstrip("-") for f in keyset]
+        queryset = queryset.order_by(*keyset)
+
+        raw = request.query_params.get(self.cursor_query_param)
+        if raw:
+            try:
+                valores = signing.loads(raw, salt=self.salt)
+                if not isinstance(valores, list) or len(valores) != len(campos):
+                    raise signing.BadSignature()
+            except signing.BadSignature:
+                # Error del cliente (cursor alterado o de otra vista): 400, no 404.
+                raise exceptions.ParseError("cursor inválido.")
+            queryset = queryset.filter(self._despues_de(campos, valores, keyset[0].startswith("-")))
+
+        size = self.get_page_size(request)
+        rows = list(queryset[:size + 1])
+        self.next_token = None
+        if len(rows) > size:
+            rows = rows[:size]
+            ultimo = [_valor_cursor(getattr(rows[-1], c)) for c in campos]
+            self.next_token = signing.dumps(ultimo, salt=self.salt)
+        return rows
+
+    def get_next_link(self):
+        if not self.next_token:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, "paginacion", "cursor")
+        return replace_query_param(url, self.cursor_query_param, self.next_token)
+
+    def get_paginated_response(self, data):
+        return response.Response({"next": self.get_next_link(), "results": data})
+
+
+class KeysetListMixin:
+    """
+    Agrega a un ViewSet el modo cursor de `list` (ver `usa_keyset`).
+    `keyset_fields` define el orden y la llave; ?ordering= no aplica en este modo.
+    """
+    keyset_fields = ("-id",)
+    keyset_pagination_class = KeysetPagination
+
+    def keyset_list(self, queryset):
+        paginator = self.keyset_pagination_class()
+        page = paginator.paginate_queryset(queryset, self.request, view=self)
+        ser = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(ser.data)
@@ -0,0 +1,86 @@
+# core/search.py
+import operator
+from functools import reduce
+
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db.models import Q, Value, FloatField
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.functions import Greatest, Upper
+from rest_framework import filters
+from rest_framework.settings import api_settings
+
+
+class TrigramSearchFilter(filters.SearchFilter):
+    """
+    Reemplazo de SearchFilter para PostgreSQL (pg_trgm).
+
+    Usa los mismos `search_fields` de la vista, pero cada término se resuelve
+    contra UPPER(campo), que es la expresión indexada con GIN gin_trgm_ops:
+      - coincidencia por subcadena (`LIKE '%TERMINO%'`), servida por el índice;
+      - coincidencia difusa (`TERMINO <% UPPER(campo)`), tolera errores de tecleo.
+
+    Prefijos soportados (igual que SearchFilter):
+      '=campo' → coincidencia exacta sin distinguir mayúsculas (sin trigramas).
+      '^campo' → prefijo; no aplica difuso.
+
+    Los campos relacionados (`categoria__nombre`) se resuelven con un subquery
+    `categoria__in (SELECT id ...)` para no hacer JOIN ni duplicar filas.
+
+    Si la petición no trae `?ordering=`, ordena por relevancia (`search_rank`).
+    Debe ir DESPUÉS de OrderingFilter en `filter_backends` para que el orden
+    por relevancia no quede sobrescrito por el `ordering` por defecto.
+
+    Para cada campo buscado debe existir un índice:
+        GinIndex(OpClass(Upper('campo'), name='gin_trgm_ops'), name=...)
+    """
+    rank_alias = "search_rank"
+
+    def _split_field(self, search_field):
+        if search_field[:1] in ("=", "^", "$", "@"):
+            return search_field[0], search_field[1:]
+        return "", search_field
+
+    def _term_q(self, model, prefix, field_path, term):
+        *related, field_name = field_path.split(LOOKUP_SEP)
+        if related:
+            # Subquery sobre el modelo relacionado: evita el JOIN + DISTINCT.
+            opts = model._meta
+            for part in related:
+                model = opts.get_field(part).related_model
+                opts = model._meta
+            inner = model._default_manager.alias(
+                **{f"_u_{field_name}": Upper(field_name)}
+            ).filter(self._term_q(model, prefix, field_name, term))
+            return Q(**{f"{LOOKUP_SEP.join(related)}__in": inner.values("pk")})
+
+        alias = f"_u_{field_name}"
+        term = term.upper()
+        if prefix == "=":
+            return Q(**{f"{alias}__exact": term})
+        if prefix == "^":
+            return Q(**{f"{alias}__startswith": term})
+        return Q(**{f"{alias}__contains": term}) | Q(**{f"{alias}__trigram_word_similar": term})
+
+    def filter_queryset(self, request, queryset, view):
+        search_fields = self.get_search_fields(view, request)
+        search_terms = self.get_search_terms(request)
+        if not search_fields or not search_terms:
+            return queryset
+
+        fields = [self._split_field(f) for f in search_fields]
+        locales = [name for _, name in fields if LOOKUP_SEP not in name]
+        queryset = queryset.alias(**{f"_u_{name}": Upper(name) for name in locales})
+
+        condiciones = [
+            reduce(operator.or_, (self._term_q(queryset.model, p, name, term) for p, name in fields))
+            for term in search_terms
+        ]
+        queryset = queryset.filter(reduce(operator.and_, condiciones))
+
+        if request.query_params.get(api_settings.ORDERING_PARAM) or not locales:
+            return queryset
+
+        texto = " ".join(search_terms).upper()
+        similitudes = [TrigramWordSimilarity(Value(texto), f"_u_{name}") for name in locales]
+        rank = similitudes[0] if len(similitudes) == 1 else Greatest(*similitudes, output_field=FloatField())
+        return queryset.annotate(**{self.rank_alias: rank}).order_by(f"-{self.rank_alias}", "-pk")
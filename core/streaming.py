@@ -0,0 +1,170 @@
+# core/streaming.py
+import csv
+import json
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+
+def _dumps(obj):
+    return json.dumps(obj, cls=DjangoJSONEncoder, ensure_ascii=False)
+
+
+def iter_json_object(rows, key="resultados", extra=None):
+    """
+    Genera un objeto JSON `{**extra, key: [row, row, ...]}` fila por fila,
+    sin materializar la lista completa en memoria.
+    """
+    head = _dumps(extra or {})[:-1]
+    yield head + (", " if extra else "") + _dumps(key) + ": ["
+    first = True
+    for row in rows:
+        yield ("" if first else ",") + _dumps(row)
+        first = False
+    yield "]}"
+
+
+def streaming_json_response(rows, key="resultados", extra=None):
+    return StreamingHttpResponse(
+        iter_json_object(rows, key=key, extra=extra),
+        content_type="application/json",
+    )
+
+
+class Echo:
+    """Pseudo-buffer para csv.writer: devuelve la línea en vez de escribirla."""
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows, header=None):
+    writer = csv.writer(Echo())
+    if header:
+        yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def streaming_csv_response(rows, header=None, filename="export.csv"):
+    resp = StreamingHttpResponse(iter_csv(rows, header=header), content_type="text/csv; charset=utf-8")
+    resp["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return resp
+
+
+# -----------------------------
+# XLSX en streaming (sin dependencias)
+# -----------------------------
+_XLSX_ESTATICOS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Hoja1" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+class _Buffer:
+    """Destino no-seekable para ZipFile: acumula bytes y los entrega al vaciarse."""
+    def __init__(self):
+        self.partes = []
+
+    def write(self, data):
+        self.partes.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        data = b"".join(self.partes)
+        self.partes = []
+        return data
+
+
+def _celda_xlsx(valor):
+    if valor is None or valor == "":
+        return "<c/>"
+    if isinstance(valor, bool):
+        return f'<c t="b"><v>{int(valor)}</v></c>'
+    if isinstance(valor, (int, float, Decimal)):
+        return f"<c><v>{valor}</v></c>"
+    if isinstance(valor, (datetime, date)):
+        valor = valor.isoformat()
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(str(valor))}</t></is></c>'
+
+
+def iter_xlsx(rows, header=None, filas_por_bloque=500):
+    """
+    Genera un .xlsx (una hoja, celdas inlineStr) fila por fila. ZipFile escribe
+    sobre un buffer no-seekable (usa data descriptors), así que la memoria no
+    depende del número de filas.
+    """
+    buffer = _Buffer()
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for nombre, contenido in _XLSX_ESTATICOS.items():
+            zf.writestr(nombre, contenido)
+        yield buffer.vaciar()
+        with zf.open("xl/worksheets/sheet1.xml", mode="w", force_zip64=True) as hoja:
+            hoja.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            bloque = []
+            filas = rows if header is None else _con_encabezado(header, rows)
+            for fila in filas:
+                bloque.append("<row>" + "".join(_celda_xlsx(v) for v in fila) + "</row>")
+                if len(bloque) >= filas_por_bloque:
+                    hoja.write("".join(bloque).encode("utf-8"))
+                    bloque = []
+                    data = buffer.vaciar()
+                    if data:
+                        yield data
+            hoja.write(("".join(bloque) + "</sheetData></worksheet>").encode("utf-8"))
+    yield buffer.vaciar()
+
+
+def _con_encabezado(header, rows):
+    yield header
+    yield from rows
+
+
+def streaming_xlsx_response(rows, header=None, filename="export.xlsx"):
+    resp = StreamingHttpResponse(
+        iter_xlsx(rows, header=header),
+        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    )
+    resp["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return resp
@@ -135,6 +135,7 @@ class ValorConfiguracionViewSet(CompanyScopedQuerysetMixin, viewsets.ModelViewSe
             "ui.bg.mode":   ("text", "Modo de fondo de la app: 'solid' o 'gradient'"),
             "ui.bgSolid":   ("text", "Color sólido del fondo general (#hex)"),
             "ui.subtext": ("text", "Color para textos secundarios (p. ej. #64748b o rgba)"),
+            "ventas.folio": ("json", "Folios de venta: serie, formato, por_sucursal, bloque, sucursales"),
         }
         tipo, desc = defaults_map.get(nombre, ("text", nombre))
 
@@ -197,6 +198,7 @@ class ValorConfiguracionViewSet(CompanyScopedQuerysetMixin, viewsets.ModelViewSe
                 "ui.bg.mode":   ("text", "Modo de fondo de la app: 'solid' o 'gradient'"),
                 "ui.bgSolid":   ("text", "Color sólido del fondo general (#hex)"),
                 "ui.subtext": ("text", "Color para textos secundarios (p. ej. #64748b o rgba)"),
+                "ventas.folio": ("json", "Folios de venta: serie, formato, por_sucursal, bloque, sucursales"),
             }
             tipo, desc = defaults_map.get(nombre, ("text", nombre))
             cfg, _ = Configuracion.objects.get_or_create(
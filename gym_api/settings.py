@@ -45,6 +45,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     "corsheaders",
     "rest_framework",
     "core",
@@ -186,3 +187,27 @@ SIMPLE_JWT = {
 
 # gym_api/settings.py
 AUTH_USER_MODEL = "accounts.Usuario"
+
+# Cache LRU por proceso para búsquedas por código de barras en el POS
+INVENTARIO_CODIGO_BARRAS_CACHE_SIZE = env.int("INVENTARIO_CODIGO_BARRAS_CACHE_SIZE", default=5000)
+INVENTARIO_CODIGO_BARRAS_CACHE_TTL = env.int("INVENTARIO_CODIGO_BARRAS_CACHE_TTL", default=300)  # segundos
+
+# Idempotency-Key (POS / pagos): cuánto tiempo se conserva la respuesta para reintentos.
+IDEMPOTENCIA_TTL = env.int("IDEMPOTENCIA_TTL", default=24 * 60 * 60)  # segundos
+
+# Cache compartido por todos los workers (reportes de ventas, versiones de invalidación).
+# Por defecto la tabla `django_cache` en la BD (la crea `migrate`, ver
+# ventas/migrations/0013_tabla_cache.py); en producción conviene Redis:
+# DJANGO_CACHE_URL=redis://host:6379/1
+CACHES = {"default": env.cache("DJANGO_CACHE_URL", default="dbcache://django_cache")}
+
+# Reportes de ventas (ventas.reportes): vida máxima de un reporte cacheado.
+VENTAS_REPORTES_CACHE_TTL = env.int("VENTAS_REPORTES_CACHE_TTL", default=10 * 60)  # segundos
+
+# Timbrado CFDI asíncrono (ventas.timbrado / manage.py timbrar_ventas)
+TIMBRADO_PAC_CLIENT = env.str("TIMBRADO_PAC_CLIENT", default="ventas.pac.FakePACClient")
+TIMBRADO_LOTE = env.int("TIMBRADO_LOTE", default=50)                   # comprobantes por llamada al PAC
+TIMBRADO_MAX_INTENTOS = env.int("TIMBRADO_MAX_INTENTOS", default=8)
+TIMBRADO_BACKOFF_BASE = env.int("TIMBRADO_BACKOFF_BASE", default=30)   # segundos; se duplica por intento
+TIMBRADO_BACKOFF_MAX = env.int("TIMBRADO_BACKOFF_MAX", default=60 * 60)
+TIMBRADO_LEASE = env.int("TIMBRADO_LEASE", default=10 * 60)           # segundos antes de retomar un trabajo colgado
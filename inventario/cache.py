@@ -0,0 +1,69 @@
+# inventario/cache.py
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class LRUCache:
+    """
+    LRU acotado y thread-safe, local al proceso, con TTL por entrada.
+    El TTL acota cuánto puede durar un dato viejo en los procesos que no
+    recibieron la señal de invalidación (cada worker tiene su propia copia).
+    """
+
+    def __init__(self, maxsize=1000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expira, value = item
+            if expira < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_where(self, predicate):
+        with self._lock:
+            for key in [k for k, (_, v) in self._data.items() if predicate(k, v)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# (empresa_id, codigo_barras) -> dict serializado del Producto
+productos_por_codigo = LRUCache(
+    maxsize=getattr(settings, "INVENTARIO_CODIGO_BARRAS_CACHE_SIZE", 5000),
+    ttl=getattr(settings, "INVENTARIO_CODIGO_BARRAS_CACHE_TTL", 300),
+)
+
+
+def invalidar_producto(producto):
+    """Quita del cache la llave actual del producto y cualquier entrada con su id
+    (cubre el caso de que haya cambiado su código de barras)."""
+    productos_por_codigo.delete((producto.empresa_id, producto.codigo_barras))
+    productos_por_codigo.delete_where(lambda _k, v: v.get("id") == producto.pk)
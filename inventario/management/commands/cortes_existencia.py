@@ -0,0 +1,45 @@
+# inventario/management/commands/cortes_existencia.py
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from empresas.models import Empresa
+from inventario.services import generar_cortes, compactar_cortes
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera cortes de existencia (checkpoint por producto/almacén) y, opcionalmente, "
+        "compacta los cortes antiguos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--empresa", type=int, help="Solo procesa esta empresa.")
+        parser.add_argument("--fecha", help="Fecha de corte ISO8601 (por defecto: ahora).")
+        parser.add_argument(
+            "--conservar-dias", type=int,
+            help="Elimina los cortes con más de N días (siempre conserva el más reciente).",
+        )
+
+    def handle(self, *args, **options):
+        fecha = timezone.now()
+        if options.get("fecha"):
+            fecha = parse_datetime(options["fecha"])
+            if fecha is None:
+                raise CommandError("--fecha inválida, usa ISO8601.")
+            if timezone.is_naive(fecha):
+                fecha = timezone.make_aware(fecha)
+
+        empresas = Empresa.objects.all()
+        if options.get("empresa"):
+            empresas = empresas.filter(id=options["empresa"])
+
+        for empresa_id in empresas.values_list("id", flat=True):
+            creados = generar_cortes(empresa_id, fecha)
+            msg = f"Empresa {empresa_id}: {creados} cortes a {fecha.isoformat()}"
+            if options.get("conservar_dias") is not None:
+                borrados = compactar_cortes(empresa_id, fecha - timedelta(days=options["conservar_dias"]))
+                msg += f", {borrados} cortes antiguos eliminados"
+            self.stdout.write(msg)
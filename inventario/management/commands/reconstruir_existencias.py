@@ -0,0 +1,59 @@
+# inventario/management/commands/reconstruir_existencias.py
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from inventario.models import MovimientoProducto, ExistenciaProducto
+from inventario.services import nuevo_delta, acumular_movimiento, valuar
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstruye ExistenciaProducto (cantidad y valuación a costo promedio) "
+        "reproduciendo el historial de MovimientoProducto."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--empresa", type=int, help="Solo reconstruye los saldos de esta empresa.")
+
+    def handle(self, *args, **options):
+        empresa_id = options.get("empresa")
+
+        with transaction.atomic():
+            # Bloquea escrituras de saldos mientras se recalcula; los movimientos
+            # que se confirmen después aplicarán su delta sobre el saldo nuevo.
+            with connection.cursor() as cursor:
+                cursor.execute(f"LOCK TABLE {ExistenciaProducto._meta.db_table} IN EXCLUSIVE MODE")
+
+            existencias = ExistenciaProducto.objects.all()
+            movimientos = MovimientoProducto.objects.all()
+            if empresa_id:
+                existencias = existencias.filter(empresa_id=empresa_id)
+                movimientos = movimientos.filter(empresa_id=empresa_id)
+
+            borradas, _ = existencias.delete()
+
+            # El costo promedio depende del orden: se reproduce por par en orden cronológico.
+            saldos = {}
+            filas = (
+                movimientos
+                .order_by("producto_id", "almacen_id", "fecha", "id")
+                .values_list("empresa_id", "producto_id", "almacen_id",
+                             "tipo_movimiento", "cantidad", "costo_unitario")
+                .iterator(chunk_size=5000)
+            )
+            for emp_id, producto_id, almacen_id, tipo, cantidad, costo in filas:
+                key = (emp_id, producto_id, almacen_id)
+                ex = saldos.get(key)
+                if ex is None:
+                    ex = saldos[key] = ExistenciaProducto(
+                        empresa_id=emp_id, producto_id=producto_id, almacen_id=almacen_id,
+                    )
+                delta = nuevo_delta()
+                acumular_movimiento(delta, tipo, cantidad, costo)
+                ex.cantidad, ex.valor, ex.costo_promedio = valuar(ex.cantidad, ex.valor, ex.costo_promedio, delta)
+
+            creadas = ExistenciaProducto.objects.bulk_create(saldos.values(), batch_size=1000)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Existencias reconstruidas: {len(creadas)} (se eliminaron {borradas})."
+        ))
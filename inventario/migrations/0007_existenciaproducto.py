@@ -0,0 +1,54 @@
+# Generated by Django 5.2.4 on 2026-10-17 02:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Case, When, F, IntegerField, Sum
+
+
+def poblar_existencias(apps, schema_editor):
+    MovimientoProducto = apps.get_model('inventario', 'MovimientoProducto')
+    ExistenciaProducto = apps.get_model('inventario', 'ExistenciaProducto')
+    signo = Case(
+        When(tipo_movimiento='salida', then=-1 * F('cantidad')),
+        default=F('cantidad'),
+        output_field=IntegerField(),
+    )
+    saldos = (
+        MovimientoProducto.objects
+        .values('empresa_id', 'producto_id', 'almacen_id')
+        .annotate(cantidad=Sum(signo))
+        .order_by()
+    )
+    ExistenciaProducto.objects.bulk_create(
+        (ExistenciaProducto(**row) for row in saldos.iterator(chunk_size=2000)),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresas', '0002_configuracion_valorconfiguracion'),
+        ('inventario', '0006_producto_afectastock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExistenciaProducto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='actualizado')),
+                ('almacen', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='existencias', to='inventario.almacen')),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='existencias_productos', to='empresas.empresa')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='existencias', to='inventario.producto')),
+            ],
+            options={
+                'verbose_name': 'Existencia de producto',
+                'verbose_name_plural': 'Existencias de productos',
+                'indexes': [models.Index(fields=['empresa', 'almacen'], name='inventario__empresa_616dc3_idx')],
+                'unique_together': {('producto', 'almacen')},
+            },
+        ),
+        migrations.RunPython(poblar_existencias, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.4 on 2026-10-17 02:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresas', '0002_configuracion_valorconfiguracion'),
+        ('inventario', '0007_existenciaproducto'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CorteExistencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateTimeField()),
+                ('cantidad', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='creado')),
+            ],
+            options={
+                'verbose_name': 'Corte de existencia',
+                'verbose_name_plural': 'Cortes de existencia',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='movimientoproducto',
+            index=models.Index(fields=['producto', 'almacen', 'fecha'], name='inventario__product_a9baa8_idx'),
+        ),
+        migrations.AddField(
+            model_name='corteexistencia',
+            name='almacen',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cortes_existencia', to='inventario.almacen'),
+        ),
+        migrations.AddField(
+            model_name='corteexistencia',
+            name='empresa',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cortes_existencia', to='empresas.empresa'),
+        ),
+        migrations.AddField(
+            model_name='corteexistencia',
+            name='producto',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cortes_existencia', to='inventario.producto'),
+        ),
+        migrations.AddIndex(
+            model_name='corteexistencia',
+            index=models.Index(fields=['empresa', 'fecha'], name='inventario__empresa_50f8b6_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='corteexistencia',
+            unique_together={('producto', 'almacen', 'fecha')},
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.4 on 2026-10-17 02:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresas', '0002_configuracion_valorconfiguracion'),
+        ('inventario', '0008_corteexistencia'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NivelStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='creado')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='actualizado')),
+                ('is_active', models.BooleanField(default=True, verbose_name='activo')),
+                ('minimo', models.PositiveIntegerField(default=0)),
+                ('punto_reorden', models.PositiveIntegerField(default=0)),
+                ('estado', models.CharField(choices=[('ok', 'OK'), ('reorden', 'Reordenar'), ('bajo', 'Bajo mínimo')], default='ok', max_length=10)),
+                ('fecha_alerta', models.DateTimeField(blank=True, null=True)),
+                ('almacen', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='niveles_stock', to='inventario.almacen')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(class)s_created', to=settings.AUTH_USER_MODEL, verbose_name='creado por')),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='niveles_stock', to='empresas.empresa')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='niveles_stock', to='inventario.producto')),
+                ('updated_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(class)s_updated', to=settings.AUTH_USER_MODEL, verbose_name='actualizado por')),
+            ],
+            options={
+                'verbose_name': 'Nivel de stock',
+                'verbose_name_plural': 'Niveles de stock',
+                'indexes': [models.Index(fields=['empresa', 'estado'], name='inventario__empresa_5e0506_idx')],
+                'unique_together': {('producto', 'almacen')},
+            },
+        ),
+    ]
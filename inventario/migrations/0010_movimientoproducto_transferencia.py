@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0009_nivelstock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movimientoproducto',
+            name='transferencia',
+            field=models.UUIDField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0010_movimientoproducto_transferencia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='existenciaproducto',
+            name='costo_promedio',
+            field=models.DecimalField(decimal_places=4, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='existenciaproducto',
+            name='valor',
+            field=models.DecimalField(decimal_places=4, default=0, max_digits=16),
+        ),
+        migrations.AddField(
+            model_name='movimientoproducto',
+            name='costo_unitario',
+            field=models.DecimalField(blank=True, decimal_places=4, max_digits=12, null=True),
+        ),
+    ]
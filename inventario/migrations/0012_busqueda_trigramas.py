@@ -0,0 +1,44 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:04
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresas', '0002_configuracion_valorconfiguracion'),
+        ('inventario', '0011_valuacion_costo_promedio'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='categoriaproducto',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('nombre'), name='gin_trgm_ops'), name='categoria_nombre_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('nombre'), name='gin_trgm_ops'), name='producto_nombre_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('descripcion'), name='gin_trgm_ops'), name='producto_descripcion_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('codigo_barras'), name='gin_trgm_ops'), name='producto_codigo_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('nombre'), name='text_pattern_ops'), name='producto_nombre_prefijo'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['codigo_barras'], name='producto_codigo_prefijo', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
@@ -1,4 +1,6 @@
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db import models, transaction
+from django.db.models.functions import Upper
 from django.conf import settings
 from core.models import TimeStampedModel  # clase base con auditoría
 from django.core.exceptions import ValidationError
@@ -36,7 +38,10 @@ class CategoriaProducto(TimeStampedModel):
 
     class Meta:
         unique_together = ('empresa', 'nombre')
-        indexes = [models.Index(fields=['empresa', 'nombre'])]
+        indexes = [
+            models.Index(fields=['empresa', 'nombre']),
+            GinIndex(OpClass(Upper('nombre'), name='gin_trgm_ops'), name='categoria_nombre_trgm'),
+        ]
 
     def __str__(self):
         return self.nombre
@@ -67,6 +72,13 @@ class Producto(TimeStampedModel):
         indexes = [
             models.Index(fields=['empresa', 'nombre']),
             models.Index(fields=['empresa', 'codigo_barras']),
+            # Búsqueda (core.search.TrigramSearchFilter): trigramas sobre UPPER(campo).
+            GinIndex(OpClass(Upper('nombre'), name='gin_trgm_ops'), name='producto_nombre_trgm'),
+            GinIndex(OpClass(Upper('descripcion'), name='gin_trgm_ops'), name='producto_descripcion_trgm'),
+            GinIndex(OpClass(Upper('codigo_barras'), name='gin_trgm_ops'), name='producto_codigo_trgm'),
+            # Autocompletar por prefijo (LIKE 'ABC%') independiente del collation.
+            models.Index(OpClass(Upper('nombre'), name='text_pattern_ops'), name='producto_nombre_prefijo'),
+            models.Index(fields=['codigo_barras'], opclasses=['varchar_pattern_ops'], name='producto_codigo_prefijo'),
         ]
 
     def __str__(self):
@@ -84,10 +96,126 @@ class MovimientoProducto(TimeStampedModel):
     almacen = models.ForeignKey('inventario.Almacen', on_delete=models.PROTECT, related_name='movimientos')
     tipo_movimiento = models.CharField(max_length=20, choices=TipoMovimiento.choices)
     cantidad = models.IntegerField()
+    # Costo de adquisición por unidad (se captura en ENTRADAs; alimenta el costo promedio)
+    costo_unitario = models.DecimalField(max_digits=12, decimal_places=4, null=True, blank=True)
     fecha = models.DateTimeField()
+    # Comparte valor entre la SALIDA y la ENTRADA de un traspaso entre almacenes
+    transferencia = models.UUIDField(null=True, blank=True, db_index=True)
 
     class Meta:
         indexes = [
             models.Index(fields=['empresa', 'producto']),
             models.Index(fields=['fecha']),
+            models.Index(fields=['producto', 'almacen', 'fecha']),
         ]
+
+    # Cada alta/edición/baja ajusta ExistenciaProducto en la misma transacción.
+    # Las rutas masivas (bulk_create, QuerySet.update/delete) no pasan por aquí:
+    # deben llamar a inventario.services.aplicar_movimientos explícitamente.
+    def save(self, *args, **kwargs):
+        from .services import aplicar_movimientos
+        with transaction.atomic():
+            anterior = None
+            if self.pk:
+                anterior = MovimientoProducto.objects.filter(pk=self.pk).first()
+            super().save(*args, **kwargs)
+            if anterior:
+                aplicar_movimientos([anterior], revertir=True)
+            aplicar_movimientos([self])
+
+    def delete(self, *args, **kwargs):
+        from .services import aplicar_movimientos
+        with transaction.atomic():
+            aplicar_movimientos([self], revertir=True)
+            return super().delete(*args, **kwargs)
+
+
+class ExistenciaProducto(models.Model):
+    """
+    Saldo materializado por (producto, almacén), con su valuación a costo promedio.
+    Se mantiene junto con cada MovimientoProducto; el kardex sigue siendo la
+    fuente de verdad (`manage.py reconstruir_existencias` lo regenera).
+    """
+    empresa = models.ForeignKey('empresas.Empresa', on_delete=models.CASCADE, related_name='existencias_productos')
+    producto = models.ForeignKey('inventario.Producto', on_delete=models.CASCADE, related_name='existencias')
+    almacen = models.ForeignKey('inventario.Almacen', on_delete=models.CASCADE, related_name='existencias')
+    cantidad = models.IntegerField(default=0)
+    # Valuación a costo promedio ponderado, mantenida incrementalmente
+    costo_promedio = models.DecimalField(max_digits=14, decimal_places=4, default=0)
+    valor = models.DecimalField(max_digits=16, decimal_places=4, default=0)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="actualizado")
+
+    class Meta:
+        verbose_name = 'Existencia de producto'
+        verbose_name_plural = 'Existencias de productos'
+        unique_together = ('producto', 'almacen')
+        indexes = [
+            models.Index(fields=['empresa', 'almacen']),
+        ]
+
+    def __str__(self):
+        return f'{self.producto_id}@{self.almacen_id}: {self.cantidad}'
+
+
+class CorteExistencia(models.Model):
+    """
+    Checkpoint del saldo por (producto, almacén) a una fecha de corte.
+    Cada corte incluye todos los pares con movimientos de la empresa, de modo que
+    stock(fecha) = último corte <= fecha + movimientos posteriores al corte.
+    Se generan/compactan con `manage.py cortes_existencia`.
+    """
+    empresa = models.ForeignKey('empresas.Empresa', on_delete=models.CASCADE, related_name='cortes_existencia')
+    producto = models.ForeignKey('inventario.Producto', on_delete=models.CASCADE, related_name='cortes_existencia')
+    almacen = models.ForeignKey('inventario.Almacen', on_delete=models.CASCADE, related_name='cortes_existencia')
+    fecha = models.DateTimeField()
+    cantidad = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="creado")
+
+    class Meta:
+        verbose_name = 'Corte de existencia'
+        verbose_name_plural = 'Cortes de existencia'
+        unique_together = ('producto', 'almacen', 'fecha')
+        indexes = [
+            models.Index(fields=['empresa', 'fecha']),
+        ]
+
+    def __str__(self):
+        return f'{self.producto_id}@{self.almacen_id} {self.fecha:%Y-%m-%d}: {self.cantidad}'
+
+
+class NivelStock(TimeStampedModel):
+    """
+    Mínimo y punto de reorden por (producto, almacén).
+    `estado` es una bandera precalculada: se reevalúa de forma incremental cada
+    vez que cambia el saldo del par (ver inventario.services.evaluar_niveles).
+    """
+    class Estado(models.TextChoices):
+        OK      = 'ok', 'OK'
+        REORDEN = 'reorden', 'Reordenar'   # cantidad <= punto_reorden
+        BAJO    = 'bajo', 'Bajo mínimo'    # cantidad <= minimo
+
+    empresa = models.ForeignKey('empresas.Empresa', on_delete=models.CASCADE, related_name='niveles_stock')
+    producto = models.ForeignKey('inventario.Producto', on_delete=models.CASCADE, related_name='niveles_stock')
+    almacen = models.ForeignKey('inventario.Almacen', on_delete=models.CASCADE, related_name='niveles_stock')
+    minimo = models.PositiveIntegerField(default=0)
+    punto_reorden = models.PositiveIntegerField(default=0)
+    estado = models.CharField(max_length=10, choices=Estado.choices, default=Estado.OK)
+    fecha_alerta = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Nivel de stock'
+        verbose_name_plural = 'Niveles de stock'
+        unique_together = ('producto', 'almacen')
+        indexes = [
+            models.Index(fields=['empresa', 'estado']),
+        ]
+
+    def calcular_estado(self, cantidad):
+        if cantidad <= self.minimo:
+            return self.Estado.BAJO
+        if cantidad <= self.punto_reorden:
+            return self.Estado.REORDEN
+        return self.Estado.OK
+
+    def __str__(self):
+        return f'{self.producto_id}@{self.almacen_id} min:{self.minimo} reorden:{self.punto_reorden}'
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Almacen, CategoriaProducto, Producto, MovimientoProducto
+from .models import Almacen, CategoriaProducto, Producto, MovimientoProducto, NivelStock
 
 class AlmacenSerializer(serializers.ModelSerializer):
     class Meta:
@@ -36,3 +36,26 @@ class MovimientoProductoSerializer(serializers.ModelSerializer):
         model = MovimientoProducto
         fields = "__all__"
         read_only_fields = ("created_at", "updated_at", "created_by", "updated_by", "is_active")
+
+class NivelStockSerializer(serializers.ModelSerializer):
+    producto_nombre = serializers.CharField(source="producto.nombre", read_only=True)
+    almacen_nombre  = serializers.CharField(source="almacen.nombre", read_only=True)
+
+    class Meta:
+        model = NivelStock
+        fields = "__all__"
+        read_only_fields = ("created_at", "updated_at", "created_by", "updated_by", "is_active", "estado", "fecha_alerta")
+
+    def validate(self, attrs):
+        empresa = attrs.get('empresa') or getattr(self.instance, 'empresa', None)
+        producto = attrs.get('producto') or getattr(self.instance, 'producto', None)
+        almacen = attrs.get('almacen') or getattr(self.instance, 'almacen', None)
+        if empresa and producto and producto.empresa_id != empresa.id:
+            raise serializers.ValidationError("El producto no pertenece a la empresa indicada.")
+        if empresa and almacen and almacen.empresa_id != empresa.id:
+            raise serializers.ValidationError("El almacén no pertenece a la empresa indicada.")
+        minimo = attrs.get('minimo', getattr(self.instance, 'minimo', 0))
+        reorden = attrs.get('punto_reorden', getattr(self.instance, 'punto_reorden', 0))
+        if reorden < minimo:
+            raise serializers.ValidationError("El punto de reorden no puede ser menor al mínimo.")
+        return attrs
@@ -0,0 +1,558 @@
+# inventario/services.py
+import uuid
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Case, When, F, Q, IntegerField, Sum, Max, Window, RowRange
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Almacen, Producto, MovimientoProducto, ExistenciaProducto, CorteExistencia, NivelStock
+
+
+CUATRO_DECIMALES = Decimal("0.0001")
+
+
+class InventarioError(Exception):
+    """Error de validación de una operación de inventario (se responde como 400)."""
+    def __init__(self, detail, **extra):
+        super().__init__(detail)
+        self.detail = detail
+        self.extra = extra
+
+
+def cantidad_con_signo():
+    """
+    Expresión SQL con la cantidad firmada del movimiento:
+    ENTRADA y AJUSTE suman, SALIDA resta.
+    """
+    return Case(
+        When(tipo_movimiento=MovimientoProducto.TipoMovimiento.ENTRADA, then=F('cantidad')),
+        When(tipo_movimiento=MovimientoProducto.TipoMovimiento.SALIDA,  then=-1 * F('cantidad')),
+        When(tipo_movimiento=MovimientoProducto.TipoMovimiento.AJUSTE,  then=F('cantidad')),
+        default=0,
+        output_field=IntegerField(),
+    )
+
+
+def delta_movimiento(tipo_movimiento, cantidad):
+    """Equivalente en Python de `cantidad_con_signo` para un movimiento."""
+    if tipo_movimiento == MovimientoProducto.TipoMovimiento.SALIDA:
+        return -int(cantidad)
+    return int(cantidad)
+
+
+def bloquear_existencias(pares):
+    """
+    Asegura y bloquea (SELECT ... FOR UPDATE, en orden de id) las filas de
+    ExistenciaProducto para los pares {(empresa_id, producto_id, almacen_id)}.
+    Devuelve {(producto_id, almacen_id): ExistenciaProducto}.
+    Debe llamarse dentro de transaction.atomic.
+    """
+    pares = set(pares)
+    if not pares:
+        return {}
+    ExistenciaProducto.objects.bulk_create(
+        [ExistenciaProducto(empresa_id=e, producto_id=p, almacen_id=a, cantidad=0) for (e, p, a) in pares],
+        ignore_conflicts=True,
+    )
+    # Solo los pares pedidos (no el producto cartesiano productos x almacenes):
+    # no se bloquean saldos ajenos que otra caja podría estar usando.
+    exactos = Q()
+    for p, a in sorted({(p, a) for (_, p, a) in pares}):
+        exactos |= Q(producto_id=p, almacen_id=a)
+    qs = ExistenciaProducto.objects.select_for_update().filter(exactos).order_by('id')
+    return {(ex.producto_id, ex.almacen_id): ex for ex in qs}
+
+
+def nuevo_delta():
+    """
+    Acumulador por (producto, almacén):
+      - cantidad: cambio neto de unidades.
+      - cantidad_costeada / valor_costeado: unidades que traen costo_unitario
+        propio (entradas) y su valor; el resto se valúa al costo promedio vigente.
+    """
+    return {"cantidad": 0, "cantidad_costeada": 0, "valor_costeado": Decimal("0")}
+
+
+def valuar(cantidad, valor, costo_promedio, delta):
+    """
+    Costo promedio ponderado incremental. Recibe el saldo anterior y un
+    acumulador de `nuevo_delta`; devuelve (cantidad, valor, costo_promedio).
+    - Sin existencias previas (<= 0) el remanente se valúa al costo del lote.
+    - Con saldo <= 0 el valor queda en 0 y se conserva el último promedio.
+    """
+    valor, costo_promedio = Decimal(valor), Decimal(costo_promedio)
+    anterior = cantidad
+    cantidad = anterior + delta["cantidad"]
+    if delta["cantidad_costeada"]:
+        costo_lote = delta["valor_costeado"] / delta["cantidad_costeada"]
+    else:
+        costo_lote = costo_promedio
+
+    if cantidad <= 0:
+        valor = Decimal("0")
+    elif anterior <= 0:
+        valor = cantidad * costo_lote
+    else:
+        a_promedio = delta["cantidad"] - delta["cantidad_costeada"]
+        valor = max(valor + delta["valor_costeado"] + a_promedio * costo_promedio, Decimal("0"))
+
+    if cantidad > 0:
+        costo_promedio = valor / cantidad
+    return cantidad, valor.quantize(CUATRO_DECIMALES), costo_promedio.quantize(CUATRO_DECIMALES)
+
+
+def aplicar_deltas(deltas, saldos=None):
+    """
+    Aplica `deltas` {(empresa_id, producto_id, almacen_id): nuevo_delta()} a los
+    saldos y su valuación. Las filas quedan bloqueadas, así que el saldo nuevo
+    se calcula en Python y se escribe con un único UPDATE (bulk_update).
+    `saldos`: resultado de un `bloquear_existencias` previo en la misma
+    transacción que ya cubre todos los pares (evita volver a bloquear).
+    Debe llamarse dentro de transaction.atomic.
+    """
+    deltas = {k: v for k, v in deltas.items() if v["cantidad"] or v["valor_costeado"]}
+    if not deltas:
+        return
+    filas = saldos if saldos is not None else bloquear_existencias(deltas.keys())
+    ahora = timezone.now()
+    cambiadas = []
+    for (_, p, a), delta in deltas.items():
+        ex = filas[(p, a)]
+        ex.cantidad, ex.valor, ex.costo_promedio = valuar(ex.cantidad, ex.valor, ex.costo_promedio, delta)
+        ex.updated_at = ahora
+        cambiadas.append(ex)
+    ExistenciaProducto.objects.bulk_update(cambiadas, ['cantidad', 'valor', 'costo_promedio', 'updated_at'])
+    evaluar_niveles({(ex.producto_id, ex.almacen_id): ex.cantidad for ex in cambiadas})
+
+
+def acumular_movimiento(delta, tipo_movimiento, cantidad, costo_unitario=None, signo=1):
+    """Suma un movimiento al acumulador `delta` (signo=-1 para revertirlo)."""
+    unidades = signo * delta_movimiento(tipo_movimiento, cantidad)
+    delta["cantidad"] += unidades
+    if costo_unitario is not None and tipo_movimiento != MovimientoProducto.TipoMovimiento.SALIDA:
+        delta["cantidad_costeada"] += unidades
+        delta["valor_costeado"] += unidades * Decimal(costo_unitario)
+
+
+def evaluar_niveles(saldos):
+    """
+    Reevalúa las banderas de NivelStock solo para los pares cuyo saldo acaba de
+    cambiar. `saldos`: {(producto_id, almacen_id): cantidad_nueva}.
+    Escribe únicamente los niveles que cambian de estado.
+    """
+    if not saldos:
+        return
+    niveles = NivelStock.objects.filter(
+        producto_id__in={p for (p, _) in saldos},
+        almacen_id__in={a for (_, a) in saldos},
+    )
+    ahora = timezone.now()
+    cambiados = []
+    for nivel in niveles:
+        cantidad = saldos.get((nivel.producto_id, nivel.almacen_id))
+        if cantidad is None:
+            continue
+        estado = nivel.calcular_estado(cantidad)
+        if estado != nivel.estado:
+            nivel.estado = estado
+            nivel.fecha_alerta = None if estado == NivelStock.Estado.OK else ahora
+            nivel.updated_at = ahora
+            cambiados.append(nivel)
+    if cambiados:
+        NivelStock.objects.bulk_update(cambiados, ['estado', 'fecha_alerta', 'updated_at'])
+
+
+def aplicar_movimientos(movimientos, revertir=False, saldos=None):
+    """
+    Refleja en ExistenciaProducto una lista de MovimientoProducto ya guardados
+    (o a punto de borrarse, con revertir=True). Agrupa por (producto, almacén),
+    así que un lote de N movimientos cuesta las mismas consultas que uno solo.
+    `saldos`: filas ya bloqueadas por el llamador (ver `aplicar_deltas`).
+    """
+    deltas = defaultdict(nuevo_delta)
+    for mov in movimientos:
+        acumular_movimiento(
+            deltas[(mov.empresa_id, mov.producto_id, mov.almacen_id)],
+            mov.tipo_movimiento, mov.cantidad, mov.costo_unitario,
+            signo=-1 if revertir else 1,
+        )
+    with transaction.atomic():
+        aplicar_deltas(deltas, saldos=saldos)
+
+
+def stock_disponible(empresa_id, producto_id, almacen_id):
+    """Lectura O(1) del saldo de un producto en un almacén."""
+    return (
+        ExistenciaProducto.objects
+        .filter(empresa_id=empresa_id, producto_id=producto_id, almacen_id=almacen_id)
+        .values_list('cantidad', flat=True)
+        .first()
+    ) or 0
+
+
+# -----------------------------
+# Traspasos entre almacenes
+# -----------------------------
+def transferir(empresa_id, origen_id, destino_id, items, usuario=None, fecha=None):
+    """
+    Mueve muchos productos de `origen_id` a `destino_id` en una transacción.
+    `items`: [{"producto": id, "cantidad": n}, ...] (líneas repetidas se suman).
+    - Valida almacenes y productos con una consulta por modelo.
+    - Bloquea los saldos de origen/destino en una sola consulta y valida el stock
+      de origen de todas las líneas con ella.
+    - Inserta los pares SALIDA/ENTRADA en un solo bulk_create con el mismo
+      `transferencia`.
+    Lanza InventarioError si algo no cuadra. Devuelve (uuid, movimientos).
+    """
+    if str(origen_id) == str(destino_id):
+        raise InventarioError("El almacén de origen y destino deben ser distintos.")
+
+    cantidades = defaultdict(int)
+    for it in items or []:
+        try:
+            producto_id = int(it.get("producto"))
+            cantidad = int(it.get("cantidad"))
+        except (TypeError, ValueError, AttributeError):
+            raise InventarioError("producto/cantidad inválidos.")
+        if cantidad <= 0:
+            raise InventarioError("cantidad debe ser > 0.")
+        cantidades[producto_id] += cantidad
+    if not cantidades:
+        raise InventarioError("items es obligatorio.")
+
+    almacenes = set(
+        Almacen.objects.filter(empresa_id=empresa_id, id__in=[origen_id, destino_id]).values_list("id", flat=True)
+    )
+    if len(almacenes) != 2:
+        raise InventarioError("Almacén de origen o destino inválido.")
+    validos = set(
+        Producto.objects.filter(empresa_id=empresa_id, id__in=list(cantidades)).values_list("id", flat=True)
+    )
+    invalidos = sorted(set(cantidades) - validos)
+    if invalidos:
+        raise InventarioError("Productos inválidos para la empresa.", productos=invalidos)
+
+    origen_id, destino_id = int(origen_id), int(destino_id)
+    fecha = fecha or timezone.now()
+    transferencia = uuid.uuid4()
+    with transaction.atomic():
+        saldos = bloquear_existencias(
+            {(empresa_id, p, origen_id) for p in cantidades} | {(empresa_id, p, destino_id) for p in cantidades}
+        )
+        faltantes = [
+            {"producto": p, "disponible": saldos[(p, origen_id)].cantidad, "requerido": q}
+            for p, q in cantidades.items()
+            if saldos[(p, origen_id)].cantidad < q
+        ]
+        if faltantes:
+            raise InventarioError("Stock insuficiente en el almacén de origen.", faltantes=faltantes)
+
+        movimientos = []
+        for producto_id, cantidad in cantidades.items():
+            # La ENTRADA en destino llega al costo promedio del origen.
+            costo_origen = saldos[(producto_id, origen_id)].costo_promedio
+            for tipo, almacen_id, costo in (
+                (MovimientoProducto.TipoMovimiento.SALIDA, origen_id, None),
+                (MovimientoProducto.TipoMovimiento.ENTRADA, destino_id, costo_origen),
+            ):
+                movimientos.append(MovimientoProducto(
+                    empresa_id=empresa_id,
+                    producto_id=producto_id,
+                    almacen_id=almacen_id,
+                    tipo_movimiento=tipo,
+                    cantidad=cantidad,
+                    costo_unitario=costo,
+                    fecha=fecha,
+                    transferencia=transferencia,
+                    created_by=usuario,
+                    updated_by=usuario,
+                ))
+        MovimientoProducto.objects.bulk_create(movimientos)
+        aplicar_movimientos(movimientos, saldos=saldos)
+    return transferencia, movimientos
+
+
+# -----------------------------
+# Cortes (checkpoint + delta)
+# -----------------------------
+def stock_por_corte(producto_id, empresa_id=None, almacen_id=None, fecha=None):
+    """
+    Stock por almacén calculado como último corte <= fecha más los movimientos
+    posteriores a ese corte. Devuelve {almacen_id: cantidad}.
+    Solo lee el tramo de kardex posterior al corte (índice producto/almacén/fecha).
+    """
+    fecha = fecha or timezone.now()
+    cortes = CorteExistencia.objects.filter(producto_id=producto_id, fecha__lte=fecha)
+    movs = MovimientoProducto.objects.filter(producto_id=producto_id, fecha__lte=fecha)
+    if empresa_id:
+        cortes = cortes.filter(empresa_id=empresa_id)
+        movs = movs.filter(empresa_id=empresa_id)
+    if almacen_id:
+        cortes = cortes.filter(almacen_id=almacen_id)
+        movs = movs.filter(almacen_id=almacen_id)
+
+    ultimos = (
+        cortes.order_by('almacen_id', '-fecha')
+              .distinct('almacen_id')
+              .values_list('almacen_id', 'fecha', 'cantidad')
+    )
+    saldos, desde = {}, Q()
+    for alm_id, corte_fecha, cantidad in ultimos:
+        saldos[alm_id] = cantidad
+        desde |= Q(almacen_id=alm_id, fecha__gt=corte_fecha)
+    if saldos:
+        # Almacenes sin corte: todo su historial; con corte: solo lo posterior.
+        desde |= ~Q(almacen_id__in=list(saldos))
+        movs = movs.filter(desde)
+
+    for row in movs.values('almacen_id').annotate(s=Sum(cantidad_con_signo())).order_by():
+        saldos[row['almacen_id']] = saldos.get(row['almacen_id'], 0) + (row['s'] or 0)
+    return saldos
+
+
+def generar_cortes(empresa_id, fecha=None):
+    """
+    Crea el corte de `empresa_id` a `fecha` partiendo del corte anterior y
+    sumando solo los movimientos entre ambos. Re-ejecutar con la misma fecha
+    reemplaza el corte. Devuelve el número de filas creadas.
+
+    Movimientos capturados con fecha anterior al último corte no se reflejan en
+    él; en ese caso hay que regenerar los cortes posteriores a esa fecha.
+    """
+    fecha = fecha or timezone.now()
+    anterior = (
+        CorteExistencia.objects
+        .filter(empresa_id=empresa_id, fecha__lt=fecha)
+        .aggregate(f=Max('fecha'))['f']
+    )
+
+    saldos = defaultdict(int)
+    movs = MovimientoProducto.objects.filter(empresa_id=empresa_id, fecha__lte=fecha)
+    if anterior:
+        for p, a, cantidad in (CorteExistencia.objects
+                               .filter(empresa_id=empresa_id, fecha=anterior)
+                               .values_list('producto_id', 'almacen_id', 'cantidad')):
+            saldos[(p, a)] = cantidad
+        movs = movs.filter(fecha__gt=anterior)
+
+    for row in (movs.values('producto_id', 'almacen_id')
+                    .annotate(s=Sum(cantidad_con_signo()))
+                    .order_by()):
+        saldos[(row['producto_id'], row['almacen_id'])] += row['s'] or 0
+
+    with transaction.atomic():
+        CorteExistencia.objects.filter(empresa_id=empresa_id, fecha=fecha).delete()
+        creados = CorteExistencia.objects.bulk_create(
+            [
+                CorteExistencia(empresa_id=empresa_id, producto_id=p, almacen_id=a, fecha=fecha, cantidad=c)
+                for (p, a), c in saldos.items()
+            ],
+            batch_size=1000,
+        )
+    return len(creados)
+
+
+def compactar_cortes(empresa_id, antes_de):
+    """
+    Elimina los cortes con fecha < `antes_de`, conservando siempre el corte más
+    reciente de la empresa para no perder el punto de partida.
+    """
+    ultimo = CorteExistencia.objects.filter(empresa_id=empresa_id).aggregate(f=Max('fecha'))['f']
+    if not ultimo:
+        return 0
+    borrados, _ = (
+        CorteExistencia.objects
+        .filter(empresa_id=empresa_id, fecha__lt=min(antes_de, ultimo))
+        .delete()
+    )
+    return borrados
+
+
+# -----------------------------
+# Kardex
+# -----------------------------
+def kardex_movimientos(movimientos, despues_de=None):
+    """
+    Anota sobre `movimientos` (ya filtrados a un producto/almacén):
+      - cantidad_firmada: cantidad con signo del movimiento.
+      - saldo_parcial: suma acumulada (ventana SQL ordenada por fecha, id).
+    `despues_de=(fecha, id)` aplica keyset: solo filas posteriores a esa posición;
+    el saldo_parcial se cuenta desde ahí, el llamador suma el saldo previo.
+    """
+    if despues_de:
+        fecha, mov_id = despues_de
+        movimientos = movimientos.filter(Q(fecha__gt=fecha) | Q(fecha=fecha, id__gt=mov_id))
+    return (
+        movimientos
+        .annotate(
+            cantidad_firmada=cantidad_con_signo(),
+            saldo_parcial=Window(
+                expression=Sum(cantidad_con_signo()),
+                order_by=[F('fecha').asc(), F('id').asc()],
+                frame=RowRange(start=None, end=0),
+            ),
+        )
+        .order_by('fecha', 'id')
+    )
+
+
+# -----------------------------
+# Importación masiva de movimientos
+# -----------------------------
+TAMANO_LOTE_IMPORTACION = 1000
+MAX_ERRORES_REPORTADOS = 1000
+
+
+def _parse_fila_movimiento(fila):
+    """
+    Normaliza una fila {producto|codigo_barras, almacen, cantidad, tipo_movimiento?, costo_unitario?, fecha?}.
+    Devuelve (datos, errores).
+    """
+    if not isinstance(fila, dict):
+        return {}, ["fila inválida."]
+    errores = []
+    datos = {}
+
+    producto = str(fila.get("producto") or "").strip()
+    codigo = str(fila.get("codigo_barras") or "").strip()
+    if producto:
+        try:
+            datos["producto_id"] = int(producto)
+        except ValueError:
+            errores.append("producto inválido.")
+    elif codigo:
+        datos["codigo_barras"] = codigo
+    else:
+        errores.append("producto o codigo_barras es obligatorio.")
+
+    try:
+        datos["almacen_id"] = int(str(fila.get("almacen") or "").strip())
+    except ValueError:
+        errores.append("almacen inválido.")
+
+    tipo = str(fila.get("tipo_movimiento") or MovimientoProducto.TipoMovimiento.ENTRADA).strip().lower()
+    if tipo not in MovimientoProducto.TipoMovimiento.values:
+        errores.append("tipo_movimiento inválido.")
+    datos["tipo_movimiento"] = tipo
+
+    # Sin `or ""`: un 0 numérico debe llegar a la regla de > 0, no verse como vacío.
+    cantidad = fila.get("cantidad")
+    cantidad = "" if cantidad is None else str(cantidad).strip()
+    if cantidad == "":
+        errores.append("cantidad es obligatoria.")
+    else:
+        try:
+            cantidad = int(cantidad)
+        except ValueError:
+            errores.append("cantidad inválida.")
+        else:
+            if tipo == MovimientoProducto.TipoMovimiento.AJUSTE:
+                if cantidad == 0:
+                    errores.append("cantidad de ajuste no puede ser 0.")
+            elif cantidad <= 0:
+                errores.append("cantidad debe ser > 0.")
+            datos["cantidad"] = cantidad
+
+    costo = str(fila.get("costo_unitario") or "").strip()
+    if costo:
+        try:
+            datos["costo_unitario"] = Decimal(costo)
+            if datos["costo_unitario"] < 0:
+                errores.append("costo_unitario no puede ser negativo.")
+        except InvalidOperation:
+            errores.append("costo_unitario inválido.")
+
+    fecha = str(fila.get("fecha") or "").strip()
+    if fecha:
+        fecha_dt = parse_datetime(fecha)
+        if fecha_dt is None:
+            errores.append("fecha inválida.")
+        elif timezone.is_naive(fecha_dt):
+            fecha_dt = timezone.make_aware(fecha_dt)
+        datos["fecha"] = fecha_dt
+    return datos, errores
+
+
+def _importar_lote(empresa_id, lote, usuario, reporte):
+    """Valida un lote contra la empresa con consultas por conjunto e inserta lo válido."""
+    parseadas = []
+    for num, fila in lote:
+        datos, errores = _parse_fila_movimiento(fila)
+        if errores:
+            _reportar_error(reporte, num, errores)
+        else:
+            parseadas.append((num, datos))
+
+    producto_ids = {d["producto_id"] for _, d in parseadas if "producto_id" in d}
+    codigos = {d["codigo_barras"] for _, d in parseadas if "codigo_barras" in d}
+    almacen_ids = {d["almacen_id"] for _, d in parseadas}
+
+    productos_validos = set(
+        Producto.objects.filter(empresa_id=empresa_id, id__in=producto_ids).values_list("id", flat=True)
+    ) if producto_ids else set()
+    por_codigo = dict(
+        Producto.objects.filter(empresa_id=empresa_id, codigo_barras__in=codigos).values_list("codigo_barras", "id")
+    ) if codigos else {}
+    almacenes_validos = set(
+        Almacen.objects.filter(empresa_id=empresa_id, id__in=almacen_ids).values_list("id", flat=True)
+    ) if almacen_ids else set()
+
+    ahora = timezone.now()
+    movimientos = []
+    for num, d in parseadas:
+        errores = []
+        producto_id = d.get("producto_id") or por_codigo.get(d.get("codigo_barras"))
+        if "producto_id" in d and producto_id not in productos_validos:
+            errores.append("El producto no pertenece a la empresa.")
+        elif producto_id is None:
+            errores.append("codigo_barras no encontrado en la empresa.")
+        if d["almacen_id"] not in almacenes_validos:
+            errores.append("El almacén no pertenece a la empresa.")
+        if errores:
+            _reportar_error(reporte, num, errores)
+            continue
+        movimientos.append(MovimientoProducto(
+            empresa_id=empresa_id,
+            producto_id=producto_id,
+            almacen_id=d["almacen_id"],
+            tipo_movimiento=d["tipo_movimiento"],
+            cantidad=d["cantidad"],
+            costo_unitario=d.get("costo_unitario"),
+            fecha=d.get("fecha") or ahora,
+            created_by=usuario,
+            updated_by=usuario,
+        ))
+
+    if movimientos:
+        with transaction.atomic():
+            MovimientoProducto.objects.bulk_create(movimientos, batch_size=TAMANO_LOTE_IMPORTACION)
+            aplicar_movimientos(movimientos)
+    reporte["creadas"] += len(movimientos)
+
+
+def _reportar_error(reporte, num, errores):
+    reporte["con_error"] += 1
+    if len(reporte["errores"]) < MAX_ERRORES_REPORTADOS:
+        reporte["errores"].append({"fila": num, "errores": errores})
+
+
+def importar_movimientos(empresa_id, filas, usuario=None, tamano_lote=TAMANO_LOTE_IMPORTACION):
+    """
+    Importa movimientos desde un iterable de dicts (p. ej. csv.DictReader).
+    Procesa por lotes: cada lote valida producto/almacén contra la empresa con
+    una consulta por conjunto y se inserta con bulk_create en su propia
+    transacción, de modo que una fila inválida no aborta el archivo.
+    """
+    reporte = {"procesadas": 0, "creadas": 0, "con_error": 0, "errores": []}
+    numeradas = enumerate(filas, start=1)
+    while True:
+        lote = list(islice(numeradas, tamano_lote))
+        if not lote:
+            break
+        reporte["procesadas"] += len(lote)
+        _importar_lote(empresa_id, lote, usuario, reporte)
+    return reporte
@@ -0,0 +1,17 @@
+# inventario/signals.py
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import productos_por_codigo, invalidar_producto
+from .models import Producto, CategoriaProducto
+
+
+@receiver([post_save, post_delete], sender=Producto)
+def invalidar_cache_producto(sender, instance, **kwargs):
+    invalidar_producto(instance)
+
+
+@receiver([post_save, post_delete], sender=CategoriaProducto)
+def invalidar_cache_categoria(sender, instance, **kwargs):
+    # El dict cacheado incluye categoria_nombre; un renombre es raro, se vacía todo.
+    productos_por_codigo.clear()
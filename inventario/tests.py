@@ -1,3 +1,393 @@
-from django.test import TestCase
+import json
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import Usuario
+from empleados.models import UsuarioEmpresa
+from empresas.models import Empresa, Sucursal
+
+from .models import (
+    Almacen, CategoriaProducto, CorteExistencia, ExistenciaProducto, MovimientoProducto, NivelStock, Producto,
+)
+from .services import (
+    bloquear_existencias, cantidad_con_signo, compactar_cortes, generar_cortes, importar_movimientos,
+    stock_por_corte, transferir,
+)
+
+
+class InventarioMixin:
+    """Empresa con dos almacenes y dos productos."""
+
+    def crear_catalogo(self):
+        self.empresa = Empresa.objects.create(nombre="Gym Centro")
+        self.sucursal = Sucursal.objects.create(empresa=self.empresa, nombre="Centro")
+        self.almacen = Almacen.objects.create(empresa=self.empresa, sucursal=self.sucursal, nombre="Mostrador")
+        self.bodega = Almacen.objects.create(empresa=self.empresa, sucursal=self.sucursal, nombre="Bodega")
+        self.categoria = CategoriaProducto.objects.create(empresa=self.empresa, nombre="Bebidas")
+        self.agua = Producto.objects.create(empresa=self.empresa, categoria=self.categoria, nombre="Agua", codigo_barras="750100", precio="10.00")
+        self.barra = Producto.objects.create(empresa=self.empresa, categoria=self.categoria, nombre="Barra", codigo_barras="750300", precio="25.00")
+
+    def crear_api(self):
+        usuario = Usuario.objects.create_superuser("almacenista", "almacen@example.com", "pw")
+        UsuarioEmpresa.objects.create(usuario=usuario, empresa=self.empresa, sucursal=self.sucursal, rol="owner")
+        self.api = APIClient()
+        self.api.force_authenticate(usuario)
+        self.api.credentials(HTTP_X_EMPRESA_ID=str(self.empresa.id))
+
+    def mover(self, producto, tipo, cantidad, almacen=None, **extra):
+        extra.setdefault("fecha", timezone.now())
+        return MovimientoProducto.objects.create(
+            empresa=self.empresa, producto=producto, almacen=almacen or self.almacen,
+            tipo_movimiento=tipo, cantidad=cantidad, **extra,
+        )
+
+
+class ExistenciaProductoTests(InventarioMixin, TestCase):
+    def setUp(self):
+        self.crear_catalogo()
+
+    def assertSaldosIgualAlKardex(self):
+        kardex = {
+            (r["producto_id"], r["almacen_id"]): r["total"]
+            for r in MovimientoProducto.objects.values("producto_id", "almacen_id").annotate(total=Sum(cantidad_con_signo()))
+        }
+        saldos = {(e.producto_id, e.almacen_id): e.cantidad for e in ExistenciaProducto.objects.all()}
+        self.assertLessEqual(set(kardex), set(saldos))
+        for clave, cantidad in saldos.items():
+            self.assertEqual(cantidad, kardex.get(clave, 0), clave)
+
+    def test_saldo_sigue_al_kardex(self):
+        entrada = self.mover(self.agua, "entrada", 10)
+        self.mover(self.agua, "salida", 3)
+        self.mover(self.agua, "ajuste", -1)
+        self.mover(self.barra, "entrada", 5, almacen=self.bodega)
+        self.assertSaldosIgualAlKardex()
+        self.assertEqual(ExistenciaProducto.objects.get(producto=self.agua, almacen=self.almacen).cantidad, 6)
+
+        entrada.cantidad = 20
+        entrada.save()
+        self.assertSaldosIgualAlKardex()
+        entrada.delete()
+        self.assertSaldosIgualAlKardex()
+
+        transferir(self.empresa.id, self.bodega.id, self.almacen.id, [{"producto": self.barra.id, "cantidad": 2}])
+        self.assertSaldosIgualAlKardex()
+        self.assertEqual(ExistenciaProducto.objects.get(producto=self.barra, almacen=self.almacen).cantidad, 2)
+
+
+class BloqueoExistenciasTests(InventarioMixin, TransactionTestCase):
+    def setUp(self):
+        self.crear_catalogo()
+        for producto in (self.agua, self.barra):
+            for almacen in (self.almacen, self.bodega):
+                self.mover(producto, "entrada", 1, almacen=almacen)
+
+    def bloqueada_desde_otra_conexion(self, producto, almacen):
+        resultado = {}
+
+        def probar():
+            try:
+                with transaction.atomic():
+                    list(ExistenciaProducto.objects.select_for_update(nowait=True).filter(producto=producto, almacen=almacen))
+                resultado["bloqueada"] = False
+            except DatabaseError:
+                resultado["bloqueada"] = True
+            finally:
+                connection.close()
+
+        hilo = threading.Thread(target=probar)
+        hilo.start()
+        hilo.join()
+        return resultado["bloqueada"]
+
+    def test_bloquea_solo_los_pares_pedidos(self):
+        with transaction.atomic():
+            saldos = bloquear_existencias({
+                (self.empresa.id, self.agua.id, self.almacen.id),
+                (self.empresa.id, self.barra.id, self.bodega.id),
+            })
+            self.assertEqual(set(saldos), {(self.agua.id, self.almacen.id), (self.barra.id, self.bodega.id)})
+            self.assertTrue(self.bloqueada_desde_otra_conexion(self.agua, self.almacen))
+            self.assertTrue(self.bloqueada_desde_otra_conexion(self.barra, self.bodega))
+            self.assertFalse(self.bloqueada_desde_otra_conexion(self.agua, self.bodega))
+            self.assertFalse(self.bloqueada_desde_otra_conexion(self.barra, self.almacen))
+
+
+class StockBulkTests(InventarioMixin, TestCase):
+    url = "/api/v1/inventario/productos/stock-bulk/"
+
+    def setUp(self):
+        self.crear_catalogo()
+        self.crear_api()
+        self.mover(self.agua, "entrada", 4)
+
+    def resultados(self, **params):
+        r = self.api.get(self.url, params)
+        self.assertEqual(r.status_code, 200)
+        return {f["producto"]: f["stock"] for f in json.loads(b"".join(r.streaming_content))["resultados"]}
+
+    def test_filtra_por_categoria_y_almacen(self):
+        self.assertEqual(self.resultados(categoria=self.categoria.id), {self.agua.id: 4, self.barra.id: 0})
+        self.assertEqual(self.resultados(productos=str(self.agua.id), almacen=self.bodega.id), {self.agua.id: 0})
+
+    def test_parametros_no_numericos(self):
+        for params in ({"categoria": "abc"}, {"almacen": "x"}, {"productos": "1,a"}):
+            self.assertEqual(self.api.get(self.url, params).status_code, 400, params)
+
+
+class ImportarMovimientosTests(InventarioMixin, TestCase):
+    def setUp(self):
+        self.crear_catalogo()
+
+    def errores(self, **fila):
+        base = {"producto": self.agua.id, "almacen": self.almacen.id}
+        reporte = importar_movimientos(self.empresa.id, [{**base, **fila}])
+        return reporte["errores"][0]["errores"] if reporte["errores"] else []
+
+    def test_validacion_de_cantidad(self):
+        self.assertEqual(self.errores(cantidad=0), ["cantidad debe ser > 0."])
+        self.assertEqual(self.errores(cantidad=-2), ["cantidad debe ser > 0."])
+        self.assertEqual(self.errores(cantidad="x"), ["cantidad inválida."])
+        self.assertEqual(self.errores(), ["cantidad es obligatoria."])
+        self.assertEqual(self.errores(cantidad=0, tipo_movimiento="ajuste"), ["cantidad de ajuste no puede ser 0."])
+        self.assertEqual(self.errores(cantidad=3), [])
+        self.assertEqual(ExistenciaProducto.objects.get(producto=self.agua, almacen=self.almacen).cantidad, 3)
+
+
+class KardexTests(InventarioMixin, TestCase):
+    def setUp(self):
+        self.crear_catalogo()
+        self.crear_api()
+        self.url = "/api/v1/inventario/movimientos-producto/kardex/"
+
+    def test_saldo_continuo_entre_paginas(self):
+        for tipo, cantidad in (("entrada", 10), ("salida", 3), ("ajuste", -2), ("salida", 1), ("entrada", 4)):
+            self.mover(self.agua, tipo, cantidad)
+        self.mover(self.agua, "entrada", 50, almacen=self.bodega)
+
+        saldos, url = [], f"{self.url}?producto={self.agua.id}&almacen={self.almacen.id}&limit=2"
+        while url:
+            r = self.api.get(url)
+            self.assertEqual(r.status_code, 200, r.content)
+            saldos += [m["saldo"] for m in r.json()["resultados"]]
+            url = r.json()["next"]
+        self.assertEqual(saldos, [10, 7, 5, 4, 8])
+
+    def test_cursor_invalido_o_de_otro_producto(self):
+        self.mover(self.agua, "entrada", 1)
+        self.mover(self.agua, "entrada", 1)
+        params = {"producto": self.agua.id, "almacen": self.almacen.id, "limit": 1}
+        siguiente = self.api.get(self.url, params).json()["next"]
+        cursor = parse_qs(urlsplit(siguiente).query)["cursor"][0]
+        self.assertEqual(self.api.get(self.url, {**params, "cursor": cursor}).status_code, 200)
+        self.assertEqual(self.api.get(self.url, {**params, "cursor": "alterado"}).status_code, 400)
+        self.assertEqual(self.api.get(self.url, {**params, "producto": self.barra.id, "cursor": cursor}).status_code, 400)
+
+
+class ValuacionTests(InventarioMixin, TestCase):
+    url = "/api/v1/inventario/productos/valuacion/"
+
+    def setUp(self):
+        self.crear_catalogo()
+        self.crear_api()
+
+    def valuacion(self, **params):
+        r = self.api.get(self.url, params)
+        self.assertEqual(r.status_code, 200)
+        return json.loads(b"".join(r.streaming_content))
+
+    def test_costo_promedio_ponderado(self):
+        self.mover(self.agua, "entrada", 10, costo_unitario=Decimal("10.00"))
+        self.mover(self.agua, "entrada", 10, costo_unitario=Decimal("13.00"))
+        self.mover(self.agua, "salida", 5)
+        self.mover(self.barra, "entrada", 4, almacen=self.bodega, costo_unitario=Decimal("2.50"))
+
+        saldo = ExistenciaProducto.objects.get(producto=self.agua, almacen=self.almacen)
+        self.assertEqual((saldo.cantidad, saldo.costo_promedio, saldo.valor), (15, Decimal("11.5000"), Decimal("172.5000")))
+
+        reporte = self.valuacion()
+        self.assertEqual(reporte["valor_total"], "182.50")
+        self.assertEqual(
+            [(f["producto"], f["cantidad"], f["costo_promedio"], f["valor"]) for f in reporte["resultados"]],
+            [(self.agua.id, 15, "11.5000", "172.50"), (self.barra.id, 4, "2.5000", "10.00")],
+        )
+        self.assertEqual(self.valuacion(almacen=self.bodega.id)["valor_total"], "10.00")
+        self.assertEqual(self.valuacion(categoria=self.categoria.id)["valor_total"], "182.50")
+
+    def test_parametros_no_numericos(self):
+        for params in ({"categoria": "abc"}, {"almacen": "abc"}):
+            self.assertEqual(self.api.get(self.url, params).status_code, 400, params)
+
+
+class PorCodigoTests(InventarioMixin, TestCase):
+    url = "/api/v1/inventario/productos/por-codigo/"
+
+    def setUp(self):
+        from .cache import productos_por_codigo
+
+        self.crear_catalogo()
+        self.crear_api()
+        self.cache = productos_por_codigo
+        self.cache.clear()
+        self.addCleanup(self.cache.clear)
+
+    def buscar(self, codigo, **params):
+        return self.api.get(self.url, {"codigo": codigo, **params})
+
+    def test_guardar_y_borrar_invalidan_el_cache(self):
+        self.assertEqual(self.buscar("750100").json()["precio"], "10.00")
+        self.assertIsNotNone(self.cache.get((self.empresa.id, "750100")))
+
+        self.agua.precio = "12.00"
+        self.agua.save()
+        self.assertIsNone(self.cache.get((self.empresa.id, "750100")))
+        self.assertEqual(self.buscar("750100").json()["precio"], "12.00")
+
+        # Cambio de código: la llave vieja deja de responder.
+        self.agua.codigo_barras = "750101"
+        self.agua.save()
+        self.assertEqual(self.buscar("750100").status_code, 404)
+        self.assertEqual(self.buscar("750101").json()["id"], self.agua.id)
+
+        self.agua.delete()
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.buscar("750101").status_code, 404)
+
+    def test_llaves_por_empresa(self):
+        otra = Empresa.objects.create(nombre="Otra")
+        categoria = CategoriaProducto.objects.create(empresa=otra, nombre="Varios")
+        ajeno = Producto.objects.create(empresa=otra, categoria=categoria, nombre="Agua Otra", codigo_barras="750100", precio="8.00")
+
+        self.assertEqual(self.buscar("750100").json()["id"], self.agua.id)
+        self.api.credentials(HTTP_X_EMPRESA_ID=str(otra.id))
+        self.assertEqual(self.buscar("750100").json()["id"], ajeno.id)
+        self.assertIsNotNone(self.cache.get((self.empresa.id, "750100")))
+        self.assertIsNotNone(self.cache.get((otra.id, "750100")))
+
+        # Guardar el producto de una empresa no invalida la entrada de la otra.
+        ajeno.save()
+        self.assertIsNone(self.cache.get((otra.id, "750100")))
+        self.assertEqual(self.cache.get((self.empresa.id, "750100"))["id"], self.agua.id)
+
+    def test_stock_por_almacen(self):
+        self.mover(self.agua, "entrada", 7)
+        self.assertEqual(self.buscar("750100", almacen=self.almacen.id).json()["stock"], 7)
+        self.assertEqual(self.buscar("750100", almacen="abc").status_code, 400)
+
+
+class CorteExistenciaTests(InventarioMixin, TestCase):
+    def setUp(self):
+        self.crear_catalogo()
+        self.crear_api()
+        self.url = f"/api/v1/inventario/productos/{self.agua.id}/stock/"
+
+    def hace(self, dias):
+        return timezone.now() - timedelta(days=dias)
+
+    def test_cortes_compactados_mas_movimientos_igual_al_saldo(self):
+        self.mover(self.agua, "entrada", 20, fecha=self.hace(20))
+        self.mover(self.agua, "entrada", 5, almacen=self.bodega, fecha=self.hace(18))
+        generar_cortes(self.empresa.id, fecha=self.hace(15))
+        self.mover(self.agua, "salida", 4, fecha=self.hace(12))
+        self.mover(self.agua, "ajuste", -1, almacen=self.bodega, fecha=self.hace(11))
+        generar_cortes(self.empresa.id, fecha=self.hace(10))
+        self.mover(self.agua, "salida", 3, fecha=self.hace(8))
+        generar_cortes(self.empresa.id, fecha=self.hace(5))
+        self.assertEqual(compactar_cortes(self.empresa.id, self.hace(1)), 4)
+        self.assertEqual(CorteExistencia.objects.filter(empresa=self.empresa).count(), 2)
+        # Movimientos posteriores al último corte.
+        self.mover(self.agua, "entrada", 6)
+        self.mover(self.agua, "salida", 2, almacen=self.bodega)
+
+        saldos = dict(ExistenciaProducto.objects.filter(producto=self.agua).values_list("almacen_id", "cantidad"))
+        self.assertEqual(saldos, {self.almacen.id: 19, self.bodega.id: 2})
+        self.assertEqual(stock_por_corte(self.agua.id, empresa_id=self.empresa.id), saldos)
+
+        r = self.api.get(self.url, {"modo": "corte"})
+        self.assertEqual(r.json()["total"], 21)
+        r = self.api.get(self.url, {"modo": "corte", "almacen": self.almacen.id, "fecha": self.hace(7).isoformat()})
+        self.assertEqual(r.json()["stock"], 13)
+
+    def test_parametros_invalidos(self):
+        for params in (
+            {"modo": "corte", "almacen": "abc"},
+            {"modo": "corte", "fecha": "ayer"},
+            {"modo": "corte", "fecha": "2026-02-30T10:00:00"},
+            {"almacen": "abc"},
+        ):
+            self.assertEqual(self.api.get(self.url, params).status_code, 400, params)
+
+
+class BusquedaProductosTests(InventarioMixin, TestCase):
+    def setUp(self):
+        self.crear_catalogo()
+        self.crear_api()
+        for nombre, codigo in (("Creatina", "750400"), ("Creatna Pro", "750401"), ("Crema de cacahuate", "750402")):
+            Producto.objects.create(empresa=self.empresa, categoria=self.categoria, nombre=nombre, codigo_barras=codigo, precio="1.00")
+
+    def nombres(self, url, params):
+        r = self.api.get(url, params)
+        self.assertEqual(r.status_code, 200, r.content)
+        datos = r.json()
+        return [p["nombre"] for p in (datos["results"] if isinstance(datos, dict) else datos)]
+
+    def test_busqueda_tolera_errores_y_ordena_por_relevancia(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            if cursor.fetchone() is None:
+                self.skipTest("pg_trgm no está instalada en esta base de datos.")
+        # "creatna": coincidencia exacta primero, luego la difusa; "Crema" no se parece lo suficiente.
+        self.assertEqual(self.nombres("/api/v1/inventario/productos/", {"search": "creatna"}), ["Creatna Pro", "Creatina"])
+        self.assertEqual(self.nombres("/api/v1/inventario/productos/", {"search": "750401"}), ["Creatna Pro"])
+
+    def test_autocompletar_por_prefijo(self):
+        url = "/api/v1/inventario/productos/autocompletar/"
+        self.assertEqual(self.nombres(url, {"q": "cre"}), ["Creatina", "Creatna Pro", "Crema de cacahuate"])
+        self.assertEqual(self.nombres(url, {"q": "cre", "limit": 2}), ["Creatina", "Creatna Pro"])
+        self.assertEqual(self.nombres(url, {"q": "75040"}), ["Creatina", "Creatna Pro", "Crema de cacahuate"])
+        self.assertEqual(self.nombres(url, {"q": "pro"}), [])  # solo prefijo, no subcadena
+        self.assertEqual(self.api.get(url, {"q": "cre", "limit": "abc"}).status_code, 400)
+
+
+class NivelStockTests(InventarioMixin, TestCase):
+    url = "/api/v1/inventario/niveles-stock/bajo-stock/"
+
+    def setUp(self):
+        self.crear_catalogo()
+        self.crear_api()
+        self.mover(self.agua, "entrada", 10)
+        self.nivel = NivelStock.objects.create(
+            empresa=self.empresa, producto=self.agua, almacen=self.almacen, minimo=3, punto_reorden=8,
+        )
+        NivelStock.objects.create(empresa=self.empresa, producto=self.barra, almacen=self.almacen, minimo=0, punto_reorden=0)
+
+    def alertas(self, **params):
+        r = self.api.get(self.url, params)
+        self.assertEqual(r.status_code, 200)
+        return [(n["producto"], n["estado"], n["stock"]) for n in r.json()]
+
+    def test_movimientos_actualizan_la_bandera(self):
+        self.mover(self.agua, "salida", 3)
+        self.nivel.refresh_from_db()
+        self.assertEqual(self.nivel.estado, NivelStock.Estado.REORDEN)
+        self.assertIsNotNone(self.nivel.fecha_alerta)
+        self.assertEqual(self.alertas(), [(self.agua.id, "reorden", 7)])
+
+        self.mover(self.agua, "salida", 5)
+        self.nivel.refresh_from_db()
+        self.assertEqual(self.nivel.estado, NivelStock.Estado.BAJO)
+        self.assertEqual(self.alertas(estado="bajo"), [(self.agua.id, "bajo", 2)])
+        self.assertEqual(self.alertas(estado="reorden"), [])
+
+        self.mover(self.agua, "entrada", 20)
+        self.nivel.refresh_from_db()
+        self.assertEqual((self.nivel.estado, self.nivel.fecha_alerta), (NivelStock.Estado.OK, None))
+        self.assertEqual(self.alertas(), [])
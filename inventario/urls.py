@@ -1,9 +1,12 @@
 from rest_framework.routers import DefaultRouter
-from .views import AlmacenViewSet, CategoriaProductoViewSet, ProductoViewSet, MovimientoProductoViewSet
+from .views import (
+    AlmacenViewSet, CategoriaProductoViewSet, ProductoViewSet, MovimientoProductoViewSet, NivelStockViewSet,
+)
 
 router = DefaultRouter()
 router.register(r"almacenes", AlmacenViewSet, basename="almacen")
 router.register(r"categorias-producto", CategoriaProductoViewSet, basename="categoria-producto")
 router.register(r"productos", ProductoViewSet, basename="producto")
 router.register(r"movimientos-producto", MovimientoProductoViewSet, basename="movimiento-producto")
+router.register(r"niveles-stock", NivelStockViewSet, basename="nivel-stock")
 urlpatterns = router.urls
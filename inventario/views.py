@@ -1,18 +1,46 @@
 # inventario/views.py
+import csv
+import io
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
 from rest_framework import viewsets, filters, permissions, decorators, response, status
-from django.db.models import Sum, Case, When, IntegerField, F
+from rest_framework.utils.urls import replace_query_param
+from django.db.models import Sum, Q, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Upper
 from django_filters.rest_framework import DjangoFilterBackend, FilterSet, DateTimeFromToRangeFilter, NumberFilter
+from django.core import signing
 from django.db import transaction
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime
 
 from core.mixins import CompanyScopedQuerysetMixin
 from core.permissions import IsAuthenticatedInCompany
-from .models import Almacen, CategoriaProducto, Producto, MovimientoProducto
+from core.search import TrigramSearchFilter
+from core.streaming import streaming_json_response, streaming_csv_response
+from .models import Almacen, CategoriaProducto, Producto, MovimientoProducto, ExistenciaProducto, NivelStock
+from .cache import productos_por_codigo
+from .services import (
+    InventarioError, stock_por_corte, stock_disponible, importar_movimientos, kardex_movimientos, transferir,
+)
 from .serializers import (
-    AlmacenSerializer, CategoriaProductoSerializer, ProductoSerializer, MovimientoProductoSerializer
+    AlmacenSerializer, CategoriaProductoSerializer, ProductoSerializer, MovimientoProductoSerializer,
+    NivelStockSerializer,
 )
 
+def _parse_costo(valor):
+    """costo_unitario opcional: None si no viene; ValueError si es inválido o negativo."""
+    if valor in (None, ""):
+        return None
+    try:
+        costo = Decimal(str(valor))
+    except InvalidOperation:
+        raise ValueError("costo_unitario inválido.")
+    if costo < 0:
+        raise ValueError("costo_unitario no puede ser negativo.")
+    return costo
+
+
 # Si ya tienes BaseAuthViewSet en otro módulo, usa ese.
 class BaseAuthViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
@@ -59,7 +87,8 @@ class ProductoViewSet(CompanyScopedQuerysetMixin, BaseAuthViewSet):
     permission_classes = [IsAuthenticatedInCompany]
     queryset = Producto.objects.select_related("empresa", "categoria").all()
     serializer_class = ProductoSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    # TrigramSearchFilter va después de OrderingFilter para conservar el orden por relevancia.
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, TrigramSearchFilter]
     search_fields = ["nombre", "descripcion", "codigo_barras", "categoria__nombre"]
     ordering_fields = ["id", "nombre", "created_at"]
     ordering = ["-id"]
@@ -73,6 +102,7 @@ class ProductoViewSet(CompanyScopedQuerysetMixin, BaseAuthViewSet):
           - stock_inicial: int (>0 para crear ENTRADA)
           - almacen: id del almacén
           - fecha_entrada (opcional, ISO8601)
+          - costo_unitario (opcional): costo de adquisición para la valuación
         """
         producto = serializer.save(created_by=self.request.user, updated_by=self.request.user)
 
@@ -90,6 +120,7 @@ class ProductoViewSet(CompanyScopedQuerysetMixin, BaseAuthViewSet):
             raise ValueError("Para capturar stock_inicial debes especificar 'almacen'.")
 
         fecha_dt = parse_datetime(data.get('fecha_entrada')) if data.get('fecha_entrada') else timezone.now()
+        costo = _parse_costo(data.get('costo_unitario'))
 
         MovimientoProducto.objects.create(
             empresa_id=producto.empresa_id,
@@ -97,6 +128,7 @@ class ProductoViewSet(CompanyScopedQuerysetMixin, BaseAuthViewSet):
             almacen_id=int(almacen_id),
             tipo_movimiento=MovimientoProducto.TipoMovimiento.ENTRADA,
             cantidad=stock_inicial,
+            costo_unitario=costo,
             fecha=fecha_dt,
             created_by=self.request.user,
             updated_by=self.request.user,
@@ -105,48 +137,229 @@ class ProductoViewSet(CompanyScopedQuerysetMixin, BaseAuthViewSet):
     @decorators.action(detail=True, methods=["get"], url_path="stock")
     def stock(self, request, pk=None):
         """
-        Retorna stock actual del producto.
+        Retorna stock actual del producto (lee el saldo materializado en ExistenciaProducto).
         - Opcional: ?almacen=<id> para stock en ese almacén.
         - Si no se pasa almacen, devuelve total y desglose por almacén.
+        - Opcional: ?modo=corte[&fecha=ISO8601] calcula con último corte + movimientos
+          posteriores (permite consultar el stock a una fecha pasada).
         """
         producto_id = pk
         empresa_id = getattr(request, 'company_id', None) or request.query_params.get('empresa')
-        almacen_id = request.query_params.get('almacen')
+        try:
+            almacen_id = int(request.query_params['almacen']) if request.query_params.get('almacen') else None
+        except ValueError:
+            return response.Response({"detail": "almacen inválido."}, status=status.HTTP_400_BAD_REQUEST)
 
-        base = MovimientoProducto.objects.filter(producto_id=producto_id)
+        if request.query_params.get('modo') == 'corte':
+            fecha = request.query_params.get('fecha')
+            try:
+                fecha_dt = parse_datetime(fecha) if fecha else None
+            except ValueError:
+                fecha_dt = None
+            if fecha and fecha_dt is None:
+                return response.Response({"detail": "fecha inválida (ISO8601)."}, status=status.HTTP_400_BAD_REQUEST)
+            saldos = stock_por_corte(producto_id, empresa_id=empresa_id, almacen_id=almacen_id, fecha=fecha_dt)
+            if almacen_id:
+                stock = saldos.get(almacen_id, 0)
+                return response.Response({"producto": int(producto_id), "almacen": almacen_id, "stock": int(stock)})
+            nombres = dict(Almacen.objects.filter(id__in=list(saldos)).values_list('id', 'nombre'))
+            por_almacen = sorted(
+                ({"almacen": a, "nombre": nombres.get(a), "stock": int(c)} for a, c in saldos.items()),
+                key=lambda r: r["nombre"] or "",
+            )
+            return response.Response({
+                "producto": int(producto_id),
+                "total": sum(r["stock"] for r in por_almacen),
+                "por_almacen": por_almacen,
+            })
+
+        base = ExistenciaProducto.objects.filter(producto_id=producto_id)
         if empresa_id:
             base = base.filter(empresa_id=empresa_id)
 
-        agg_expr = Sum(
-            Case(
-                When(tipo_movimiento=MovimientoProducto.TipoMovimiento.ENTRADA, then=F('cantidad')),
-                When(tipo_movimiento=MovimientoProducto.TipoMovimiento.SALIDA,  then=-1 * F('cantidad')),
-                When(tipo_movimiento=MovimientoProducto.TipoMovimiento.AJUSTE,  then=F('cantidad')),
-                default=0,
-                output_field=IntegerField(),
-            )
-        )
-
         if almacen_id:
-            stock = base.filter(almacen_id=almacen_id).aggregate(s=agg_expr).get('s') or 0
-            return response.Response({"producto": int(producto_id), "almacen": int(almacen_id), "stock": int(stock)})
+            stock = base.filter(almacen_id=almacen_id).values_list('cantidad', flat=True).first() or 0
+            return response.Response({"producto": int(producto_id), "almacen": almacen_id, "stock": int(stock)})
 
-        por_almacen = (
-            base.values('almacen_id', 'almacen__nombre')
-                .annotate(stock=agg_expr)
+        por_almacen = list(
+            base.values('almacen_id', 'almacen__nombre', 'cantidad')
                 .order_by('almacen__nombre')
         )
-        total = sum((row['stock'] or 0) for row in por_almacen)
+        total = sum((row['cantidad'] or 0) for row in por_almacen)
         return response.Response({
             "producto": int(producto_id),
             "total": int(total),
             "por_almacen": [
-                {"almacen": r['almacen_id'], "nombre": r['almacen__nombre'], "stock": int(r['stock'] or 0)}
+                {"almacen": r['almacen_id'], "nombre": r['almacen__nombre'], "stock": int(r['cantidad'] or 0)}
                 for r in por_almacen
             ]
         })
 
 
+    @decorators.action(detail=False, methods=["get"], url_path="stock-bulk")
+    def stock_bulk(self, request):
+        """
+        Stock de muchos productos en una sola consulta agrupada (catálogo del POS).
+        GET /api/v1/inventario/productos/stock-bulk/?productos=1,2,3&categoria=<id>&almacen=<id>
+        - productos / categoria: opcionales; sin ellos devuelve todo el catálogo de la empresa.
+        - almacen: opcional; sin él se suma el stock de todos los almacenes.
+        La respuesta se transmite en streaming: {"almacen": ..., "resultados": [...]}
+        """
+        params = request.query_params
+        almacen_id = params.get("almacen")
+        categoria_id = params.get("categoria")
+        try:
+            producto_ids = [int(x) for x in (params.get("productos") or "").split(",") if x.strip()]
+            almacen_id = int(almacen_id) if almacen_id else None
+            categoria_id = int(categoria_id) if categoria_id else None
+        except ValueError:
+            return response.Response({"detail": "productos/categoria/almacen inválidos."}, status=status.HTTP_400_BAD_REQUEST)
+
+        qs = self.filter_queryset_by_company(Producto.objects.all())
+        if producto_ids:
+            qs = qs.filter(id__in=producto_ids)
+        if categoria_id:
+            qs = qs.filter(categoria_id=categoria_id)
+
+        existencias = Q(existencias__almacen_id=almacen_id) if almacen_id else None
+        rows = (
+            qs.values("id", "nombre", "codigo_barras", "afectastock")
+              .annotate(stock=Coalesce(Sum("existencias__cantidad", filter=existencias), 0))
+              .order_by("id")
+        )
+        resultados = (
+            {
+                "producto": r["id"],
+                "nombre": r["nombre"],
+                "codigo_barras": r["codigo_barras"],
+                "afectastock": r["afectastock"],
+                "stock": int(r["stock"]),
+            }
+            for r in rows.iterator(chunk_size=500)
+        )
+        return streaming_json_response(resultados, extra={"almacen": almacen_id})
+
+
+    @decorators.action(detail=False, methods=["get"], url_path="valuacion")
+    def valuacion(self, request):
+        """
+        Valor del inventario a costo promedio, leído del saldo mantenido
+        (no recorre el kardex).
+        GET /api/v1/inventario/productos/valuacion/?almacen=<id>&categoria=<id>
+        Respuesta en streaming: {"almacen", "valor_total", "resultados": [...]}
+        """
+        params = request.query_params
+        try:
+            almacen_id = int(params["almacen"]) if params.get("almacen") else None
+            categoria_id = int(params["categoria"]) if params.get("categoria") else None
+        except ValueError:
+            return response.Response({"detail": "categoria/almacen inválidos."}, status=status.HTTP_400_BAD_REQUEST)
+
+        qs = self.filter_queryset_by_company(
+            ExistenciaProducto.objects.all()
+        ).filter(cantidad__gt=0)
+        if almacen_id:
+            qs = qs.filter(almacen_id=almacen_id)
+        if categoria_id:
+            qs = qs.filter(producto__categoria_id=categoria_id)
+
+        valor_total = qs.aggregate(v=Sum("valor"))["v"] or Decimal("0")
+        rows = (
+            qs.values("producto_id", "producto__nombre", "almacen_id", "almacen__nombre",
+                      "cantidad", "costo_promedio", "valor")
+              .order_by("producto__nombre", "almacen_id")
+        )
+        resultados = (
+            {
+                "producto": r["producto_id"],
+                "nombre": r["producto__nombre"],
+                "almacen": r["almacen_id"],
+                "almacen_nombre": r["almacen__nombre"],
+                "cantidad": r["cantidad"],
+                "costo_promedio": str(r["costo_promedio"]),
+                "valor": str(r["valor"].quantize(Decimal("0.01"))),
+            }
+            for r in rows.iterator(chunk_size=500)
+        )
+        return streaming_json_response(resultados, extra={
+            "almacen": almacen_id,
+            "valor_total": str(valor_total.quantize(Decimal("0.01"))),
+        })
+
+    @decorators.action(detail=False, methods=["get"], url_path="por-codigo")
+    def por_codigo(self, request):
+        """
+        Búsqueda exacta por código de barras para el escáner del POS.
+        GET /api/v1/inventario/productos/por-codigo/?codigo=<codigo>[&almacen=<id>]
+        - Lee primero el cache LRU del proceso (empresa, codigo); si no está,
+          consulta por igualdad (índice único parcial empresa/codigo_barras).
+        - almacen (opcional): agrega el stock actual en ese almacén (no se cachea).
+        """
+        codigo = (request.query_params.get("codigo") or "").strip()
+        empresa_id = self.get_active_company_id()
+        if not codigo or not empresa_id:
+            return response.Response({"detail": "Parámetro requerido: codigo."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            almacen_id = int(request.query_params["almacen"]) if request.query_params.get("almacen") else None
+        except ValueError:
+            return response.Response({"detail": "almacen inválido."}, status=status.HTTP_400_BAD_REQUEST)
+
+        key = (int(empresa_id), codigo)
+        data = productos_por_codigo.get(key)
+        if data is None:
+            producto = (
+                Producto.objects
+                .select_related("categoria")
+                .filter(empresa_id=empresa_id, codigo_barras=codigo)
+                .first()
+            )
+            if producto is None:
+                return response.Response({"detail": "Producto no encontrado."}, status=status.HTTP_404_NOT_FOUND)
+            data = ProductoSerializer(producto).data
+            productos_por_codigo.set(key, data)
+
+        data = dict(data)
+        if almacen_id:
+            data["stock"] = stock_disponible(empresa_id, data["id"], almacen_id)
+        return response.Response(data)
+
+    @decorators.action(detail=False, methods=["get"], url_path="autocompletar")
+    def autocompletar(self, request):
+        """
+        Sugerencias por prefijo para la caja de búsqueda del POS.
+        GET /api/v1/inventario/productos/autocompletar/?q=<texto>[&limit=10]
+        - Prefijo sobre UPPER(nombre) y sobre codigo_barras (índices *_pattern_ops),
+          sin JOIN con categoría; devuelve solo los campos que pinta la lista.
+        - limit no numérico → 400 (igual que kardex).
+        """
+        try:
+            limit = min(max(int(request.query_params.get("limit") or AUTOCOMPLETAR_LIMIT), 1), AUTOCOMPLETAR_MAX_LIMIT)
+        except ValueError:
+            return response.Response({"detail": "limit debe ser entero."}, status=status.HTTP_400_BAD_REQUEST)
+        q = (request.query_params.get("q") or "").strip()
+        empresa_id = self.get_active_company_id()
+        if not q or not empresa_id:
+            return response.Response([])
+
+        rows = (
+            Producto.objects
+            .filter(empresa_id=empresa_id)
+            .alias(nombre_upper=Upper("nombre"))
+            .filter(Q(nombre_upper__startswith=q.upper()) | Q(codigo_barras__startswith=q))
+            .order_by("nombre")
+            .values("id", "nombre", "codigo_barras", "precio")[:limit]
+        )
+        return response.Response(list(rows))
+
+
+AUTOCOMPLETAR_LIMIT = 10
+AUTOCOMPLETAR_MAX_LIMIT = 50
+
+KARDEX_PAGE_SIZE = 100
+KARDEX_MAX_PAGE_SIZE = 1000
+KARDEX_CURSOR_SALT = "inventario.kardex"
+
+
 class MovimientoProductoFilter(FilterSet):
     fecha = DateTimeFromToRangeFilter()  # ?fecha_after=...&fecha_before=...
     producto = NumberFilter(field_name="producto_id")
@@ -154,7 +367,7 @@ class MovimientoProductoFilter(FilterSet):
     empresa = NumberFilter(field_name="empresa_id")
     class Meta:
         model = MovimientoProducto
-        fields = ["empresa", "producto", "almacen", "tipo_movimiento", "fecha"]
+        fields = ["empresa", "producto", "almacen", "tipo_movimiento", "fecha", "transferencia"]
 
 
 class MovimientoProductoViewSet(CompanyScopedQuerysetMixin, BaseAuthViewSet):
@@ -173,7 +386,7 @@ class MovimientoProductoViewSet(CompanyScopedQuerysetMixin, BaseAuthViewSet):
     def entrada(self, request):
         """
         Crea un Movimiento ENTRADA (para compras/ingresos).
-        Body: { empresa, producto, almacen, cantidad, fecha? }
+        Body: { empresa, producto, almacen, cantidad, costo_unitario?, fecha? }
         """
         empresa = request.data.get("empresa")
         producto = request.data.get("producto")
@@ -193,6 +406,11 @@ class MovimientoProductoViewSet(CompanyScopedQuerysetMixin, BaseAuthViewSet):
         if cantidad <= 0:
             return response.Response({"detail": "cantidad debe ser > 0."}, status=status.HTTP_400_BAD_REQUEST)
 
+        try:
+            costo = _parse_costo(request.data.get("costo_unitario"))
+        except ValueError:
+            return response.Response({"detail": "costo_unitario inválido."}, status=status.HTTP_400_BAD_REQUEST)
+
         fecha_dt = parse_datetime(fecha) if fecha else timezone.now()
 
         mov = MovimientoProducto.objects.create(
@@ -201,8 +419,215 @@ class MovimientoProductoViewSet(CompanyScopedQuerysetMixin, BaseAuthViewSet):
             almacen_id=int(almacen),
             tipo_movimiento=MovimientoProducto.TipoMovimiento.ENTRADA,
             cantidad=cantidad,
+            costo_unitario=costo,
             fecha=fecha_dt,
             created_by=request.user,
             updated_by=request.user,
         )
         return response.Response(MovimientoProductoSerializer(mov).data, status=status.HTTP_201_CREATED)
+
+    @decorators.action(detail=False, methods=["get"], url_path="kardex")
+    def kardex(self, request):
+        """
+        Kardex de un producto en un almacén con saldo corrido por movimiento.
+        GET /api/v1/inventario/movimientos-producto/kardex/?producto=<id>&almacen=<id>
+          - desde / hasta (opcional, ISO8601). Con `desde` el saldo inicial sale de los cortes.
+          - limit (default 100, máx 1000) y cursor: paginación keyset sobre (fecha, id).
+            El cursor lleva firmado el saldo acumulado, así cada página solo lee sus filas.
+          - formato=csv: descarga en streaming de todo el rango (ignora limit).
+        """
+        params = request.query_params
+        try:
+            producto_id = int(params.get("producto"))
+            almacen_id = int(params.get("almacen"))
+            limit = min(int(params.get("limit") or KARDEX_PAGE_SIZE), KARDEX_MAX_PAGE_SIZE)
+        except (TypeError, ValueError):
+            return response.Response(
+                {"detail": "producto y almacen son obligatorios (enteros)."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        empresa_id = self.get_active_company_id()
+        base = (
+            self.filter_queryset_by_company(MovimientoProducto.objects.all())
+            .filter(producto_id=producto_id, almacen_id=almacen_id)
+        )
+        desde = parse_datetime(params["desde"]) if params.get("desde") else None
+        hasta = parse_datetime(params["hasta"]) if params.get("hasta") else None
+        if hasta:
+            base = base.filter(fecha__lte=hasta)
+
+        saldo_inicial, despues_de = 0, None
+        if params.get("cursor"):
+            try:
+                pos = signing.loads(params["cursor"], salt=KARDEX_CURSOR_SALT)
+                if (pos["p"], pos["a"]) != (producto_id, almacen_id):
+                    raise signing.BadSignature()
+                despues_de = (parse_datetime(pos["f"]), int(pos["i"]))
+                saldo_inicial = int(pos["s"])
+                if despues_de[0] is None:
+                    raise signing.BadSignature()
+            except (signing.BadSignature, KeyError, TypeError, ValueError):
+                return response.Response({"detail": "cursor inválido."}, status=status.HTTP_400_BAD_REQUEST)
+        elif desde:
+            base = base.filter(fecha__gte=desde)
+            saldo_inicial = stock_por_corte(
+                producto_id, empresa_id=empresa_id, almacen_id=almacen_id,
+                fecha=desde - timedelta(microseconds=1),
+            ).get(almacen_id, 0)
+
+        qs = kardex_movimientos(base, despues_de).values(
+            "id", "fecha", "tipo_movimiento", "cantidad", "cantidad_firmada", "saldo_parcial",
+        )
+
+        if params.get("formato") == "csv":
+            filas = (
+                (r["id"], r["fecha"].isoformat(), r["tipo_movimiento"], r["cantidad"],
+                 saldo_inicial + r["saldo_parcial"])
+                for r in qs.iterator(chunk_size=2000)
+            )
+            return streaming_csv_response(
+                filas,
+                header=["id", "fecha", "tipo_movimiento", "cantidad", "saldo"],
+                filename=f"kardex_{producto_id}_{almacen_id}.csv",
+            )
+
+        rows = list(qs[:limit + 1])
+        hay_mas = len(rows) > limit
+        rows = rows[:limit]
+        resultados = [
+            {
+                "id": r["id"],
+                "fecha": r["fecha"],
+                "tipo_movimiento": r["tipo_movimiento"],
+                "cantidad": r["cantidad"],
+                "saldo": saldo_inicial + r["saldo_parcial"],
+            }
+            for r in rows
+        ]
+        siguiente = None
+        if hay_mas:
+            ultimo = resultados[-1]
+            cursor = signing.dumps(
+                {"p": producto_id, "a": almacen_id, "f": ultimo["fecha"].isoformat(), "i": ultimo["id"], "s": ultimo["saldo"]},
+                salt=KARDEX_CURSOR_SALT,
+            )
+            siguiente = replace_query_param(request.build_absolute_uri(), "cursor", cursor)
+        return response.Response({
+            "producto": producto_id,
+            "almacen": almacen_id,
+            "saldo_inicial": saldo_inicial,
+            "next": siguiente,
+            "resultados": resultados,
+        })
+
+    @decorators.action(detail=False, methods=["post"], url_path="transferencia")
+    def transferencia(self, request):
+        """
+        Traspaso atómico de varios productos entre dos almacenes.
+        Body: { almacen_origen, almacen_destino, fecha?, items: [{producto, cantidad}, ...] }
+        Crea una SALIDA y una ENTRADA por producto con el mismo `transferencia`.
+        """
+        empresa_id = self.get_active_company_id()
+        data = request.data
+        origen = data.get("almacen_origen")
+        destino = data.get("almacen_destino")
+        if not empresa_id or not origen or not destino:
+            return response.Response(
+                {"detail": "almacen_origen y almacen_destino son obligatorios."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        fecha = data.get("fecha")
+        try:
+            transferencia, movimientos = transferir(
+                int(empresa_id), origen, destino, data.get("items"),
+                usuario=request.user,
+                fecha=parse_datetime(fecha) if fecha else None,
+            )
+        except InventarioError as e:
+            return response.Response({"detail": e.detail, **e.extra}, status=status.HTTP_400_BAD_REQUEST)
+        return response.Response({
+            "transferencia": str(transferencia),
+            "movimientos": [m.id for m in movimientos],
+        }, status=status.HTTP_201_CREATED)
+
+    @decorators.action(detail=False, methods=["post"], url_path="importar")
+    def importar(self, request):
+        """
+        Importa movimientos en lote (p. ej. la entrega completa de un proveedor).
+        - multipart con `archivo` CSV: columnas producto|codigo_barras, almacen, cantidad,
+          tipo_movimiento (opcional, default entrada), fecha (opcional, ISO8601).
+          El archivo se lee en streaming por lotes.
+        - JSON: lista de objetos con las mismas llaves, o {"movimientos": [...]}.
+        Las filas inválidas se reportan sin abortar el resto:
+          {procesadas, creadas, con_error, errores: [{fila, errores}]}
+        """
+        empresa_id = self.get_active_company_id()
+        if not empresa_id:
+            return response.Response({"detail": "No hay empresa activa."}, status=status.HTTP_400_BAD_REQUEST)
+
+        archivo = request.FILES.get("archivo")
+        if archivo is not None:
+            filas = csv.DictReader(io.TextIOWrapper(archivo.file, encoding="utf-8-sig"))
+        else:
+            data = request.data
+            filas = data.get("movimientos") if isinstance(data, dict) else data
+            if not isinstance(filas, list):
+                return response.Response(
+                    {"detail": "Envía un archivo CSV en 'archivo' o una lista JSON de movimientos."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+        reporte = importar_movimientos(int(empresa_id), filas, usuario=request.user)
+        return response.Response(reporte, status=status.HTTP_200_OK)
+
+
+class NivelStockViewSet(CompanyScopedQuerysetMixin, BaseAuthViewSet):
+    """
+    Mínimos / puntos de reorden por producto y almacén.
+    `estado` se mantiene al registrar movimientos; aquí solo se evalúa al
+    crear o modificar los umbrales.
+    """
+    permission_classes = [IsAuthenticatedInCompany]
+    queryset = NivelStock.objects.select_related("producto", "almacen").all()
+    serializer_class = NivelStockSerializer
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ["empresa", "producto", "almacen", "estado"]
+    ordering_fields = ["id", "fecha_alerta", "minimo", "punto_reorden"]
+    ordering = ["-id"]
+
+    def _evaluar(self, nivel):
+        cantidad = stock_disponible(nivel.empresa_id, nivel.producto_id, nivel.almacen_id)
+        estado = nivel.calcular_estado(cantidad)
+        if estado != nivel.estado:
+            nivel.estado = estado
+            nivel.fecha_alerta = None if estado == NivelStock.Estado.OK else timezone.now()
+            nivel.save(update_fields=["estado", "fecha_alerta", "updated_at"])
+
+    def perform_create(self, serializer):
+        self._evaluar(serializer.save(created_by=self.request.user, updated_by=self.request.user))
+
+    def perform_update(self, serializer):
+        self._evaluar(serializer.save(updated_by=self.request.user))
+
+    @decorators.action(detail=False, methods=["get"], url_path="bajo-stock")
+    def bajo_stock(self, request):
+        """
+        Productos en reorden o bajo mínimo, leyendo las banderas precalculadas.
+        GET /api/v1/inventario/niveles-stock/bajo-stock/?almacen=<id>&estado=bajo|reorden
+        """
+        qs = (
+            self.filter_queryset(self.get_queryset())
+            .exclude(estado=NivelStock.Estado.OK)
+            .annotate(stock=Subquery(
+                ExistenciaProducto.objects
+                .filter(producto_id=OuterRef("producto_id"), almacen_id=OuterRef("almacen_id"))
+                .values("cantidad")[:1]
+            ))
+            .order_by("fecha_alerta")
+        )
+        data = [
+            {**NivelStockSerializer(n).data, "stock": n.stock or 0}
+            for n in qs
+        ]
+        return response.Response(data)
@@ -1,19 +1,43 @@
 # filters.py
 import django_filters
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
-from .models import Venta, DetalleVenta
+from .models import Venta, DetalleVenta, MetodoPago
 
 class VentaFilter(filters.FilterSet):
     fecha   = filters.DateTimeFromToRangeFilter()
     empresa = filters.NumberFilter(field_name="empresa_id")
     cliente = filters.NumberFilter(field_name="cliente_id")
-    # nuevo: filtrar por forma de pago (relación reverse a MetodoPago)
-    forma_pago = filters.CharFilter(field_name="pagos__forma_pago", lookup_expr="iexact")
-    item_tipo = filters.CharFilter(field_name="detalles__item_tipo", lookup_expr="iexact")
+    sucursal = filters.NumberFilter(field_name="sucursal_id")
+    usuario = filters.NumberFilter(field_name="usuario_id")
+    total_min = filters.NumberFilter(field_name="total", lookup_expr="gte")
+    total_max = filters.NumberFilter(field_name="total", lookup_expr="lte")
+    # Relaciones reverse (pagos/detalles) con EXISTS correlacionado: sin JOIN
+    # no hay filas repetidas y el listado no necesita DISTINCT.
+    forma_pago = filters.CharFilter(method="filter_forma_pago")
+    item_tipo = filters.CharFilter(method="filter_item_tipo")
+    # ?con_saldo=true → ventas con saldo pendiente (índice parcial venta_saldo_pendiente_idx)
+    con_saldo = filters.BooleanFilter(method="filter_con_saldo")
 
     class Meta:
         model  = Venta
-        fields = ["empresa", "cliente", "fecha", "forma_pago", "item_tipo"]
+        fields = [
+            "empresa", "cliente", "sucursal", "usuario", "fecha", "total_min", "total_max",
+            "forma_pago", "item_tipo", "con_saldo", "estado",
+        ]
+
+    def filter_forma_pago(self, queryset, name, value):
+        pagos = MetodoPago.objects.filter(venta=OuterRef("pk"), forma_pago__iexact=value)
+        return queryset.filter(Exists(pagos))
+
+    def filter_item_tipo(self, queryset, name, value):
+        detalles = DetalleVenta.objects.filter(venta=OuterRef("pk"), item_tipo__iexact=value)
+        return queryset.filter(Exists(detalles))
+
+    def filter_con_saldo(self, queryset, name, value):
+        if value is None:
+            return queryset
+        return queryset.filter(saldo__gt=0) if value else queryset.filter(saldo__lte=0)
         
 class DetalleVentaFilter(filters.FilterSet):
     item_tipo = filters.CharFilter(field_name="item_tipo", lookup_expr="iexact")
@@ -0,0 +1,163 @@
+# ventas/folios.py
+"""
+Asignación de folios de venta (p. ej. VTA-202510-0001) con secuencias de PostgreSQL.
+
+- `nextval` no bloquea filas ni participa en la transacción: dos cajas no se
+  esperan entre sí y una venta revertida solo deja un hueco en la numeración
+  (los folios son únicos y crecientes, no necesariamente consecutivos).
+- Hay una secuencia por (empresa, sucursal, serie, periodo); se crea al
+  asignar el primer folio.
+- Con `bloque` > 1 cada proceso toma `bloque` números por `nextval` y los
+  reparte desde memoria: menos viajes a la BD a cambio de huecos más grandes y
+  folios no ordenados entre procesos.
+
+Configuración por empresa en ValorConfiguracion "ventas.folio" (json); cada
+llave es opcional y "sucursales" sobreescribe por id de sucursal:
+    {"serie": "VTA", "formato": "{serie}-{periodo}-{numero:04d}",
+     "por_sucursal": true, "bloque": 1,
+     "sucursales": {"3": {"serie": "CEN"}}}
+Variables del formato: serie, periodo (YYYYMM), sucursal, numero. Un folio
+que no cabe en Venta.folio se rechaza (FolioError): recortarlo podría repetir folios.
+"""
+import hashlib
+import json
+import threading
+
+from django.db import IntegrityError, ProgrammingError, connection, transaction
+from django.utils import timezone
+
+from empresas.models import ValorConfiguracion
+
+
+CLAVE_CONFIGURACION = "ventas.folio"
+FOLIO_DEFAULT = {
+    "serie": "VTA",
+    "formato": "{serie}-{periodo}-{numero:04d}",
+    "por_sucursal": True,
+    "bloque": 1,
+}
+MAX_LONGITUD_FOLIO = 30  # Venta.folio
+
+
+class FolioError(Exception):
+    """Configuración de folios que no produce un folio válido."""
+    def __init__(self, detail):
+        super().__init__(detail)
+        self.detail = detail
+
+
+# nombre de secuencia -> [siguiente, último] del bloque reservado por este proceso
+_bloques = {}
+_bloques_lock = threading.Lock()
+
+
+def configuracion_folio(empresa_id, sucursal_id=None):
+    """Configuración efectiva de folios para la empresa/sucursal (una consulta)."""
+    cfg = dict(FOLIO_DEFAULT)
+    valor = (
+        ValorConfiguracion.objects
+        .filter(empresa_id=empresa_id, configuracion__nombre=CLAVE_CONFIGURACION, is_active=True)
+        .values_list("valor", flat=True)
+        .first()
+    )
+    try:
+        datos = json.loads(valor) if valor else {}
+    except ValueError:
+        datos = {}
+    if isinstance(datos, dict):
+        sucursales = datos.pop("sucursales", None)
+        cfg.update(datos)
+        if sucursal_id and isinstance(sucursales, dict):
+            cfg.update(sucursales.get(str(sucursal_id)) or {})
+    try:
+        cfg["bloque"] = max(int(cfg["bloque"]), 1)
+    except (TypeError, ValueError):
+        cfg["bloque"] = 1
+    cfg["serie"] = str(cfg["serie"] or "")
+    return cfg
+
+
+def nombre_secuencia(empresa_id, sucursal_id, serie, periodo):
+    # La serie es texto libre: se resume con un hash para formar un identificador válido.
+    resumen = hashlib.md5(serie.encode()).hexdigest()[:10]
+    return f"folio_{int(empresa_id)}_{int(sucursal_id or 0)}_{periodo or 0}_{resumen}"
+
+
+def _nextval(nombre, bloque):
+    """
+    `nextval` de la secuencia `nombre`, creándola (INCREMENT BY bloque) si no
+    existe. Devuelve (valor, incremento, creada).
+    """
+    with connection.cursor() as cursor:
+        for _ in range(2):
+            try:
+                with transaction.atomic():
+                    cursor.execute(
+                        "SELECT nextval(%s::regclass), (SELECT increment_by FROM pg_sequences "
+                        "WHERE schemaname = current_schema() AND sequencename = %s)",
+                        [nombre, nombre],
+                    )
+                    valor, incremento = cursor.fetchone()
+                return valor, incremento, False
+            except ProgrammingError:
+                pass  # todavía no existe
+            try:
+                with transaction.atomic():
+                    cursor.execute(
+                        f"CREATE SEQUENCE {connection.ops.quote_name(nombre)} INCREMENT BY {int(bloque)}"
+                    )
+                    cursor.execute("SELECT nextval(%s::regclass)", [nombre])
+                    return cursor.fetchone()[0], bloque, True
+            except (IntegrityError, ProgrammingError):
+                continue  # otra transacción la creó al mismo tiempo
+    raise ProgrammingError(f"No se pudo obtener la secuencia de folios {nombre}.")
+
+
+def siguiente_numero(nombre, bloque=1):
+    """Siguiente número de la secuencia, sirviendo desde el bloque del proceso si hay."""
+    with _bloques_lock:
+        rango = _bloques.get(nombre)
+        if rango and rango[0] <= rango[1]:
+            numero = rango[0]
+            rango[0] += 1
+            return numero
+
+    valor, incremento, creada = _nextval(nombre, bloque)
+    # Una secuencia recién creada se revierte si la transacción falla: su bloque
+    # no se guarda en memoria para no repetir números al volver a crearla.
+    if incremento > 1 and not creada:
+        with _bloques_lock:
+            _bloques[nombre] = [valor + 1, valor + incremento - 1]
+    return valor
+
+
+def asignar_folio(empresa_id, sucursal_id=None, fecha=None):
+    """
+    Asigna el siguiente folio de venta para la empresa/sucursal en el periodo
+    de `fecha` (por defecto, ahora). Devuelve (serie, folio). Lanza FolioError.
+    """
+    cfg = configuracion_folio(empresa_id, sucursal_id)
+    fecha = fecha or timezone.now()
+    if timezone.is_aware(fecha):
+        fecha = timezone.localtime(fecha)
+    periodo = f"{fecha:%Y%m}"
+    formato = str(cfg["formato"] or FOLIO_DEFAULT["formato"])
+
+    nombre = nombre_secuencia(
+        empresa_id,
+        sucursal_id if cfg["por_sucursal"] else None,
+        cfg["serie"],
+        periodo if "{periodo" in formato else "",
+    )
+    numero = siguiente_numero(nombre, cfg["bloque"])
+    valores = {"serie": cfg["serie"], "periodo": periodo, "sucursal": sucursal_id or "", "numero": numero}
+    try:
+        folio = formato.format(**valores)
+    except (KeyError, IndexError, ValueError, AttributeError):
+        folio = FOLIO_DEFAULT["formato"].format(**valores)
+    if len(folio) > MAX_LONGITUD_FOLIO:
+        raise FolioError(
+            f"El folio {folio} excede {MAX_LONGITUD_FOLIO} caracteres; "
+            f"revisa la serie/formato en la configuración {CLAVE_CONFIGURACION}."
+        )
+    return cfg["serie"], folio
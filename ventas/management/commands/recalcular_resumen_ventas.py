@@ -0,0 +1,40 @@
+# ventas/management/commands/recalcular_resumen_ventas.py
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from empresas.models import Empresa
+from ventas.services import recalcular_resumen
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstruye el rollup diario de ventas (ResumenVentaDiario) a partir de "
+        "Venta, MetodoPago y DetalleVenta para un rango de días."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--empresa", type=int, help="Solo procesa esta empresa.")
+        parser.add_argument("--desde", help="Día inicial YYYY-MM-DD (por defecto: hace 30 días).")
+        parser.add_argument("--hasta", help="Día final YYYY-MM-DD (por defecto: hoy).")
+
+    def handle(self, *args, **options):
+        hoy = timezone.localdate()
+        try:
+            desde = parse_date(options["desde"]) if options.get("desde") else hoy - timedelta(days=30)
+            hasta = parse_date(options["hasta"]) if options.get("hasta") else hoy
+        except ValueError:
+            desde = hasta = None
+        if desde is None or hasta is None or desde > hasta:
+            raise CommandError("Rango inválido: usa --desde/--hasta con formato YYYY-MM-DD.")
+
+        empresas = Empresa.objects.all()
+        if options.get("empresa"):
+            empresas = empresas.filter(id=options["empresa"])
+
+        total = 0
+        for empresa_id in empresas.values_list("id", flat=True):
+            total += recalcular_resumen(empresa_id, desde, hasta)
+        self.stdout.write(self.style.SUCCESS(f"Filas de resumen creadas: {total} ({desde} a {hasta})."))
@@ -0,0 +1,22 @@
+# ventas/management/commands/reconciliar_pagos_ventas.py
+from django.core.management.base import BaseCommand
+
+from ventas.services import reconciliar_pagos
+
+
+class Command(BaseCommand):
+    help = (
+        "Verifica Venta.total_pagado/saldo contra la suma de sus pagos y corrige "
+        "las ventas desfasadas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--empresa", type=int, help="Solo revisa las ventas de esta empresa.")
+        parser.add_argument("--dry-run", action="store_true", help="Solo reporta, no corrige.")
+
+    def handle(self, *args, **options):
+        ids = reconciliar_pagos(empresa_id=options.get("empresa"), corregir=not options["dry_run"])
+        accion = "detectadas" if options["dry_run"] else "corregidas"
+        self.stdout.write(self.style.SUCCESS(f"Ventas desfasadas {accion}: {len(ids)}."))
+        if ids:
+            self.stdout.write("ids: " + ", ".join(str(i) for i in ids[:50]) + (" ..." if len(ids) > 50 else ""))
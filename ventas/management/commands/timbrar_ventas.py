@@ -0,0 +1,61 @@
+# ventas/management/commands/timbrar_ventas.py
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from ventas.pac import get_pac_client
+from ventas.timbrado import ejecutar_worker
+
+
+class Command(BaseCommand):
+    help = (
+        "Procesa la cola de timbrado CFDI (TrabajoTimbrado) con un pool de workers. "
+        "Cada worker toma lotes con SKIP LOCKED, así que se pueden correr varias "
+        "instancias del comando a la vez."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2, help="Hilos en paralelo (default: 2).")
+        parser.add_argument("--lote", type=int, default=settings.TIMBRADO_LOTE,
+                            help="Comprobantes por llamada al PAC.")
+        parser.add_argument("--una-vez", action="store_true",
+                            help="Termina cuando la cola no tenga trabajos listos.")
+        parser.add_argument("--espera", type=float, default=5,
+                            help="Segundos de espera cuando la cola está vacía.")
+
+    def handle(self, *args, **options):
+        if options["workers"] < 1 or options["lote"] < 1:
+            raise CommandError("--workers y --lote deben ser mayores a 0.")
+        cliente = get_pac_client()
+        lote = min(options["lote"], cliente.lote_maximo)
+        detener = threading.Event()
+        total = Counter()
+        lock = threading.Lock()
+
+        def worker():
+            try:
+                conteo = ejecutar_worker(cliente, lote, detener, una_vez=options["una_vez"], espera=options["espera"])
+                with lock:
+                    total.update(conteo)
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=worker, daemon=True) for _ in range(options["workers"])]
+        for hilo in hilos:
+            hilo.start()
+        try:
+            for hilo in hilos:
+                while hilo.is_alive():
+                    hilo.join(timeout=1)
+        except KeyboardInterrupt:
+            detener.set()
+            for hilo in hilos:
+                hilo.join()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Timbrados: {total['timbrados']}, reintentos: {total['reintentos']}, "
+            f"errores: {total['errores']}, cancelados: {total['cancelados']}."
+        ))
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:10
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def poblar_total_pagado(apps, schema_editor):
+    Venta = apps.get_model('ventas', 'Venta')
+    MetodoPago = apps.get_model('ventas', 'MetodoPago')
+    pagado = (
+        MetodoPago.objects.filter(venta=OuterRef('pk'))
+        .values('venta').annotate(s=Sum('importe')).values('s')
+    )
+    Venta.objects.update(total_pagado=Coalesce(
+        Subquery(pagado), Value(0), output_field=DecimalField(max_digits=12, decimal_places=2),
+    ))
+    Venta.objects.update(saldo=F('total') - F('total_pagado'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0005_cliente_avatar'),
+        ('empresas', '0002_configuracion_valorconfiguracion'),
+        ('ventas', '0004_remove_venta_metodo_pago_metodopago'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='venta',
+            name='saldo',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='venta',
+            name='total_pagado',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(poblar_total_pagado, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='venta',
+            index=models.Index(condition=models.Q(('saldo__gt', 0)), fields=['empresa', 'fecha'], name='venta_saldo_pendiente_idx'),
+        ),
+    ]
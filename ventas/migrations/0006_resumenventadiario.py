@@ -0,0 +1,36 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresas', '0002_configuracion_valorconfiguracion'),
+        ('ventas', '0005_venta_total_pagado_saldo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenVentaDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('dimension', models.CharField(choices=[('venta', 'Venta'), ('forma_pago', 'Forma de pago'), ('item_tipo', 'Tipo de renglón')], max_length=12)),
+                ('clave', models.CharField(blank=True, default='', max_length=30)),
+                ('operaciones', models.IntegerField(default=0)),
+                ('cantidad', models.IntegerField(default=0)),
+                ('importe', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='actualizado')),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_venta', to='empresas.empresa')),
+                ('sucursal', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_venta', to='empresas.sucursal')),
+            ],
+            options={
+                'verbose_name': 'Resumen diario de ventas',
+                'verbose_name_plural': 'Resúmenes diarios de ventas',
+                'indexes': [models.Index(fields=['empresa', 'fecha', 'dimension'], name='ventas_resu_empresa_05b202_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('sucursal__isnull', False)), fields=('empresa', 'sucursal', 'fecha', 'dimension', 'clave'), name='uniq_resumen_venta_sucursal'), models.UniqueConstraint(condition=models.Q(('sucursal__isnull', True)), fields=('empresa', 'fecha', 'dimension', 'clave'), name='uniq_resumen_venta_sin_sucursal')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresas', '0002_configuracion_valorconfiguracion'),
+        ('ventas', '0006_resumenventadiario'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codigodescuento',
+            name='bloque_reserva',
+            field=models.PositiveIntegerField(default=0, verbose_name='Usos por bloque de reserva'),
+        ),
+        migrations.CreateModel(
+            name='ReservaCodigoDescuento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('disponibles', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='actualizado')),
+                ('codigo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='ventas.codigodescuento')),
+                ('sucursal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas_codigo', to='empresas.sucursal')),
+            ],
+            options={
+                'verbose_name': 'Reserva de código de descuento',
+                'verbose_name_plural': 'Reservas de códigos de descuento',
+                'unique_together': {('codigo', 'sucursal')},
+            },
+        ),
+    ]
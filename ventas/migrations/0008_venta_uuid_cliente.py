@@ -0,0 +1,26 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0005_cliente_avatar'),
+        ('empresas', '0002_configuracion_valorconfiguracion'),
+        ('ventas', '0007_reserva_codigo_descuento'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='venta',
+            name='uuid_cliente',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='venta',
+            constraint=models.UniqueConstraint(condition=models.Q(('uuid_cliente__isnull', False)), fields=('empresa', 'uuid_cliente'), name='venta_uuid_cliente_uniq'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:23
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresas', '0002_configuracion_valorconfiguracion'),
+        ('ventas', '0008_venta_uuid_cliente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoTimbrado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('timbrado', 'Timbrado'), ('error', 'Error')], default='pendiente', max_length=12)),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('proximo_intento', models.DateTimeField(default=django.utils.timezone.now)),
+                ('tomado_en', models.DateTimeField(blank=True, null=True)),
+                ('ultimo_error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='creado')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='actualizado')),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trabajos_timbrado', to='empresas.empresa')),
+                ('venta', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='timbrado', to='ventas.venta')),
+            ],
+            options={
+                'verbose_name': 'Trabajo de timbrado',
+                'verbose_name_plural': 'Trabajos de timbrado',
+                'indexes': [models.Index(fields=['estado', 'proximo_intento'], name='ventas_trab_estado_d73276_idx')],
+            },
+        ),
+    ]
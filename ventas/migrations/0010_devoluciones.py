@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0009_trabajo_timbrado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detalleventa',
+            name='cantidad_devuelta',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='detalleventa',
+            name='importe_devuelto',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='venta',
+            name='estado',
+            field=models.CharField(choices=[('activa', 'Activa'), ('devolucion_parcial', 'Devolución parcial'), ('anulada', 'Anulada')], default='activa', max_length=20),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:38
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0005_cliente_avatar'),
+        ('empresas', '0002_configuracion_valorconfiguracion'),
+        ('inventario', '0012_busqueda_trigramas'),
+        ('planes', '0008_plan_costo_inscripcion'),
+        ('ventas', '0010_devoluciones'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='detalleventa',
+            index=models.Index(models.F('venta'), django.db.models.functions.text.Upper('item_tipo'), name='detalle_venta_tipo_upper_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='metodopago',
+            index=models.Index(models.F('venta'), django.db.models.functions.text.Upper('forma_pago'), name='pago_venta_forma_upper_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='venta',
+            index=models.Index(fields=['empresa', 'sucursal', 'fecha'], name='venta_emp_suc_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='venta',
+            index=models.Index(fields=['empresa', 'usuario', 'fecha'], name='venta_emp_usr_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0011_indices_filtros_venta'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='trabajotimbrado',
+            name='estado',
+            field=models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('timbrado', 'Timbrado'), ('error', 'Error'), ('cancelado', 'Cancelado')], default='pendiente', max_length=12),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.4 on 2026-10-17 05:10
+
+from django.core.management import call_command
+from django.db import migrations
+
+
+def crear_tabla_cache(apps, schema_editor):
+    # Tabla de los caches con backend de BD (default: dbcache://django_cache),
+    # para que los reportes de ventas funcionen tras un `migrate` normal.
+    # Ya existente o con otro backend (Redis): no hace nada.
+    call_command('createcachetable', database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0012_timbrado_cancelado'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_tabla_cache, migrations.RunPython.noop),
+    ]
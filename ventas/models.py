@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Upper
+from django.utils import timezone
 from django.conf import settings
 from core.models import TimeStampedModel
 from empresas.models import Empresa
@@ -20,6 +22,9 @@ class CodigoDescuento(TimeStampedModel):
     tipo_descuento = models.CharField("Tipo de descuento", max_length=20, choices=Tipo.choices)
     cantidad = models.PositiveIntegerField("Cantidad disponible", default=0)
     restantes = models.PositiveIntegerField("Usos restantes", default=0)
+    # Promos masivas: > 0 reparte los usos en bloques por sucursal (ReservaCodigoDescuento)
+    # para que los canjes no compitan por esta fila. 0 = canje directo.
+    bloque_reserva = models.PositiveIntegerField("Usos por bloque de reserva", default=0)
 
     # Usuario_id de tu tabla como responsable opcional
     usuario = models.ForeignKey(
@@ -45,11 +50,42 @@ class CodigoDescuento(TimeStampedModel):
             self.restantes = self.cantidad
         super().save(*args, **kwargs)
 
+    def usos_disponibles(self):
+        """Usos sin canjear: restantes + los que siguen reservados por sucursal."""
+        if not self.bloque_reserva:
+            return self.restantes
+        reservados = self.reservas.aggregate(s=models.Sum('disponibles'))['s'] or 0
+        return self.restantes + reservados
+
     def __str__(self):
         return f"{self.codigo} ({self.empresa})"
+
+
+class ReservaCodigoDescuento(models.Model):
+    """
+    Bloque de usos de un código tomado por una sucursal (ver CodigoDescuento.bloque_reserva).
+    Los canjes de la sucursal descuentan aquí; solo al agotarse se toca la fila del código.
+    """
+    codigo = models.ForeignKey('ventas.CodigoDescuento', on_delete=models.CASCADE, related_name='reservas')
+    sucursal = models.ForeignKey('empresas.Sucursal', on_delete=models.CASCADE, related_name='reservas_codigo')
+    disponibles = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="actualizado")
+
+    class Meta:
+        verbose_name = "Reserva de código de descuento"
+        verbose_name_plural = "Reservas de códigos de descuento"
+        unique_together = ("codigo", "sucursal")
+
+    def __str__(self):
+        return f"{self.codigo_id}@{self.sucursal_id}: {self.disponibles}"
       
 
 class Venta(TimeStampedModel):
+    class Estado(models.TextChoices):
+        ACTIVA             = 'activa', 'Activa'
+        DEVOLUCION_PARCIAL = 'devolucion_parcial', 'Devolución parcial'
+        ANULADA            = 'anulada', 'Anulada'
+
     # class MetodoPago(models.TextChoices):
     #     EFECTIVO = 'efectivo', 'Efectivo'
     #     TARJETA  = 'tarjeta', 'Tarjeta'
@@ -75,6 +111,11 @@ class Venta(TimeStampedModel):
     impuesto_monto  = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     total           = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
+    # Denormalizados: los mantiene MetodoPago (save/delete) con UPDATE atómicos.
+    # Verificar/corregir con `manage.py reconciliar_pagos_ventas`.
+    total_pagado    = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    saldo           = models.DecimalField(max_digits=12, decimal_places=2, default=0)   # total - total_pagado
+
     # Otros campos de la tabla
     referencia_pago = models.CharField(max_length=100, blank=True, null=True)             # referencia_pa
     notas           = models.TextField(blank=True, null=True)
@@ -84,18 +125,60 @@ class Venta(TimeStampedModel):
     serie           = models.CharField(max_length=20, blank=True, null=True)
     folio_fiscal    = models.CharField(max_length=50, blank=True, null=True)
 
+    # UUID generado por la caja en ventas capturadas sin conexión (ver ventas/sync/).
+    uuid_cliente    = models.UUIDField(blank=True, null=True)
+
+    # Devoluciones/anulación (ver ventas.services.devolver_venta): los totales
+    # de arriba quedan netos de lo devuelto.
+    estado          = models.CharField(max_length=20, choices=Estado.choices, default=Estado.ACTIVA)
+
 
     class Meta:
         indexes = [
             models.Index(fields=['empresa', 'fecha']),
             models.Index(fields=['folio']),
             models.Index(fields=['sucursal']),
+            # Filtros ?sucursal= / ?usuario= del listado, ordenado por fecha.
+            models.Index(fields=['empresa', 'sucursal', 'fecha'], name='venta_emp_suc_fecha_idx'),
+            models.Index(fields=['empresa', 'usuario', 'fecha'], name='venta_emp_usr_fecha_idx'),
+            # "Ventas con saldo pendiente": índice parcial, solo las filas con saldo.
+            models.Index(fields=['empresa', 'fecha'], condition=models.Q(saldo__gt=0), name='venta_saldo_pendiente_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['empresa', 'uuid_cliente'],
+                condition=models.Q(uuid_cliente__isnull=False),
+                name='venta_uuid_cliente_uniq',
+            ),
         ]
 
+    def save(self, *args, **kwargs):
+        """
+        total_pagado/saldo nunca se escriben desde la instancia en memoria (podría
+        estar desfasada respecto a los pagos); en altas se inicializan y en
+        ediciones se excluyen de update_fields y el saldo se recalcula en SQL.
+        """
+        if self._state.adding:
+            self.saldo = (self.total or 0) - (self.total_pagado or 0)
+            return super().save(*args, **kwargs)
+
+        update_fields = kwargs.pop('update_fields', None)
+        if update_fields is None:
+            update_fields = [f.name for f in self._meta.concrete_fields if not f.primary_key]
+        update_fields = [f for f in update_fields if f not in CAMPOS_PAGO]
+        with transaction.atomic():
+            super().save(*args, update_fields=update_fields, **kwargs)
+            if 'total' in update_fields:
+                Venta.objects.filter(pk=self.pk).update(saldo=models.F('total') - models.F('total_pagado'))
+            self.total_pagado, self.saldo = Venta.objects.filter(pk=self.pk).values_list(*CAMPOS_PAGO).get()
+
     def __str__(self):
         return f'Venta #{self.id or "—"} {self.folio or ""} - {self.total:.2f}'
 
 
+CAMPOS_PAGO = ('total_pagado', 'saldo')
+
+
 class MetodoPago(TimeStampedModel):
     """Pagos recibidos de una venta: SOLO venta_id, forma_pago_id, importe."""
     venta      = models.ForeignKey('ventas.Venta', on_delete=models.CASCADE, related_name='pagos')
@@ -105,8 +188,27 @@ class MetodoPago(TimeStampedModel):
     class Meta:
         indexes = [
             models.Index(fields=['venta']),
+            # EXISTS de VentaFilter.forma_pago (iexact -> UPPER): se resuelve con el índice.
+            models.Index(models.F('venta'), Upper('forma_pago'), name='pago_venta_forma_upper_idx'),
         ]
 
+    def save(self, *args, **kwargs):
+        from .services import aplicar_pagos
+        with transaction.atomic():
+            anterior = None
+            if self.pk:
+                anterior = MetodoPago.objects.filter(pk=self.pk).first()
+            super().save(*args, **kwargs)
+            if anterior:
+                aplicar_pagos([anterior], revertir=True)
+            aplicar_pagos([self])
+
+    def delete(self, *args, **kwargs):
+        from .services import aplicar_pagos
+        with transaction.atomic():
+            aplicar_pagos([self], revertir=True)
+            return super().delete(*args, **kwargs)
+
     def __str__(self):
         return f'Pago {self.forma_pago} ${self.importe} de venta {self.venta_id}'
 
@@ -149,6 +251,10 @@ class DetalleVenta(TimeStampedModel):
     subtotal        = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     total           = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
+    # Devoluciones acumuladas del renglón (subtotal/total se conservan como se vendió)
+    cantidad_devuelta = models.PositiveIntegerField(default=0)
+    importe_devuelto  = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
     # Campos específicos cuando el item es un PLAN
     plan_inicio  = models.DateField(null=True, blank=True)
     plan_fin     = models.DateField(null=True, blank=True)
@@ -163,7 +269,88 @@ class DetalleVenta(TimeStampedModel):
         indexes = [
             models.Index(fields=['venta']),
             models.Index(fields=['item_tipo']),
+            # EXISTS de VentaFilter.item_tipo (iexact -> UPPER): se resuelve con el índice.
+            models.Index(models.F('venta'), Upper('item_tipo'), name='detalle_venta_tipo_upper_idx'),
         ]
 
     def __str__(self):
         return f'Detalle #{self.id} - {self.item_tipo} x{self.cantidad}'
+
+
+class ResumenVentaDiario(models.Model):
+    """
+    Rollup diario de ventas por (empresa, sucursal, fecha) y dimensión:
+      - dimension='venta'      clave=''           → tickets e importe total.
+      - dimension='forma_pago' clave=forma_pago   → pagos cobrados.
+      - dimension='item_tipo'  clave=PLAN/PRODUCTO → renglones, unidades e importe.
+    Se actualiza de forma incremental en el checkout y en altas/bajas de pagos;
+    `manage.py recalcular_resumen_ventas` lo reconstruye para un rango.
+    """
+    class Dimension(models.TextChoices):
+        VENTA      = 'venta', 'Venta'
+        FORMA_PAGO = 'forma_pago', 'Forma de pago'
+        ITEM_TIPO  = 'item_tipo', 'Tipo de renglón'
+
+    empresa    = models.ForeignKey('empresas.Empresa', on_delete=models.CASCADE, related_name='resumenes_venta')
+    sucursal   = models.ForeignKey('empresas.Sucursal', on_delete=models.CASCADE, related_name='resumenes_venta',
+                                   null=True, blank=True)
+    fecha      = models.DateField()
+    dimension  = models.CharField(max_length=12, choices=Dimension.choices)
+    clave      = models.CharField(max_length=30, blank=True, default='')
+    operaciones = models.IntegerField(default=0)
+    cantidad   = models.IntegerField(default=0)
+    importe    = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='actualizado')
+
+    class Meta:
+        verbose_name = 'Resumen diario de ventas'
+        verbose_name_plural = 'Resúmenes diarios de ventas'
+        constraints = [
+            # NULL no choca en UNIQUE: una restricción para ventas con sucursal y otra sin ella.
+            models.UniqueConstraint(
+                fields=['empresa', 'sucursal', 'fecha', 'dimension', 'clave'],
+                condition=models.Q(sucursal__isnull=False),
+                name='uniq_resumen_venta_sucursal',
+            ),
+            models.UniqueConstraint(
+                fields=['empresa', 'fecha', 'dimension', 'clave'],
+                condition=models.Q(sucursal__isnull=True),
+                name='uniq_resumen_venta_sin_sucursal',
+            ),
+        ]
+        indexes = [models.Index(fields=['empresa', 'fecha', 'dimension'])]
+
+    def __str__(self):
+        return f'{self.fecha} {self.dimension}:{self.clave} ${self.importe} (emp:{self.empresa_id})'
+
+
+class TrabajoTimbrado(models.Model):
+    """
+    Cola en BD de ventas por timbrar (CFDI) con el PAC. El checkout solo inserta
+    la fila; la procesa `manage.py timbrar_ventas` (ver ventas.timbrado), así que
+    la latencia del POS no depende del PAC.
+    """
+    class Estado(models.TextChoices):
+        PENDIENTE  = 'pendiente', 'Pendiente'
+        PROCESANDO = 'procesando', 'Procesando'
+        TIMBRADO   = 'timbrado', 'Timbrado'
+        ERROR      = 'error', 'Error'
+        CANCELADO  = 'cancelado', 'Cancelado'   # la venta se anuló antes de timbrar
+
+    empresa         = models.ForeignKey('empresas.Empresa', on_delete=models.CASCADE, related_name='trabajos_timbrado')
+    venta           = models.OneToOneField(Venta, on_delete=models.CASCADE, related_name='timbrado')
+    estado          = models.CharField(max_length=12, choices=Estado.choices, default=Estado.PENDIENTE)
+    intentos        = models.PositiveIntegerField(default=0)
+    proximo_intento = models.DateTimeField(default=timezone.now)     # backoff entre reintentos
+    tomado_en       = models.DateTimeField(null=True, blank=True)    # lease del worker que lo procesa
+    ultimo_error    = models.TextField(blank=True, default='')
+    created_at      = models.DateTimeField(auto_now_add=True, verbose_name='creado')
+    updated_at      = models.DateTimeField(auto_now=True, verbose_name='actualizado')
+
+    class Meta:
+        verbose_name = 'Trabajo de timbrado'
+        verbose_name_plural = 'Trabajos de timbrado'
+        indexes = [models.Index(fields=['estado', 'proximo_intento'])]
+
+    def __str__(self):
+        return f'Timbrado venta {self.venta_id}: {self.estado} ({self.intentos} intentos)'
@@ -0,0 +1,63 @@
+# ventas/pac.py
+"""
+Clientes de PAC (Proveedor Autorizado de Certificación) para timbrar CFDI.
+El cliente activo se elige con settings.TIMBRADO_PAC_CLIENT (ruta de la clase).
+"""
+import time
+import uuid
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+
+RFC_PUBLICO_GENERAL = "XAXX010101000"
+
+
+class PACError(Exception):
+    """Rechazo o falla del PAC. `reintentable=False` para errores del comprobante."""
+    def __init__(self, detail, reintentable=True):
+        super().__init__(detail)
+        self.detail = detail
+        self.reintentable = reintentable
+
+
+class PACClient:
+    """
+    Interfaz de un PAC. `timbrar` recibe una lista de comprobantes (ver
+    ventas.timbrado.comprobante_venta) y devuelve
+    {venta_id: {"uuid", "folio_fiscal", "fecha_timbrado"} | PACError}.
+    Si el PAC no responde, debe lanzar PACError (se reintenta todo el lote).
+    """
+    lote_maximo = 50
+
+    def timbrar(self, comprobantes):
+        raise NotImplementedError
+
+
+class FakePACClient(PACClient):
+    """
+    PAC local para desarrollo y pruebas: timbra al instante con un UUID
+    aleatorio. Rechaza sin reintento los comprobantes con total <= 0 o sin
+    uso_cfdi, como lo haría el SAT. `latencia` simula el tiempo de respuesta.
+    """
+    latencia = 0
+
+    def timbrar(self, comprobantes):
+        if self.latencia:
+            time.sleep(self.latencia)
+        ahora = timezone.now()
+        resultados = {}
+        for c in comprobantes:
+            if c["total"] <= 0:
+                resultados[c["venta_id"]] = PACError("El total del comprobante debe ser mayor a 0.", reintentable=False)
+            elif not c["uso_cfdi"]:
+                resultados[c["venta_id"]] = PACError("Falta uso_cfdi del receptor.", reintentable=False)
+            else:
+                timbre = str(uuid.uuid4()).upper()
+                resultados[c["venta_id"]] = {"uuid": timbre, "folio_fiscal": timbre, "fecha_timbrado": ahora}
+        return resultados
+
+
+def get_pac_client():
+    return import_string(settings.TIMBRADO_PAC_CLIENT)()
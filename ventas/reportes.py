@@ -0,0 +1,226 @@
+# ventas/reportes.py
+"""
+Reportes de gerencia: top productos, top planes, ventas por cajero y por
+sucursal, y antigüedad de saldos por cliente.
+
+- Cada reporte es un solo GROUP BY sobre DetalleVenta JOIN Venta, neto de
+  devoluciones (cantidad - cantidad_devuelta, total - importe_devuelto).
+- El resultado se guarda en el cache compartido (settings.CACHES, común a
+  todos los workers) con una llave que incluye la versión de reportes de la
+  empresa. Cada escritura de venta/devolución/pago sube esa versión con
+  `cache.incr` al confirmar (ver acumular_resumen): las llaves viejas dejan de
+  leerse en todos los procesos y caducan solas por TTL.
+- La antigüedad de saldos no se cachea: es un GROUP BY por cliente que se
+  pagina por cursor o se exporta en streaming.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from time import time_ns
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Min, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import DetalleVenta, Venta
+
+
+REPORTES = {
+    # nombre -> (filtro de renglones, campos de agrupación (id, nombre), con límite)
+    "productos": (Q(item_tipo=DetalleVenta.ItemTipo.PRODUCTO), ("producto_id", "producto__nombre"), True),
+    "planes": (Q(item_tipo=DetalleVenta.ItemTipo.PLAN), ("plan_id", "plan__nombre"), True),
+    "cajeros": (Q(), ("venta__usuario_id", "venta__usuario__username"), False),
+    "sucursales": (Q(), ("venta__sucursal_id", "venta__sucursal__nombre"), False),
+}
+LIMITE_DEFAULT = 20
+LIMITE_MAXIMO = 100
+
+
+def _clave_version(empresa_id):
+    return f"ventas:reportes:version:{empresa_id}"
+
+
+def _version(empresa_id):
+    """Versión vigente de los reportes de la empresa (la crea si no existe)."""
+    clave = _clave_version(empresa_id)
+    version = cache.get(clave)
+    if version is None:
+        # Valor inicial por reloj: si la llave se perdió (desalojo, reinicio),
+        # no se reutiliza una versión cuyos reportes sigan en el cache.
+        cache.add(clave, time_ns() // 1000, timeout=None)
+        version = cache.get(clave)
+    return version
+
+
+def _clave_reporte(empresa_id, version, reporte, desde, hasta, sucursal_id, limite):
+    return f"ventas:reporte:{empresa_id}:{version}:{reporte}:{desde}:{hasta}:{sucursal_id or ''}:{limite or ''}"
+
+
+def _rango(desde, hasta):
+    """Días [desde, hasta] como datetimes [inicio, fin) para usar el índice de Venta.fecha."""
+    inicio = datetime.combine(desde, time.min)
+    fin = datetime.combine(hasta + timedelta(days=1), time.min)
+    if settings.USE_TZ:
+        inicio, fin = timezone.make_aware(inicio), timezone.make_aware(fin)
+    return inicio, fin
+
+
+def calcular_reporte(empresa_id, reporte, desde, hasta, sucursal_id=None, limite=None):
+    """Filas del reporte directo de la BD (una consulta). Importes como texto."""
+    filtro, (campo_id, campo_nombre), con_limite = REPORTES[reporte]
+    inicio, fin = _rango(desde, hasta)
+    qs = DetalleVenta.objects.filter(
+        filtro, venta__empresa_id=empresa_id, venta__fecha__gte=inicio, venta__fecha__lt=fin,
+    )
+    if sucursal_id:
+        qs = qs.filter(venta__sucursal_id=sucursal_id)
+    qs = (
+        qs.values(campo_id, campo_nombre)
+        .annotate(
+            ventas=Count("venta_id", distinct=True, filter=~Q(venta__estado=Venta.Estado.ANULADA)),
+            cantidad=Sum(F("cantidad") - F("cantidad_devuelta")),
+            importe=Sum(F("total") - F("importe_devuelto")),
+        )
+        .order_by("-importe", campo_id)
+    )
+    if con_limite:
+        qs = qs[:limite or LIMITE_DEFAULT]
+    return [
+        {
+            "id": r[campo_id],
+            "nombre": r[campo_nombre] or "",
+            "ventas": r["ventas"],
+            "cantidad": r["cantidad"] or 0,
+            "importe": str(r["importe"] or 0),
+        }
+        for r in qs
+    ]
+
+
+def reporte_ventas(empresa_id, reporte, desde, hasta, sucursal_id=None, limite=None):
+    """
+    Reporte `reporte` (ver REPORTES) para los días [desde, hasta], leído del
+    cache si existe. Devuelve el dict que responde el endpoint.
+    """
+    limite = min(limite or LIMITE_DEFAULT, LIMITE_MAXIMO) if REPORTES[reporte][2] else None
+    clave = _clave_reporte(empresa_id, _version(empresa_id), reporte, desde, hasta, sucursal_id, limite)
+    datos = cache.get(clave)
+    if datos is not None:
+        return dict(datos, cache=True)
+
+    datos = {
+        "reporte": reporte,
+        "desde": desde,
+        "hasta": hasta,
+        "sucursal": sucursal_id,
+        "limite": limite,
+        "generado": timezone.now(),
+        "filas": calcular_reporte(empresa_id, reporte, desde, hasta, sucursal_id, limite),
+    }
+    cache.set(clave, datos, settings.VENTAS_REPORTES_CACHE_TTL)
+    return dict(datos, cache=False)
+
+
+def invalidar_reportes(empresa_id):
+    """Sube la versión de reportes de la empresa: todos sus reportes cacheados quedan viejos."""
+    try:
+        cache.incr(_clave_version(empresa_id))
+    except ValueError:
+        # No había versión: ningún reporte cacheado puede estar vigente.
+        _version(empresa_id)
+
+
+# -----------------------------
+# Antigüedad de saldos (cuentas por cobrar)
+# -----------------------------
+# (campo, días mínimos, días máximos) de antigüedad por fecha de venta al día de corte.
+TRAMOS_ANTIGUEDAD = (
+    ("dias_0_30", 0, 30),
+    ("dias_31_60", 31, 60),
+    ("dias_61_90", 61, 90),
+    ("dias_90_mas", 91, None),
+)
+
+
+def _filtros_tramos(corte, campo_fecha):
+    """{tramo: Q} sobre `campo_fecha`; edad en días = corte - fecha local de la venta."""
+    filtros = {}
+    for campo, minimo, maximo in TRAMOS_ANTIGUEDAD:
+        # [inicio, fin) cubre los días con edad minimo..maximo; el último tramo no tiene inicio.
+        ultimo_dia = corte - timedelta(days=minimo)
+        inicio, fin = _rango(corte - timedelta(days=maximo) if maximo is not None else ultimo_dia, ultimo_dia)
+        filtros[campo] = Q(**{f"{campo_fecha}__lt": fin})
+        if maximo is not None:
+            filtros[campo] &= Q(**{f"{campo_fecha}__gte": inicio})
+    return filtros
+
+
+def antiguedad_saldos(empresa_id, corte, sucursal_id=None, cliente_id=None):
+    """
+    Clientes con saldo pendiente en la empresa, anotados con su saldo por tramo
+    de antigüedad (TRAMOS_ANTIGUEDAD), saldo total, número de ventas y venta más
+    antigua. Un solo GROUP BY por cliente sobre las ventas con saldo > 0
+    (índice parcial venta_saldo_pendiente_idx); ventas posteriores al corte no
+    cuentan. Devuelve un queryset: se pagina o se recorre con .iterator().
+    """
+    from clientes.models import Cliente
+
+    ventas = Q(compras__empresa_id=empresa_id, compras__saldo__gt=0, compras__fecha__lt=_rango(corte, corte)[1])
+    if sucursal_id:
+        ventas &= Q(compras__sucursal_id=sucursal_id)
+    qs = Cliente.objects.filter(ventas)
+    if cliente_id:
+        qs = qs.filter(pk=cliente_id)
+
+    tramos = {
+        campo: Coalesce(Sum("compras__saldo", filter=filtro), Value(Decimal("0.00")))
+        for campo, filtro in _filtros_tramos(corte, "compras__fecha").items()
+    }
+    return (
+        qs.only("id", "nombre", "apellidos")
+        .annotate(
+            saldo=Sum("compras__saldo"),
+            ventas=Count("compras"),
+            venta_mas_antigua=Min("compras__fecha"),
+            **tramos,
+        )
+    )
+
+
+CAMPOS_ANTIGUEDAD = (
+    ("cliente", "id"),
+    ("nombre", None),
+    ("ventas", "ventas"),
+    ("venta_mas_antigua", "venta_mas_antigua"),
+    *((campo, campo) for campo, _, _ in TRAMOS_ANTIGUEDAD),
+    ("saldo", "saldo"),
+)
+
+
+def fila_antiguedad(cliente):
+    """Fila plana (dict) de un cliente anotado por `antiguedad_saldos`; importes como texto."""
+    fila = {}
+    for nombre, atributo in CAMPOS_ANTIGUEDAD:
+        valor = getattr(cliente, atributo) if atributo else f"{cliente.nombre} {cliente.apellidos}".strip()
+        fila[nombre] = str(valor) if isinstance(valor, Decimal) else valor
+    return fila
+
+
+def totales_antiguedad(empresa_id, corte, sucursal_id=None, cliente_id=None):
+    """Totales de la empresa por tramo (una consulta sobre el mismo índice parcial)."""
+    ventas = Venta.objects.filter(empresa_id=empresa_id, saldo__gt=0, fecha__lt=_rango(corte, corte)[1])
+    if sucursal_id:
+        ventas = ventas.filter(sucursal_id=sucursal_id)
+    if cliente_id:
+        ventas = ventas.filter(cliente_id=cliente_id)
+    tramos = {
+        campo: Coalesce(Sum("saldo", filter=filtro), Value(Decimal("0.00")))
+        for campo, filtro in _filtros_tramos(corte, "fecha").items()
+    }
+    datos = ventas.aggregate(
+        clientes=Count("cliente_id", distinct=True), ventas=Count("id"),
+        saldo_total=Coalesce(Sum("saldo"), Value(Decimal("0.00"))), **tramos,
+    )
+    datos["saldo"] = datos.pop("saldo_total")  # mismo nombre que en las filas
+    return {k: str(v) if isinstance(v, Decimal) else v for k, v in datos.items()}
@@ -1,6 +1,5 @@
 # serializers.py
 from rest_framework import serializers
-from django.db.models import Sum
 from .models import CodigoDescuento, Venta, DetalleVenta, MetodoPago
 
 
@@ -14,7 +13,7 @@ class CodigoDescuentoSerializer(serializers.ModelSerializer):
         fields = [
             "id", "empresa", "empresa_nombre",
             "codigo", "descuento", "tipo_descuento",
-            "cantidad", "restantes",
+            "cantidad", "restantes", "bloque_reserva",
             "usuario", "usuario_nombre",
             "usable",
             "is_active", "created_at", "updated_at", "created_by", "updated_by",
@@ -56,7 +55,10 @@ class DetalleVentaSerializer(serializers.ModelSerializer):
     class Meta:
         model = DetalleVenta
         fields = "__all__"
-        read_only_fields = ("created_at", "updated_at", "created_by", "updated_by", "is_active")
+        read_only_fields = (
+            "created_at", "updated_at", "created_by", "updated_by", "is_active",
+            "cantidad_devuelta", "importe_devuelto",
+        )
 
     def validate(self, data):
         if not data.get("plan") and not data.get("producto"):
@@ -68,24 +70,10 @@ class DetalleVentaSerializer(serializers.ModelSerializer):
 
 class _VentaBaseSerializer(serializers.ModelSerializer):
     cliente_nombre = serializers.SerializerMethodField()
-    total_pagado   = serializers.SerializerMethodField()
-    saldo          = serializers.SerializerMethodField()
 
     def get_cliente_nombre(self, obj):
         return getattr(obj.cliente, "nombre_completo", None) or str(obj.cliente)
 
-    def get_total_pagado(self, obj):
-        val = getattr(obj, "total_pagado", None)
-        if val is not None:
-            return str(val)
-        return str(obj.pagos.aggregate(s=Sum("importe"))["s"] or 0)
-
-    def get_saldo(self, obj):
-        pagado = getattr(obj, "total_pagado", None)
-        if pagado is None:
-            pagado = obj.pagos.aggregate(s=Sum("importe"))["s"] or 0
-        return str((obj.total or 0) - (pagado or 0))
-
     class Meta:
         model  = Venta
         # Campos comunes a ambos serializers
@@ -95,11 +83,15 @@ class _VentaBaseSerializer(serializers.ModelSerializer):
             "subtotal", "descuento_monto", "impuesto_monto", "total", "importe",
             "referencia_pago", "notas", "procesado",
             "uso_cfdi", "uuid_cfdi", "serie", "folio_fiscal",
-            "tipo_venta",
+            "tipo_venta", "estado", "uuid_cliente",
             "cliente_nombre", "total_pagado", "saldo",
             "created_at", "updated_at", "created_by", "updated_by", "is_active",
         )
-        read_only_fields = ("created_at", "updated_at", "created_by", "updated_by", "is_active")
+        # total_pagado/saldo: columnas mantenidas por MetodoPago (ver Venta.save).
+        read_only_fields = (
+            "created_at", "updated_at", "created_by", "updated_by", "is_active",
+            "total_pagado", "saldo", "uuid_cliente", "estado",
+        )
 
 
 class VentaListSerializer(_VentaBaseSerializer):
@@ -113,7 +105,7 @@ class VentaListSerializer(_VentaBaseSerializer):
             "id", "folio", "fecha",
             "empresa", "cliente",
             "subtotal", "descuento_monto", "impuesto_monto", "total", "importe",
-            "tipo_venta",
+            "tipo_venta", "estado",
             "cliente_nombre", "total_pagado", "saldo",
         )
 
@@ -0,0 +1,1064 @@
+# ventas/services.py
+import uuid
+from collections import defaultdict
+from datetime import datetime, time
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from functools import partial
+
+from django.db import IntegrityError, transaction
+from django.db.models import (
+    F, Q, Sum, Count, Value, Case, When, OuterRef, Subquery, CharField, DecimalField,
+)
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils import timezone
+
+from clientes.models import Cliente
+from inventario.models import Almacen, Producto, MovimientoProducto
+from inventario.services import bloquear_existencias, aplicar_movimientos
+from planes.models import PrecioPlan
+from .folios import FolioError, asignar_folio
+from .reportes import invalidar_reportes
+from .timbrado import encolar_timbrado
+from .models import (
+    CodigoDescuento, ReservaCodigoDescuento, Venta, DetalleVenta, MetodoPago, ResumenVentaDiario,
+    TrabajoTimbrado,
+)
+
+
+DOS_DECIMALES = Decimal("0.01")
+
+
+class VentaError(Exception):
+    """Error de validación de una venta (se responde como 400)."""
+    def __init__(self, detail, **extra):
+        super().__init__(detail)
+        self.detail = detail
+        self.extra = extra
+
+
+def aplicar_pagos(pagos, revertir=False):
+    """
+    Refleja en Venta.total_pagado/saldo una lista de MetodoPago ya guardados (o
+    a punto de borrarse, con revertir=True). Agrupa por venta y aplica un UPDATE
+    con F() por venta, así que dos cajeros cobrando la misma venta no se pisan.
+    También acumula el importe en el rollup diario por forma de pago; solo los
+    cobros (importe > 0) cuentan como operación, los reembolsos no.
+    """
+    signo = -1 if revertir else 1
+    deltas = defaultdict(Decimal)
+    por_forma = defaultdict(lambda: [0, Decimal("0")])
+    for pago in pagos:
+        importe = signo * Decimal(str(pago.importe))
+        deltas[pago.venta_id] += importe
+        acumulado = por_forma[(pago.venta_id, pago.forma_pago or "")]
+        acumulado[0] += signo if Decimal(str(pago.importe)) > 0 else 0
+        acumulado[1] += importe
+    deltas = {k: v for k, v in deltas.items() if v}
+    if not deltas:
+        return
+    ventas = {
+        v_id: (emp_id, suc_id, fecha_resumen(fecha))
+        for v_id, emp_id, suc_id, fecha in (
+            Venta.objects.filter(pk__in=list(deltas)).values_list("id", "empresa_id", "sucursal_id", "fecha")
+        )
+    }
+    resumen = defaultdict(nuevo_acumulado)
+    for (venta_id, forma), (operaciones, importe) in por_forma.items():
+        if venta_id in ventas:
+            acumulado = resumen[ventas[venta_id] + (ResumenVentaDiario.Dimension.FORMA_PAGO, forma)]
+            acumulado[0] += operaciones
+            acumulado[2] += importe
+    with transaction.atomic():
+        for venta_id, delta in deltas.items():
+            Venta.objects.filter(pk=venta_id).update(
+                total_pagado=F("total_pagado") + delta,
+                saldo=F("saldo") - delta,
+            )
+        acumular_resumen(resumen)
+
+
+# -----------------------------
+# Rollup diario (ResumenVentaDiario)
+# -----------------------------
+def fecha_resumen(fecha):
+    """Día (zona horaria actual) al que se imputa una venta en el rollup."""
+    return timezone.localdate(fecha) if timezone.is_aware(fecha) else fecha.date()
+
+
+def nuevo_acumulado():
+    """[operaciones, cantidad, importe] por llave del rollup."""
+    return [0, 0, Decimal("0")]
+
+
+def deltas_resumen_venta(venta, detalles, pagos, signo=1):
+    """
+    Acumulados del rollup para una venta con sus renglones y pagos:
+    {(empresa_id, sucursal_id, fecha, dimension, clave): [operaciones, cantidad, importe]}.
+    signo=-1 para descontarla (anulación).
+    """
+    base = (venta.empresa_id, venta.sucursal_id, fecha_resumen(venta.fecha))
+    resumen = defaultdict(nuevo_acumulado)
+
+    acumulado = resumen[base + (ResumenVentaDiario.Dimension.VENTA, "")]
+    acumulado[0] += signo
+    acumulado[2] += signo * venta.total
+    for det in detalles:
+        acumulado = resumen[base + (ResumenVentaDiario.Dimension.ITEM_TIPO, det.item_tipo or "")]
+        acumulado[0] += signo
+        acumulado[1] += signo * det.cantidad
+        acumulado[2] += signo * det.total
+    for pago in pagos:
+        acumulado = resumen[base + (ResumenVentaDiario.Dimension.FORMA_PAGO, pago.forma_pago or "")]
+        acumulado[0] += signo if pago.importe > 0 else 0
+        acumulado[2] += signo * pago.importe
+    return resumen
+
+
+def acumular_resumen(deltas):
+    """
+    Suma `deltas` (ver `deltas_resumen_venta`) a ResumenVentaDiario: asegura las
+    filas con bulk_create(ignore_conflicts) y aplica un UPDATE con F() por llave,
+    en orden fijo para que dos cajas concurrentes no se bloqueen mutuamente.
+    Debe llamarse al final de la transacción: la fila del día es compartida por
+    todas las cajas de la sucursal y queda bloqueada hasta el commit.
+    """
+    deltas = {k: v for k, v in deltas.items() if any(v)}
+    if not deltas:
+        return
+    # Los reportes cacheados de la empresa quedan viejos al confirmar.
+    for e in {llave[0] for llave in deltas}:
+        transaction.on_commit(partial(invalidar_reportes, e))
+    ahora = timezone.now()
+    with transaction.atomic():
+        ResumenVentaDiario.objects.bulk_create(
+            [
+                ResumenVentaDiario(empresa_id=e, sucursal_id=suc, fecha=f, dimension=d, clave=c)
+                for (e, suc, f, d, c) in deltas
+            ],
+            ignore_conflicts=True,
+        )
+        for llave in sorted(deltas, key=lambda k: (k[0], k[1] or 0, k[2], k[3], k[4])):
+            e, suc, f, d, c = llave
+            operaciones, cantidad, importe = deltas[llave]
+            ResumenVentaDiario.objects.filter(
+                empresa_id=e, sucursal_id=suc, fecha=f, dimension=d, clave=c,
+            ).update(
+                operaciones=F("operaciones") + operaciones,
+                cantidad=F("cantidad") + cantidad,
+                importe=F("importe") + importe,
+                updated_at=ahora,
+            )
+
+
+def recalcular_resumen(empresa_id, desde, hasta):
+    """
+    Reconstruye ResumenVentaDiario de `empresa_id` para los días [desde, hasta]
+    con tres GROUP BY (ventas, pagos, renglones), netos de devoluciones
+    (las ventas anuladas y los reembolsos no cuentan como operación). Devuelve filas creadas.
+    """
+    ventas = Venta.objects.filter(empresa_id=empresa_id, fecha__date__gte=desde, fecha__date__lte=hasta)
+    filas = []
+    for row in (ventas.annotate(dia=TruncDate("fecha"))
+                .values("sucursal_id", "dia")
+                .annotate(n=Count("id", filter=~Q(estado=Venta.Estado.ANULADA)), imp=Sum("total"))
+                .order_by()):
+        filas.append(ResumenVentaDiario(
+            empresa_id=empresa_id, sucursal_id=row["sucursal_id"], fecha=row["dia"],
+            dimension=ResumenVentaDiario.Dimension.VENTA, clave="",
+            operaciones=row["n"], importe=row["imp"] or 0,
+        ))
+
+    pagos = defaultdict(nuevo_acumulado)
+    for row in (MetodoPago.objects.filter(venta__in=ventas)
+                .annotate(dia=TruncDate("venta__fecha"))
+                .values("venta__sucursal_id", "dia", "forma_pago")
+                .annotate(n=Count("id", filter=Q(importe__gt=0)), imp=Sum("importe"))
+                .order_by()):
+        # forma_pago NULL y '' caen en la misma llave.
+        acumulado = pagos[(row["venta__sucursal_id"], row["dia"], row["forma_pago"] or "")]
+        acumulado[0] += row["n"]
+        acumulado[2] += row["imp"] or 0
+    for (suc, dia, forma), (n, _, imp) in pagos.items():
+        filas.append(ResumenVentaDiario(
+            empresa_id=empresa_id, sucursal_id=suc, fecha=dia,
+            dimension=ResumenVentaDiario.Dimension.FORMA_PAGO, clave=forma,
+            operaciones=n, importe=imp,
+        ))
+
+    # Renglones anteriores sin item_tipo: se deduce de producto/plan.
+    item_tipo = Coalesce(
+        "item_tipo",
+        Case(
+            When(producto__isnull=False, then=Value(DetalleVenta.ItemTipo.PRODUCTO)),
+            When(plan__isnull=False, then=Value(DetalleVenta.ItemTipo.PLAN)),
+            default=Value(""),
+        ),
+        output_field=CharField(),
+    )
+    for row in (DetalleVenta.objects.filter(venta__in=ventas)
+                .annotate(dia=TruncDate("venta__fecha"), tipo=item_tipo)
+                .values("venta__sucursal_id", "dia", "tipo")
+                .annotate(
+                    n=Count("id", filter=Q(cantidad_devuelta__lt=F("cantidad"))),
+                    cant=Sum(F("cantidad") - F("cantidad_devuelta")),
+                    imp=Sum(F("total") - F("importe_devuelto")),
+                )
+                .order_by()):
+        filas.append(ResumenVentaDiario(
+            empresa_id=empresa_id, sucursal_id=row["venta__sucursal_id"], fecha=row["dia"],
+            dimension=ResumenVentaDiario.Dimension.ITEM_TIPO, clave=row["tipo"],
+            operaciones=row["n"], cantidad=row["cant"] or 0, importe=row["imp"] or 0,
+        ))
+
+    with transaction.atomic():
+        ResumenVentaDiario.objects.filter(empresa_id=empresa_id, fecha__gte=desde, fecha__lte=hasta).delete()
+        creadas = ResumenVentaDiario.objects.bulk_create(filas, batch_size=1000)
+    return len(creadas)
+
+
+def pagado_por_venta():
+    """Subquery: suma de MetodoPago.importe de la venta externa (0 si no hay pagos)."""
+    pagado = (
+        MetodoPago.objects.filter(venta=OuterRef("pk"))
+        .values("venta").annotate(s=Sum("importe")).values("s")
+    )
+    return Coalesce(Subquery(pagado), Value(0), output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+def reconciliar_pagos(empresa_id=None, corregir=True, tamano_lote=1000):
+    """
+    Compara Venta.total_pagado/saldo contra la suma real de sus pagos.
+    Con corregir=True reescribe las ventas desfasadas (bulk_update por lotes).
+    Devuelve la lista de ids desfasados.
+    """
+    ventas = Venta.objects.all()
+    if empresa_id:
+        ventas = ventas.filter(empresa_id=empresa_id)
+    desfasadas = (
+        ventas
+        .annotate(pagado_real=pagado_por_venta())
+        .filter(~Q(total_pagado=F("pagado_real")) | ~Q(saldo=F("total") - F("pagado_real")))
+        .values_list("id", "total", "pagado_real")
+    )
+    ids, lote = [], []
+    for venta_id, total, pagado in desfasadas.iterator(chunk_size=tamano_lote):
+        ids.append(venta_id)
+        lote.append(Venta(id=venta_id, total_pagado=pagado, saldo=total - pagado))
+        if corregir and len(lote) >= tamano_lote:
+            Venta.objects.bulk_update(lote, ["total_pagado", "saldo"])
+            lote = []
+    if corregir and lote:
+        Venta.objects.bulk_update(lote, ["total_pagado", "saldo"])
+    return ids
+
+
+def kpis_ventas(empresa_id, desde, hasta, sucursal_id=None):
+    """
+    KPIs del tablero leídos solo de ResumenVentaDiario (índice empresa/fecha/dimension):
+    totales, serie por día y desgloses por sucursal, forma de pago y tipo de renglón.
+    """
+    filas = ResumenVentaDiario.objects.filter(empresa_id=empresa_id, fecha__gte=desde, fecha__lte=hasta)
+    if sucursal_id:
+        filas = filas.filter(sucursal_id=sucursal_id)
+
+    def agrupar(dimension, *campos):
+        return list(
+            filas.filter(dimension=dimension)
+            .values(*campos)
+            .annotate(operaciones=Sum("operaciones"), cantidad=Sum("cantidad"), importe=Sum("importe"))
+            .order_by(*campos)
+        )
+
+    Dim = ResumenVentaDiario.Dimension
+    por_dia = agrupar(Dim.VENTA, "fecha")
+    ventas = sum(r["operaciones"] for r in por_dia)
+    importe = sum((r["importe"] for r in por_dia), Decimal("0.00"))
+    ticket = (importe / ventas).quantize(DOS_DECIMALES) if ventas else Decimal("0.00")
+    # Importes como texto (igual que pos_checkout) para no perder precisión en JSON.
+    return {
+        "desde": desde,
+        "hasta": hasta,
+        "sucursal": sucursal_id,
+        "totales": {"ventas": ventas, "importe": str(importe), "ticket_promedio": str(ticket)},
+        "por_dia": [
+            {"fecha": r["fecha"], "ventas": r["operaciones"], "importe": str(r["importe"])}
+            for r in por_dia
+        ],
+        "por_sucursal": [
+            {"sucursal": r["sucursal_id"], "ventas": r["operaciones"], "importe": str(r["importe"])}
+            for r in agrupar(Dim.VENTA, "sucursal_id")
+        ],
+        "por_forma_pago": [
+            {"forma_pago": r["clave"], "pagos": r["operaciones"], "importe": str(r["importe"])}
+            for r in agrupar(Dim.FORMA_PAGO, "clave")
+        ],
+        "por_item_tipo": [
+            {"item_tipo": r["clave"], "renglones": r["operaciones"], "cantidad": r["cantidad"],
+             "importe": str(r["importe"])}
+            for r in agrupar(Dim.ITEM_TIPO, "clave")
+        ],
+    }
+
+
+# -----------------------------
+# Canje de códigos de descuento
+# -----------------------------
+def _descontar_codigo(codigo_id, usos):
+    """UPDATE condicional: resta `usos` solo si alcanzan. Sin SELECT ... FOR UPDATE."""
+    return CodigoDescuento.objects.filter(pk=codigo_id, is_active=True, restantes__gte=usos).update(
+        restantes=F("restantes") - usos, updated_at=timezone.now(),
+    ) == 1
+
+
+def canjear_codigo(cd, sucursal_id=None):
+    """
+    Consume un uso de `cd` de forma atómica y devuelve True si se pudo.
+    - Sin reserva (bloque_reserva=0) o sin sucursal: UPDATE condicional
+      `restantes = restantes - 1 WHERE restantes > 0` sobre la fila del código.
+    - Con reserva: descuenta del bloque de la sucursal; al agotarse toma un
+      bloque nuevo del código (un solo UPDATE por bloque). Si ya no queda un
+      bloque completo, cae al canje directo de un uso.
+    Dentro de una transacción, la fila tocada queda bloqueada solo hasta el commit.
+    """
+    if cd.bloque_reserva and sucursal_id:
+        reserva = ReservaCodigoDescuento.objects.filter(codigo_id=cd.pk, sucursal_id=sucursal_id)
+        if reserva.filter(disponibles__gt=0).update(disponibles=F("disponibles") - 1):
+            return True
+        with transaction.atomic():
+            if _descontar_codigo(cd.pk, cd.bloque_reserva):
+                ReservaCodigoDescuento.objects.bulk_create(
+                    [ReservaCodigoDescuento(codigo_id=cd.pk, sucursal_id=sucursal_id)], ignore_conflicts=True,
+                )
+                reserva.update(disponibles=F("disponibles") + cd.bloque_reserva - 1)
+                return True
+    return _descontar_codigo(cd.pk, 1)
+
+
+def liberar_reservas(cd):
+    """Devuelve al código los usos reservados por sucursal que no se canjearon."""
+    with transaction.atomic():
+        reservas = list(
+            ReservaCodigoDescuento.objects.select_for_update().filter(codigo_id=cd.pk, disponibles__gt=0)
+        )
+        liberados = sum(r.disponibles for r in reservas)
+        if liberados:
+            ReservaCodigoDescuento.objects.filter(pk__in=[r.pk for r in reservas]).update(disponibles=0)
+            CodigoDescuento.objects.filter(pk=cd.pk).update(restantes=F("restantes") + liberados)
+    return liberados
+
+
+def _parse_items(items):
+    """Normaliza las líneas del POS (el precio lo resuelve `cotizar`). Lanza VentaError."""
+    lineas = []
+    for it in items:
+        try:
+            qty = int(it.get("cantidad", 0))
+            producto_id = int(it["producto"]) if it.get("producto") else None
+            plan_id = int(it["plan"]) if it.get("plan") else None
+            precio_plan_id = int(it["precio_plan"]) if it.get("precio_plan") else None
+        except (TypeError, ValueError, AttributeError):
+            raise VentaError("Renglón inválido (producto/plan/cantidad).")
+        if qty <= 0:
+            raise VentaError("Cantidad inválida.")
+        if bool(producto_id) == bool(plan_id or precio_plan_id):
+            raise VentaError("Cada renglón debe indicar un producto o un plan.")
+        lineas.append({
+            "producto_id": producto_id,
+            "plan_id": plan_id,
+            "precio_plan_id": precio_plan_id,
+            "esquema": (it.get("esquema") or "").strip().lower(),
+            "tipo": (it.get("tipo") or "").strip().lower(),
+            "cantidad": qty,
+        })
+    return lineas
+
+
+def _parse_pagos(pagos):
+    """Normaliza los pagos [(forma_pago, importe)] y devuelve su suma. Lanza VentaError."""
+    parsed = []
+    total = Decimal("0.00")
+    for p in pagos:
+        try:
+            imp = Decimal(str(p.get("importe", "0")))
+        except (TypeError, ValueError, AttributeError, InvalidOperation):
+            raise VentaError("Importe de pago inválido.")
+        if imp <= 0:
+            raise VentaError("Importe de pago debe ser > 0.")
+        parsed.append(((p.get("forma_pago") or "").strip().lower(), imp))
+        total += imp
+    return parsed, total
+
+
+def _calcular_descuento(cd, subtotal):
+    if cd is None:
+        return Decimal("0.00")
+    if cd.tipo_descuento == CodigoDescuento.Tipo.PORCENTAJE:
+        descuento = (subtotal * cd.descuento) / Decimal("100")
+    else:
+        descuento = cd.descuento
+    return min(descuento, subtotal)
+
+
+# -----------------------------
+# Precios e impuestos (cotización)
+# -----------------------------
+IVA_TASA_DEFAULT = Decimal("16.00")  # Producto.aplicar_iva sin iva_porcentaje
+IEPS_TASA = Decimal("8.00")         # Producto.aplicar_ieps
+CIEN = Decimal("100")
+
+
+def _centavos(valor):
+    return valor.quantize(DOS_DECIMALES, rounding=ROUND_HALF_UP)
+
+
+def cargar_catalogo(empresa_id, lineas):
+    """
+    Precios vigentes para `lineas` (de una o varias ventas) con una consulta por
+    modelo: {"productos": {id: Producto}, "planes": {plan_id: [PrecioPlan]},
+    "precios_plan": {id: PrecioPlan}}.
+    """
+    producto_ids = {ln["producto_id"] for ln in lineas if ln["producto_id"]}
+    plan_ids = {ln["plan_id"] for ln in lineas if ln["plan_id"]}
+    precio_ids = {ln["precio_plan_id"] for ln in lineas if ln["precio_plan_id"]}
+    catalogo = {"productos": {}, "planes": defaultdict(list), "precios_plan": {}}
+    if producto_ids:
+        catalogo["productos"] = {
+            p.id: p for p in Producto.objects.filter(empresa_id=empresa_id, id__in=producto_ids)
+            .only("id", "nombre", "precio", "aplicar_iva", "aplicar_ieps", "iva_porcentaje")
+        }
+    if plan_ids or precio_ids:
+        precios = (
+            PrecioPlan.objects
+            .filter(Q(plan_id__in=plan_ids) | Q(id__in=precio_ids),
+                    plan__empresa_id=empresa_id, plan__is_active=True, is_active=True)
+            .select_related("plan")
+            .only("id", "plan_id", "esquema", "tipo", "precio", "plan__nombre")
+            .order_by("id")
+        )
+        for pp in precios:
+            catalogo["planes"][pp.plan_id].append(pp)
+            catalogo["precios_plan"][pp.id] = pp
+    return catalogo
+
+
+def _precio_plan(ln, catalogo):
+    """PrecioPlan del renglón: por id, por esquema/tipo, o el único que tenga el plan."""
+    if ln["precio_plan_id"]:
+        pp = catalogo["precios_plan"].get(ln["precio_plan_id"])
+        if pp is None or (ln["plan_id"] and pp.plan_id != ln["plan_id"]):
+            raise VentaError("Precio de plan inválido.", precio_plan=ln["precio_plan_id"])
+        return pp
+    opciones = [
+        pp for pp in catalogo["planes"].get(ln["plan_id"], [])
+        if (not ln["esquema"] or pp.esquema == ln["esquema"]) and (not ln["tipo"] or pp.tipo == ln["tipo"])
+    ]
+    if not opciones:
+        raise VentaError("El plan no tiene precio para ese esquema/tipo.", plan=ln["plan_id"])
+    if len(opciones) > 1:
+        raise VentaError("Indica esquema y tipo (o precio_plan) del plan.", plan=ln["plan_id"])
+    return opciones[0]
+
+
+def cotizar(lineas, catalogo, cd=None):
+    """
+    Pone precio a un carrito en memoria (sin consultas) con `catalogo` de `cargar_catalogo`:
+      - Productos: Producto.precio; IEPS (8%) si aplicar_ieps e IVA
+        (iva_porcentaje, 16% si es 0) si aplicar_iva, sobre la base ya con
+        descuento. El IVA grava también el IEPS.
+      - Planes: PrecioPlan, sin impuestos.
+      - El descuento del cupón se prorratea entre renglones según su subtotal;
+        el residuo de centavos va al renglón más grande.
+    Decimal redondeado a centavos por renglón; los totales son la suma de renglones.
+    Devuelve {"lineas": [...], "subtotal", "descuento", "impuestos", "total"}. Lanza VentaError.
+    """
+    renglones = []
+    for ln in lineas:
+        if ln["producto_id"]:
+            prod = catalogo["productos"].get(ln["producto_id"])
+            if prod is None:
+                raise VentaError("Productos inválidos para la empresa.", productos=[ln["producto_id"]])
+            precio, descripcion = prod.precio, prod.nombre
+            iva = (prod.iva_porcentaje or IVA_TASA_DEFAULT) if prod.aplicar_iva else Decimal("0")
+            ieps = IEPS_TASA if prod.aplicar_ieps else Decimal("0")
+        else:
+            pp = _precio_plan(ln, catalogo)
+            precio = pp.precio
+            descripcion = f"{pp.plan.nombre} ({pp.esquema}/{pp.tipo})"[:255]
+            iva = ieps = Decimal("0")
+            ln = {**ln, "plan_id": pp.plan_id, "precio_plan_id": pp.id}
+        renglones.append({
+            **ln,
+            "descripcion": descripcion,
+            "precio_unitario": precio,
+            "subtotal": _centavos(precio * ln["cantidad"]),
+            "iva_pct": iva,
+            "ieps_pct": ieps,
+        })
+
+    subtotal = sum((r["subtotal"] for r in renglones), Decimal("0.00"))
+    descuento = _centavos(_calcular_descuento(cd, subtotal))
+    for r in renglones:
+        r["descuento_monto"] = _centavos(descuento * r["subtotal"] / subtotal) if subtotal else Decimal("0.00")
+    if renglones:
+        mayor = max(renglones, key=lambda r: r["subtotal"])
+        mayor["descuento_monto"] += descuento - sum(r["descuento_monto"] for r in renglones)
+
+    for r in renglones:
+        base = r["subtotal"] - r["descuento_monto"]
+        r["ieps_monto"] = _centavos(base * r["ieps_pct"] / CIEN)
+        r["iva_monto"] = _centavos((base + r["ieps_monto"]) * r["iva_pct"] / CIEN)
+        r["impuesto_monto"] = r["ieps_monto"] + r["iva_monto"]
+        r["total"] = base + r["impuesto_monto"]
+
+    return {
+        "lineas": renglones,
+        "subtotal": subtotal,
+        "descuento": descuento,
+        "impuestos": sum((r["impuesto_monto"] for r in renglones), Decimal("0.00")),
+        "total": sum((r["total"] for r in renglones), Decimal("0.00")),
+    }
+
+
+def _leer_codigo(empresa_id, codigo):
+    """Cupón activo por código (sin bloqueo; el uso se consume con `canjear_codigo`)."""
+    if not codigo:
+        return None
+    return CodigoDescuento.objects.filter(empresa_id=empresa_id, codigo=codigo, is_active=True).first()
+
+
+def _validar_codigo(codigo, cd):
+    if codigo:
+        if cd is None:
+            raise VentaError("Código de descuento inválido.")
+        if cd.restantes <= 0 and not cd.bloque_reserva:
+            raise VentaError("El código no tiene usos disponibles.")
+
+
+def cotizar_venta(empresa_id, items, codigo_descuento=""):
+    """
+    Cotización del POS sin escribir nada: precios, descuento e impuestos de
+    todo el carrito con una consulta por modelo (productos, precios de plan, cupón).
+    """
+    if not empresa_id or not items:
+        raise VentaError("Faltan campos obligatorios (empresa, items).")
+    lineas = _parse_items(items)
+    codigo = (codigo_descuento or "").strip().upper()
+    cd = _leer_codigo(empresa_id, codigo)
+    _validar_codigo(codigo, cd)
+    cotizacion = cotizar(lineas, cargar_catalogo(empresa_id, lineas), cd)
+    cotizacion["codigo_descuento"] = cd.codigo if cd else None
+    return cotizacion
+
+
+def _preparar_venta(empresa_id, cliente_id, items, pagos=None, codigo_descuento="", fecha=None,
+                    facturar=False, uso_cfdi=None):
+    """Valida en memoria (sin consultas) una venta del POS. Lanza VentaError."""
+    if not empresa_id or not cliente_id or not items:
+        raise VentaError("Faltan campos obligatorios (empresa, cliente, items).")
+    try:
+        cliente_id = int(cliente_id)
+    except (TypeError, ValueError):
+        raise VentaError("Cliente inválido.")
+
+    lineas = _parse_items(items)
+    pagos_in, total_pagos = _parse_pagos(pagos or [])
+    if isinstance(fecha, str):
+        dia = parse_date(fecha) if len(fecha) <= 10 else None
+        fecha = datetime.combine(dia, time.min) if dia else parse_datetime(fecha)
+        if fecha is None:
+            raise VentaError("fecha inválida.")
+    if fecha and timezone.is_naive(fecha):
+        fecha = timezone.make_aware(fecha)
+
+    requeridos = defaultdict(int)
+    for ln in lineas:
+        if ln["producto_id"]:
+            requeridos[ln["producto_id"]] += ln["cantidad"]
+    return {
+        "cliente_id": cliente_id,
+        "lineas": lineas,
+        "pagos": pagos_in,
+        "total_pagos": total_pagos,
+        "codigo": (codigo_descuento or "").strip().upper(),
+        "fecha": fecha or timezone.now(),
+        "requeridos": dict(requeridos),
+        "facturar": bool(facturar),
+        "uso_cfdi": (uso_cfdi or "").strip().upper() or None,
+    }
+
+
+def _crear_venta(empresa_id, prep, almacen, cd, saldos, catalogo, usuario=None, uuid_cliente=None):
+    """
+    Registra una venta ya preparada (`_preparar_venta`) dentro de la transacción
+    de quien llama. `saldos` debe venir de un `bloquear_existencias` que cubra
+    los productos de la venta; el stock se valida contra esas filas en memoria.
+    `cd` es el cupón ya leído (None si no se encontró) y `catalogo` viene de
+    `cargar_catalogo`: los precios e impuestos los calcula `cotizar`, no el
+    cliente. El folio sale de una secuencia (ver ventas.folios), sin bloquear a
+    otras cajas. No toca el rollup.
+    Lanza VentaError. Devuelve (venta, detalles, pagos).
+    """
+    _validar_codigo(prep["codigo"], cd)
+    cotizacion = cotizar(prep["lineas"], catalogo, cd)
+    lineas, requeridos, total = cotizacion["lineas"], prep["requeridos"], cotizacion["total"]
+    if prep["pagos"] and prep["total_pagos"] != total:
+        raise VentaError(f"La suma de pagos ({prep['total_pagos']}) debe ser igual al total ({total}).")
+
+    mueve_stock = bool(almacen and requeridos)
+    if mueve_stock:
+        faltantes = [
+            {"producto": p, "disponible": saldos[(p, almacen.id)].cantidad, "requerido": q}
+            for p, q in requeridos.items()
+            if saldos[(p, almacen.id)].cantidad < q
+        ]
+        if faltantes:
+            f = faltantes[0]
+            raise VentaError(
+                f"Stock insuficiente para producto {f['producto']}. "
+                f"Disponible: {f['disponible']}, requerido: {f['requerido']}",
+                faltantes=faltantes,
+            )
+
+    tiene_planes = any(ln["plan_id"] for ln in lineas)
+    tipo_venta = "MIXTO" if requeridos and tiene_planes else ("PLAN" if tiene_planes else "PRODUCTO")
+    sucursal_id = almacen.sucursal_id if almacen else None
+    try:
+        serie, folio = asignar_folio(empresa_id, sucursal_id, prep["fecha"])
+    except FolioError as e:
+        raise VentaError(e.detail)
+    venta = Venta.objects.create(
+        empresa_id=empresa_id,
+        cliente_id=prep["cliente_id"],
+        sucursal_id=sucursal_id,
+        usuario=usuario,
+        fecha=prep["fecha"],
+        folio=folio,
+        serie=serie,
+        uso_cfdi=prep["uso_cfdi"],
+        uuid_cliente=uuid_cliente,
+        tipo_venta=tipo_venta,
+        importe=total,
+        total_pagado=prep["total_pagos"],
+        subtotal=cotizacion["subtotal"],
+        descuento_monto=cotizacion["descuento"],
+        impuesto_monto=cotizacion["impuestos"],
+        total=total,
+        created_by=usuario,
+        updated_by=usuario,
+    )
+
+    detalles = DetalleVenta.objects.bulk_create([
+        DetalleVenta(
+            venta=venta,
+            item_tipo=DetalleVenta.ItemTipo.PRODUCTO if ln["producto_id"] else DetalleVenta.ItemTipo.PLAN,
+            item_id=ln["producto_id"] or ln["plan_id"],
+            producto_id=ln["producto_id"],
+            plan_id=ln["plan_id"],
+            almacen=almacen if ln["producto_id"] else None,
+            descripcion=ln["descripcion"],
+            codigo_descuento=cd,
+            cantidad=ln["cantidad"],
+            precio_unitario=ln["precio_unitario"],
+            descuento_monto=ln["descuento_monto"],
+            impuesto_pct=ln["iva_pct"],             # tasa de IVA; impuesto_monto incluye IEPS
+            impuesto_monto=ln["impuesto_monto"],
+            subtotal=ln["subtotal"],
+            total=ln["total"],
+            created_by=usuario,
+            updated_by=usuario,
+        )
+        for ln in lineas
+    ])
+
+    if mueve_stock:
+        movimientos = MovimientoProducto.objects.bulk_create([
+            MovimientoProducto(
+                empresa_id=empresa_id,
+                producto_id=ln["producto_id"],
+                almacen_id=almacen.id,
+                tipo_movimiento=MovimientoProducto.TipoMovimiento.SALIDA,
+                cantidad=ln["cantidad"],
+                fecha=prep["fecha"],
+                created_by=usuario,
+                updated_by=usuario,
+            )
+            for ln in lineas if ln["producto_id"]
+        ])
+        aplicar_movimientos(movimientos, saldos=saldos)
+
+    # bulk_create no pasa por MetodoPago.save: total_pagado ya se fijó al crear la venta.
+    pagos_out = MetodoPago.objects.bulk_create([
+        MetodoPago(venta=venta, forma_pago=forma, importe=imp, created_by=usuario, updated_by=usuario)
+        for forma, imp in prep["pagos"]
+    ])
+
+    if cd and not canjear_codigo(cd, sucursal_id=venta.sucursal_id):
+        raise VentaError("El código no tiene usos disponibles.")
+    if prep["facturar"]:
+        # Solo se encola: el PAC se llama fuera de la transacción (manage.py timbrar_ventas).
+        encolar_timbrado(venta)
+    return venta, detalles, pagos_out
+
+
+def registrar_venta_pos(empresa_id, cliente_id, items, pagos=None, almacen_id=None,
+                        codigo_descuento="", fecha=None, usuario=None, facturar=False, uso_cfdi=None):
+    """
+    Cierra una venta del POS como un pipeline por conjuntos:
+      1. Valida líneas y pagos en memoria (sin consultas).
+      2. Valida almacén y carga precios de productos y planes con una consulta
+         por modelo; precios, descuento e impuestos salen de `cotizar`.
+      3. En la transacción: bloquea, en una sola consulta, los saldos
+         de todos los productos (orden de id); valida el stock de todas las
+         líneas agrupadas por producto contra esas filas.
+      4. Inserta detalles, movimientos SALIDA y pagos con bulk_create y aplica
+         los movimientos sobre las filas ya bloqueadas.
+      5. Consume el cupón (UPDATE condicional, ver `canjear_codigo`) y acumula
+         la venta en el rollup diario (ResumenVentaDiario).
+      6. Con facturar=True encola el timbrado CFDI (ver ventas.timbrado).
+    El número de consultas no depende del número de líneas.
+    Lanza VentaError si algo no cuadra. Devuelve (venta, detalles, pagos).
+    """
+    prep = _preparar_venta(empresa_id, cliente_id, items, pagos, codigo_descuento, fecha, facturar, uso_cfdi)
+    requeridos = prep["requeridos"]
+
+    almacen = None
+    if almacen_id:
+        almacen = Almacen.objects.filter(pk=almacen_id, empresa_id=empresa_id).only("id", "sucursal_id").first()
+        if almacen is None:
+            raise VentaError("Almacén inválido.")
+
+    catalogo = cargar_catalogo(empresa_id, prep["lineas"])
+    invalidos = sorted(set(requeridos) - set(catalogo["productos"]))
+    if invalidos:
+        raise VentaError("Productos inválidos para la empresa.", productos=invalidos)
+
+    with transaction.atomic():
+        # El cupón se lee sin bloqueo; el uso se consume al final con un UPDATE condicional.
+        cd = _leer_codigo(empresa_id, prep["codigo"])
+
+        saldos = {}
+        if almacen and requeridos:
+            saldos = bloquear_existencias({(int(empresa_id), p, almacen.id) for p in requeridos})
+        venta, detalles, pagos_out = _crear_venta(empresa_id, prep, almacen, cd, saldos, catalogo, usuario=usuario)
+
+        # Al final: la fila del día se comparte entre cajas y queda bloqueada hasta el commit.
+        acumular_resumen(deltas_resumen_venta(venta, detalles, pagos_out))
+
+    return venta, detalles, pagos_out
+
+
+# -----------------------------
+# Sincronización de ventas fuera de línea
+# -----------------------------
+SYNC_TAMANO_CHUNK = 100
+
+
+def _sync_error(detail, **extra):
+    return {"estado": "error", "detail": detail, **extra}
+
+
+def sincronizar_ventas(empresa_id, ventas, usuario=None, tamano_chunk=SYNC_TAMANO_CHUNK):
+    """
+    Registra un lote de ventas capturadas sin conexión. Cada venta trae el mismo
+    payload que pos_checkout más `uuid` (generado por la caja): si ese uuid ya
+    existe para la empresa se reporta como "duplicada", así que reenviar el lote
+    completo después de un corte es seguro.
+
+    Por cada chunk de `tamano_chunk` ventas:
+      - valida clientes, almacenes, cupones y uuids ya sincronizados y carga
+        precios de productos y planes con una consulta por modelo;
+      - en una sola transacción bloquea de una vez los saldos de todo el chunk
+        y registra cada venta en un savepoint: si una falla (stock, pagos,
+        cupón) se descarta solo esa y el resto del chunk continúa;
+      - acumula el rollup diario del chunk en un solo paso al final.
+    Las ventas se aplican en el orden recibido (el stock de una afecta a las siguientes).
+    Devuelve {uuid: {"estado": "creada" | "duplicada" | "error", ...}}.
+    """
+    empresa_id = int(empresa_id)
+    resultados = {}
+    pendientes = []
+    for i, data in enumerate(ventas):
+        data = data if isinstance(data, dict) else {}
+        try:
+            clave = str(uuid.UUID(str(data.get("uuid"))))
+        except ValueError:
+            resultados[str(data.get("uuid") or f"#{i}")] = _sync_error("uuid inválido.")
+            continue
+        if clave in resultados:
+            continue  # la misma venta reenviada dentro del lote: cuenta una vez
+        try:
+            prep = _preparar_venta(
+                empresa_id, data.get("cliente"), data.get("items") or [], data.get("pagos") or [],
+                data.get("codigo_descuento"), data.get("fecha"),
+                data.get("facturar"), data.get("uso_cfdi"),
+            )
+            almacen_id = int(data["almacen"]) if data.get("almacen") else None
+        except (TypeError, ValueError):
+            resultados[clave] = _sync_error("Almacén inválido.")
+            continue
+        except VentaError as e:
+            resultados[clave] = _sync_error(e.detail, **e.extra)
+            continue
+        resultados[clave] = None
+        pendientes.append((clave, prep, almacen_id))
+
+    for inicio in range(0, len(pendientes), tamano_chunk):
+        chunk = pendientes[inicio:inicio + tamano_chunk]
+        resultados.update(_sincronizar_chunk(empresa_id, chunk, usuario))
+    return resultados
+
+
+def _sincronizar_chunk(empresa_id, chunk, usuario):
+    resultados = {}
+    existentes = {
+        str(u): v for u, v in Venta.objects.filter(
+            empresa_id=empresa_id, uuid_cliente__in=[c for c, _, _ in chunk],
+        ).values_list("uuid_cliente", "id")
+    }
+    almacenes = {
+        a.id: a for a in Almacen.objects.filter(
+            empresa_id=empresa_id, id__in={a for _, _, a in chunk if a},
+        ).only("id", "sucursal_id")
+    }
+    clientes = set(
+        Cliente.objects.filter(id__in={prep["cliente_id"] for _, prep, _ in chunk}).values_list("id", flat=True)
+    )
+    catalogo = cargar_catalogo(empresa_id, [ln for _, prep, _ in chunk for ln in prep["lineas"]])
+    codigos = {prep["codigo"] for _, prep, _ in chunk if prep["codigo"]}
+    cupones = {
+        cd.codigo: cd for cd in CodigoDescuento.objects.filter(
+            empresa_id=empresa_id, codigo__in=codigos, is_active=True,
+        )
+    } if codigos else {}
+
+    validas = []
+    for clave, prep, almacen_id in chunk:
+        if clave in existentes:
+            resultados[clave] = {"estado": "duplicada", "venta_id": existentes[clave]}
+        elif almacen_id and almacen_id not in almacenes:
+            resultados[clave] = _sync_error("Almacén inválido.")
+        elif prep["cliente_id"] not in clientes:
+            resultados[clave] = _sync_error("Cliente inválido.")
+        else:
+            try:
+                cotizar(prep["lineas"], catalogo)  # productos y precios de plan válidos
+            except VentaError as e:
+                resultados[clave] = _sync_error(e.detail, **e.extra)
+                continue
+            validas.append((clave, prep, almacenes.get(almacen_id)))
+
+    if not validas:
+        return resultados
+
+    with transaction.atomic():
+        saldos = bloquear_existencias({
+            (empresa_id, p, almacen.id)
+            for _, prep, almacen in validas if almacen
+            for p in prep["requeridos"]
+        })
+        resumen = defaultdict(nuevo_acumulado)
+        for clave, prep, almacen in validas:
+            try:
+                with transaction.atomic():
+                    venta, detalles, pagos = _crear_venta(
+                        empresa_id, prep, almacen, cupones.get(prep["codigo"]), saldos, catalogo,
+                        usuario=usuario, uuid_cliente=clave,
+                    )
+            except (VentaError, IntegrityError) as e:
+                # El savepoint revirtió la venta: los saldos en memoria vuelven a leerse de la BD.
+                if almacen:
+                    for p in prep["requeridos"]:
+                        saldos[(p, almacen.id)].refresh_from_db(fields=["cantidad", "valor", "costo_promedio"])
+                if isinstance(e, VentaError):
+                    resultados[clave] = _sync_error(e.detail, **e.extra)
+                else:
+                    # Otra sincronización concurrente registró el mismo uuid.
+                    venta_id = (
+                        Venta.objects.filter(empresa_id=empresa_id, uuid_cliente=clave)
+                        .values_list("id", flat=True).first()
+                    )
+                    resultados[clave] = (
+                        {"estado": "duplicada", "venta_id": venta_id} if venta_id
+                        else _sync_error("Error de integridad al registrar la venta.")
+                    )
+                continue
+            for llave, (operaciones, cantidad, importe) in deltas_resumen_venta(venta, detalles, pagos).items():
+                acumulado = resumen[llave]
+                acumulado[0] += operaciones
+                acumulado[1] += cantidad
+                acumulado[2] += importe
+            resultados[clave] = {"estado": "creada", "venta_id": venta.id, "total": str(venta.total)}
+        acumular_resumen(resumen)
+    return resultados
+
+
+# -----------------------------
+# Anulaciones y devoluciones
+# -----------------------------
+def _parte(valor, unidades, cantidad):
+    """Parte de `valor` que corresponde a `unidades` de `cantidad` (exacta al completar)."""
+    if unidades >= cantidad:
+        return valor
+    return _centavos(valor * unidades / cantidad)
+
+
+def _parte_devuelta(valor, antes, despues, cantidad):
+    """Importe de pasar de `antes` a `despues` unidades devueltas: al completar suma exactamente `valor`."""
+    return _parte(valor, despues, cantidad) - _parte(valor, antes, cantidad)
+
+
+def _renglones_a_devolver(detalles, renglones):
+    """{detalle_id: unidades} a devolver; renglones=None = todo lo pendiente. Lanza VentaError."""
+    if renglones is None:
+        return {d.id: d.cantidad - d.cantidad_devuelta for d in detalles.values() if d.cantidad > d.cantidad_devuelta}
+    pedidos = defaultdict(int)
+    for r in renglones:
+        try:
+            det = detalles.get(int(r["detalle"]))
+            cantidad = r.get("cantidad")
+            cantidad = int(cantidad) if cantidad not in (None, "") else None
+        except (TypeError, ValueError, KeyError, AttributeError):
+            raise VentaError("Renglón a devolver inválido.")
+        if det is None:
+            raise VentaError("El renglón no pertenece a la venta.", detalle=r.get("detalle"))
+        pedidos[det.id] += det.cantidad - det.cantidad_devuelta if cantidad is None else cantidad
+    for det_id, cantidad in pedidos.items():
+        pendiente = detalles[det_id].cantidad - detalles[det_id].cantidad_devuelta
+        if cantidad <= 0 or cantidad > pendiente:
+            raise VentaError("Cantidad a devolver inválida.", detalle=det_id, pendiente=pendiente)
+    return {k: v for k, v in pedidos.items() if v}
+
+
+def devolver_venta(empresa_id, venta_id, renglones=None, reembolsos=None, usuario=None, motivo=""):
+    """
+    Devuelve total o parcialmente una venta en una sola transacción:
+      - renglones: [{"detalle": id, "cantidad": n}] (sin cantidad = lo pendiente
+        del renglón); None = todo lo pendiente, es decir, anular la venta.
+      - Productos: una ENTRADA por renglón con bulk_create, aplicada sobre los
+        saldos bloqueados en una sola consulta.
+      - Reembolso: MetodoPago con importe negativo. Sin `reembolsos` se devuelve
+        lo que exceda el saldo pendiente, con la forma de pago principal.
+      - Venta: subtotal/descuento/impuesto/total/saldo bajan con UPDATE F() y el
+        estado pasa a devolucion_parcial o anulada; el rollup diario se
+        descuenta en el día de la venta.
+      - Al anularse por completo regresa el uso del cupón y descarta el timbrado pendiente.
+    Solo se bloquea la fila de la venta (dos devoluciones de la misma venta se
+    serializan) y los saldos de sus productos.
+    Lanza VentaError. Devuelve (venta, movimientos, pagos).
+    """
+    with transaction.atomic():
+        venta = Venta.objects.select_for_update().filter(pk=venta_id, empresa_id=empresa_id).first()
+        if venta is None:
+            raise VentaError("Venta no encontrada.")
+        if venta.estado == Venta.Estado.ANULADA:
+            raise VentaError("La venta ya está anulada.")
+        detalles = {d.id: d for d in DetalleVenta.objects.filter(venta=venta)}
+        pedidos = _renglones_a_devolver(detalles, renglones)
+        if not pedidos:
+            raise VentaError("La venta no tiene renglones pendientes por devolver.")
+
+        ahora = timezone.now()
+        Dim = ResumenVentaDiario.Dimension
+        base = (venta.empresa_id, venta.sucursal_id, fecha_resumen(venta.fecha))
+        resumen = defaultdict(nuevo_acumulado)
+        subtotal = descuento = impuestos = total = Decimal("0.00")
+        cambiados = []
+        for det_id, unidades in pedidos.items():
+            det = detalles[det_id]
+            antes, despues = det.cantidad_devuelta, det.cantidad_devuelta + unidades
+            importe = _parte_devuelta(det.total, antes, despues, det.cantidad)
+            subtotal += _parte_devuelta(det.subtotal, antes, despues, det.cantidad)
+            descuento += _parte_devuelta(det.descuento_monto, antes, despues, det.cantidad)
+            impuestos += _parte_devuelta(det.impuesto_monto, antes, despues, det.cantidad)
+            total += importe
+            det.cantidad_devuelta = despues
+            det.importe_devuelto += importe
+            det.updated_at = ahora
+            det.updated_by = usuario
+            cambiados.append(det)
+
+            acumulado = resumen[base + (Dim.ITEM_TIPO, det.item_tipo or "")]
+            acumulado[0] -= 1 if despues >= det.cantidad else 0
+            acumulado[1] -= unidades
+            acumulado[2] -= importe
+        DetalleVenta.objects.bulk_update(
+            cambiados, ["cantidad_devuelta", "importe_devuelto", "updated_at", "updated_by"],
+        )
+        anulada = all(d.cantidad_devuelta >= d.cantidad for d in detalles.values())
+
+        # Reembolso: al menos lo que ya se cobró de más, a lo sumo lo devuelto y lo pagado.
+        minimo = max(total - venta.saldo, Decimal("0.00"))
+        maximo = min(total, venta.total_pagado)
+        if reembolsos is None:
+            forma = (
+                MetodoPago.objects.filter(venta=venta, importe__gt=0)
+                .order_by("-importe").values_list("forma_pago", flat=True).first()
+            ) or ""
+            pagos_in = [(forma, minimo)] if minimo else []
+            reembolso = minimo
+        else:
+            pagos_in, reembolso = _parse_pagos(reembolsos)
+        if not minimo <= reembolso <= maximo:
+            raise VentaError(f"El reembolso debe estar entre {minimo} y {maximo}.", minimo=str(minimo), maximo=str(maximo))
+
+        acumulado = resumen[base + (Dim.VENTA, "")]
+        acumulado[0] -= 1 if anulada else 0
+        acumulado[2] -= total
+        nota = f"{'Anulación' if anulada else 'Devolución'} {timezone.localtime(ahora):%Y-%m-%d %H:%M}: {total}"
+        Venta.objects.filter(pk=venta.pk).update(
+            subtotal=F("subtotal") - subtotal,
+            descuento_monto=F("descuento_monto") - descuento,
+            impuesto_monto=F("impuesto_monto") - impuestos,
+            total=F("total") - total,
+            importe=F("importe") - total,
+            saldo=F("saldo") - total,
+            estado=Venta.Estado.ANULADA if anulada else Venta.Estado.DEVOLUCION_PARCIAL,
+            notas="\n".join(filter(None, [venta.notas, f"{nota}. {motivo}".strip()])),
+            updated_at=ahora,
+            updated_by=usuario,
+        )
+
+        devueltos = [(detalles[i], n) for i, n in pedidos.items() if detalles[i].producto_id and detalles[i].almacen_id]
+        movimientos = []
+        if devueltos:
+            saldos = bloquear_existencias({(venta.empresa_id, d.producto_id, d.almacen_id) for d, _ in devueltos})
+            movimientos = MovimientoProducto.objects.bulk_create([
+                MovimientoProducto(
+                    empresa_id=venta.empresa_id,
+                    producto_id=d.producto_id,
+                    almacen_id=d.almacen_id,
+                    tipo_movimiento=MovimientoProducto.TipoMovimiento.ENTRADA,
+                    cantidad=n,
+                    fecha=ahora,
+                    created_by=usuario,
+                    updated_by=usuario,
+                )
+                for d, n in devueltos
+            ])
+            aplicar_movimientos(movimientos, saldos=saldos)
+
+        # bulk_create no pasa por MetodoPago.save: total_pagado/saldo y rollup por forma de pago aquí.
+        pagos_out = MetodoPago.objects.bulk_create([
+            MetodoPago(venta=venta, forma_pago=forma, importe=-imp, created_by=usuario, updated_by=usuario)
+            for forma, imp in pagos_in
+        ])
+        aplicar_pagos(pagos_out)
+
+        if anulada:
+            for cd_id in {d.codigo_descuento_id for d in detalles.values() if d.codigo_descuento_id}:
+                CodigoDescuento.objects.filter(pk=cd_id).update(restantes=F("restantes") + 1, updated_at=ahora)
+            # Incluye trabajos en proceso: el worker revisa el estado antes de guardar
+            # el UUID (ver timbrado.procesar_lote). Orden de locks: venta -> trabajo.
+            trabajos = (
+                TrabajoTimbrado.objects.select_for_update()
+                .filter(venta=venta)
+                .exclude(estado=TrabajoTimbrado.Estado.TIMBRADO)
+            )
+            TrabajoTimbrado.objects.filter(pk__in=list(trabajos.values_list("pk", flat=True))).update(
+                estado=TrabajoTimbrado.Estado.CANCELADO, ultimo_error="Venta anulada.", updated_at=ahora,
+            )
+
+        acumular_resumen(resumen)
+        venta.refresh_from_db()
+    return venta, movimientos, pagos_out
@@ -1,3 +1,829 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import threading
+import uuid
+import zipfile
+from contextlib import nullcontext
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from xml.etree import ElementTree
+
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import Usuario
+from core.models import SolicitudIdempotente
+from clientes.models import Cliente
+from empleados.models import UsuarioEmpresa
+from empresas.models import Empresa, Sucursal
+from inventario.models import Almacen, CategoriaProducto, Producto, MovimientoProducto, ExistenciaProducto
+
+from .models import CodigoDescuento, ReservaCodigoDescuento, Venta, MetodoPago, TrabajoTimbrado
+from .reportes import TRAMOS_ANTIGUEDAD
+
+
+class VentasMixin:
+    """Empresa con sucursal, almacén, dos productos sin IVA y un cliente; API autenticada."""
+
+    def setUp(self):
+        self.empresa = Empresa.objects.create(nombre="Gym Centro")
+        self.sucursal = Sucursal.objects.create(empresa=self.empresa, nombre="Centro")
+        self.usuario = Usuario.objects.create_superuser("cajero", "cajero@example.com", "pw")
+        UsuarioEmpresa.objects.create(usuario=self.usuario, empresa=self.empresa, sucursal=self.sucursal, rol="owner")
+        self.api = APIClient()
+        self.api.force_authenticate(self.usuario)
+        self.api.credentials(HTTP_X_EMPRESA_ID=str(self.empresa.id))
+        self.almacen = Almacen.objects.create(empresa=self.empresa, sucursal=self.sucursal, nombre="Mostrador")
+        categoria = CategoriaProducto.objects.create(empresa=self.empresa, nombre="Bebidas")
+        self.agua = Producto.objects.create(
+            empresa=self.empresa, categoria=categoria, nombre="Agua", codigo_barras="750100",
+            precio="10.00", aplicar_iva=False,
+        )
+        self.proteina = Producto.objects.create(
+            empresa=self.empresa, categoria=categoria, nombre="Proteína", codigo_barras="750200",
+            precio="100.00", aplicar_iva=False,
+        )
+        self.cliente = Cliente.objects.create(nombre="Ana", apellidos="López")
+        for producto in (self.agua, self.proteina):
+            MovimientoProducto.objects.create(
+                empresa=self.empresa, producto=producto, almacen=self.almacen,
+                tipo_movimiento="entrada", cantidad=100, fecha=timezone.now(),
+            )
+
+    def vender(self, items, pagos=None, cliente=None, **extra):
+        r = self.api.post("/api/v1/ventas/pos-checkout/", {
+            "empresa": self.empresa.id, "cliente": (cliente or self.cliente).id, "almacen": self.almacen.id,
+            "items": items, "pagos": pagos or [], **extra,
+        }, format="json")
+        self.assertEqual(r.status_code, 201, r.content)
+        return Venta.objects.get(pk=r.json()["venta_id"])
+
+    def existencia(self, producto):
+        return ExistenciaProducto.objects.get(producto=producto, almacen=self.almacen).cantidad
+
+
+class VentasTestCase(VentasMixin, TestCase):
+    pass
+
+
+class AntiguedadSaldosTests(VentasTestCase):
+    def venta_a_credito(self, dias, cantidad=1, cliente=None):
+        venta = self.vender([{"producto": self.agua.id, "cantidad": cantidad}], cliente=cliente)
+        fecha = timezone.make_aware(datetime.combine(self.corte - timedelta(days=dias), time(12)))
+        Venta.objects.filter(pk=venta.pk).update(fecha=fecha)
+        return venta
+
+    def setUp(self):
+        super().setUp()
+        self.corte = timezone.localdate()
+
+    def test_cada_edad_cae_en_un_tramo(self):
+        edades = [0, 30, 31, 60, 61, 90, 91, 200]
+        for dias in edades:
+            self.venta_a_credito(dias)
+
+        r = self.api.get("/api/v1/ventas/antiguedad-saldos/", {"corte": self.corte.isoformat()})
+        self.assertEqual(r.status_code, 200)
+        fila = r.json()["results"][0]
+        self.assertEqual(
+            {campo: fila[campo] for campo, _, _ in TRAMOS_ANTIGUEDAD},
+            {"dias_0_30": "20.00", "dias_31_60": "20.00", "dias_61_90": "20.00", "dias_90_mas": "20.00"},
+        )
+        suma = sum(Decimal(fila[campo]) for campo, _, _ in TRAMOS_ANTIGUEDAD)
+        self.assertEqual(suma, Decimal(fila["saldo"]))
+        self.assertEqual(fila["ventas"], len(edades))
+
+        totales = r.json()["totales"]
+        self.assertEqual(totales["dias_90_mas"], "20.00")
+        self.assertEqual(sum(Decimal(totales[campo]) for campo, _, _ in TRAMOS_ANTIGUEDAD), Decimal(totales["saldo"]))
+
+    def test_pagos_y_ventas_posteriores_al_corte(self):
+        pagada = self.venta_a_credito(10)
+        MetodoPago.objects.create(venta=pagada, forma_pago="efectivo", importe="10.00")
+        self.venta_a_credito(-1)  # posterior al corte
+        otro = Cliente.objects.create(nombre="Beto", apellidos="Paz")
+        self.venta_a_credito(45, cantidad=3, cliente=otro)
+
+        r = self.api.get("/api/v1/ventas/antiguedad-saldos/", {"corte": self.corte.isoformat()})
+        filas = r.json()["results"]
+        self.assertEqual([f["cliente"] for f in filas], [otro.id])
+        self.assertEqual((filas[0]["dias_31_60"], filas[0]["saldo"]), ("30.00", "30.00"))
+
+
+class ReportesCacheTests(VentasTestCase):
+    url = "/api/v1/ventas/reportes/productos/"
+
+    def test_venta_confirmada_invalida_el_reporte(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vender([{"producto": self.agua.id, "cantidad": 2}])
+        primero = self.api.get(self.url).json()
+        self.assertFalse(primero["cache"])
+        self.assertTrue(self.api.get(self.url).json()["cache"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vender([{"producto": self.agua.id, "cantidad": 3}])
+        nuevo = self.api.get(self.url).json()
+        self.assertFalse(nuevo["cache"])
+        self.assertEqual(nuevo["filas"][0]["cantidad"], 5)
+
+    def test_version_se_recrea_si_se_pierde(self):
+        from django.core.cache import cache
+        from .reportes import _clave_version
+
+        self.api.get(self.url)
+        cache.delete(_clave_version(self.empresa.id))
+        self.assertFalse(self.api.get(self.url).json()["cache"])
+
+
+class DevolucionTests(VentasTestCase):
+    def test_devolucion_parcial_y_anulacion(self):
+        venta = self.vender(
+            [{"producto": self.agua.id, "cantidad": 3}, {"producto": self.proteina.id, "cantidad": 1}],
+            pagos=[{"forma_pago": "tarjeta", "importe": "130.00"}],
+        )
+        self.assertEqual((self.existencia(self.agua), self.existencia(self.proteina)), (97, 99))
+        agua = venta.detalles.get(producto=self.agua)
+
+        r = self.api.post(f"/api/v1/ventas/{venta.id}/devolucion/", {"renglones": [{"detalle": agua.id, "cantidad": 1}]}, format="json")
+        self.assertEqual(r.status_code, 200, r.content)
+        self.assertEqual(
+            (r.json()["estado"], r.json()["reembolsado"], r.json()["total"], r.json()["saldo"]),
+            (Venta.Estado.DEVOLUCION_PARCIAL, "10.00", "120.00", "0.00"),
+        )
+        self.assertEqual(self.existencia(self.agua), 98)
+
+        # No se devuelve más de lo vendido.
+        r = self.api.post(f"/api/v1/ventas/{venta.id}/devolucion/", {"renglones": [{"detalle": agua.id, "cantidad": 3}]}, format="json")
+        self.assertEqual(r.status_code, 400)
+
+        r = self.api.post(f"/api/v1/ventas/{venta.id}/anular/", {}, format="json")
+        self.assertEqual(r.status_code, 200, r.content)
+        self.assertEqual((r.json()["reembolsado"], r.json()["total"], r.json()["saldo"]), ("120.00", "0.00", "0.00"))
+        self.assertEqual((self.existencia(self.agua), self.existencia(self.proteina)), (100, 100))
+        venta.refresh_from_db()
+        self.assertEqual((venta.estado, venta.total_pagado), (Venta.Estado.ANULADA, Decimal("0.00")))
+        self.assertEqual(self.api.post(f"/api/v1/ventas/{venta.id}/anular/", {}, format="json").status_code, 400)
+
+    def test_saldo_pendiente_cubre_la_devolucion(self):
+        venta = self.vender([{"producto": self.proteina.id, "cantidad": 2}])
+        MetodoPago.objects.create(venta=venta, forma_pago="efectivo", importe="50.00")
+        detalle = venta.detalles.get()
+
+        r = self.api.post(f"/api/v1/ventas/{venta.id}/devolucion/", {"renglones": [{"detalle": detalle.id, "cantidad": 1}]}, format="json")
+        self.assertEqual((r.json()["reembolsado"], r.json()["total"], r.json()["saldo"]), ("0.00", "100.00", "50.00"))
+        # Solo se puede reembolsar lo pagado que excede el nuevo total.
+        r = self.api.post(f"/api/v1/ventas/{venta.id}/anular/", {"reembolsos": [{"forma_pago": "efectivo", "importe": "60"}]}, format="json")
+        self.assertEqual(r.status_code, 400)
+        r = self.api.post(f"/api/v1/ventas/{venta.id}/anular/", {}, format="json")
+        self.assertEqual((r.json()["reembolsado"], r.json()["total"], r.json()["saldo"]), ("50.00", "0.00", "0.00"))
+
+    def test_reembolsos_no_cuentan_como_pagos_en_el_rollup(self):
+        from .services import recalcular_resumen
+
+        venta = self.vender(
+            [{"producto": self.agua.id, "cantidad": 3}], pagos=[{"forma_pago": "efectivo", "importe": "30.00"}],
+        )
+        agua = venta.detalles.get()
+        self.api.post(f"/api/v1/ventas/{venta.id}/devolucion/", {"renglones": [{"detalle": agua.id, "cantidad": 1}]}, format="json")
+        self.api.post(f"/api/v1/ventas/{venta.id}/anular/", {}, format="json")
+
+        kpis = self.api.get("/api/v1/ventas/kpis/").json()
+        self.assertEqual(kpis["totales"], {"ventas": 0, "importe": "0.00", "ticket_promedio": "0.00"})
+        self.assertEqual(kpis["por_forma_pago"], [{"forma_pago": "efectivo", "pagos": 1, "importe": "0.00"}])
+        # Un backfill llega a las mismas filas.
+        hoy = timezone.localdate()
+        recalcular_resumen(self.empresa.id, hoy, hoy)
+        self.assertEqual(self.api.get("/api/v1/ventas/kpis/").json()["por_forma_pago"], kpis["por_forma_pago"])
+
+
+class ResumenVentasTests(VentasTestCase):
+    def filas_resumen(self):
+        from .models import ResumenVentaDiario
+        return sorted(
+            ResumenVentaDiario.objects.filter(empresa=self.empresa)
+            .values_list("sucursal_id", "fecha", "dimension", "clave", "operaciones", "cantidad", "importe")
+        )
+
+    def assertIgualAlBackfill(self):
+        from .services import recalcular_resumen
+        incremental = self.filas_resumen()
+        hoy = timezone.localdate()
+        recalcular_resumen(self.empresa.id, hoy - timedelta(days=30), hoy)
+        self.assertEqual(self.filas_resumen(), incremental)
+
+    def test_rollup_igual_al_backfill(self):
+        venta = self.vender(
+            [{"producto": self.agua.id, "cantidad": 3}, {"producto": self.proteina.id, "cantidad": 1}],
+            pagos=[{"forma_pago": "efectivo", "importe": "100.00"}, {"forma_pago": "tarjeta", "importe": "30.00"}],
+        )
+        self.vender([{"producto": self.agua.id, "cantidad": 1}])
+        self.assertIgualAlBackfill()
+
+        agua = venta.detalles.get(producto=self.agua)
+        r = self.api.post(f"/api/v1/ventas/{venta.id}/devolucion/", {"renglones": [{"detalle": agua.id, "cantidad": 2}]}, format="json")
+        self.assertEqual(r.status_code, 200, r.content)
+        self.assertIgualAlBackfill()
+
+        kpis = self.api.get("/api/v1/ventas/kpis/").json()
+        self.assertEqual(kpis["totales"], {"ventas": 2, "importe": "120.00", "ticket_promedio": "60.00"})
+        self.assertEqual(
+            [(f["item_tipo"], f["renglones"], f["cantidad"], f["importe"]) for f in kpis["por_item_tipo"]],
+            [("PRODUCTO", 3, 3, "120.00")],
+        )
+
+    def test_rango_de_fechas_y_sucursal(self):
+        from .services import recalcular_resumen
+
+        hoy = timezone.localdate()
+        anterior = self.vender([{"producto": self.proteina.id, "cantidad": 1}])
+        Venta.objects.filter(pk=anterior.pk).update(fecha=anterior.fecha - timedelta(days=10))
+        self.vender([{"producto": self.agua.id, "cantidad": 2}])
+        recalcular_resumen(self.empresa.id, hoy - timedelta(days=30), hoy)
+
+        def kpis(**params):
+            r = self.api.get("/api/v1/ventas/kpis/", params)
+            self.assertEqual(r.status_code, 200, r.content)
+            return r.json()
+
+        self.assertEqual(kpis()["totales"]["importe"], "120.00")
+        solo_hoy = kpis(desde=hoy.isoformat(), hasta=hoy.isoformat())
+        self.assertEqual(solo_hoy["por_dia"], [{"fecha": hoy.isoformat(), "ventas": 1, "importe": "20.00"}])
+        dia = (hoy - timedelta(days=10)).isoformat()
+        self.assertEqual(kpis(desde=dia, hasta=dia)["totales"]["importe"], "100.00")
+        self.assertEqual(kpis(sucursal=self.sucursal.id)["totales"]["ventas"], 2)
+
+        for params in ({"sucursal": "abc"}, {"desde": "2026-13-01"}, {"desde": hoy.isoformat(), "hasta": dia}):
+            self.assertEqual(self.api.get("/api/v1/ventas/kpis/", params).status_code, 400, params)
+
+
+class CodigoDescuentoReservaTests(VentasTestCase):
+    def test_checkout_con_reserva_y_liberacion(self):
+        cd = CodigoDescuento.objects.create(
+            empresa=self.empresa, codigo="promo", descuento="10", tipo_descuento="porcentaje",
+            cantidad=10, bloque_reserva=4,
+        )
+        for usados in range(1, 4):
+            venta = self.vender([{"producto": self.proteina.id, "cantidad": 1}], codigo_descuento="PROMO")
+            self.assertEqual(venta.total, Decimal("90.00"))
+            cd.refresh_from_db()
+            # El primer canje toma un bloque: restantes + disponibles solo baja por lo canjeado.
+            self.assertEqual(cd.usos_disponibles(), 10 - usados)
+        reserva = ReservaCodigoDescuento.objects.get(codigo=cd, sucursal=self.sucursal)
+        self.assertEqual((cd.restantes, reserva.disponibles), (6, 1))
+
+        r = self.api.post(f"/api/v1/ventas/codigos-descuento/{cd.id}/liberar-reservas/", {}, format="json")
+        self.assertEqual((r.json()["liberados"], r.json()["restantes"]), (1, 7))
+        reserva.refresh_from_db()
+        self.assertEqual(reserva.disponibles, 0)
+        cd.refresh_from_db()
+        self.assertEqual(cd.usos_disponibles(), 7)
+
+
+class CanjeConcurrenteTests(VentasMixin, TransactionTestCase):
+    def canjear_en_paralelo(self, cd, sucursales):
+        from .services import canjear_codigo
+
+        barrera = threading.Barrier(len(sucursales))
+        resultados, errores = [], []
+
+        def canjear(sucursal_id):
+            try:
+                barrera.wait()
+                with transaction.atomic():
+                    resultados.append(canjear_codigo(cd, sucursal_id=sucursal_id))
+            except Exception as e:  # noqa: BLE001 - se reporta en el assert
+                errores.append(e)
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=canjear, args=(s,)) for s in sucursales]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        self.assertEqual(errores, [])
+        return sum(resultados)
+
+    def test_canje_directo_no_se_pasa_del_limite(self):
+        cd = CodigoDescuento.objects.create(
+            empresa=self.empresa, codigo="DIRECTO", descuento="5", tipo_descuento="monto", cantidad=5,
+        )
+        canjeados = self.canjear_en_paralelo(cd, [None] * 8)
+        cd.refresh_from_db()
+        self.assertEqual((canjeados, cd.restantes), (5, 0))
+
+    def test_canje_por_bloques_no_pierde_usos(self):
+        otra = Sucursal.objects.create(empresa=self.empresa, nombre="Norte")
+        cd = CodigoDescuento.objects.create(
+            empresa=self.empresa, codigo="BLOQUES", descuento="5", tipo_descuento="monto",
+            cantidad=10, bloque_reserva=3,
+        )
+        canjeados = self.canjear_en_paralelo(cd, [self.sucursal.id, otra.id] * 6)
+        cd.refresh_from_db()
+        reservados = sum(cd.reservas.values_list("disponibles", flat=True))
+        self.assertGreaterEqual(cd.restantes, 0)
+        self.assertEqual(canjeados + cd.restantes + reservados, 10)
+
+
+class SincronizarVentasTests(VentasTestCase):
+    url = "/api/v1/ventas/sync/"
+
+    def test_lote_parcial_y_reenvio(self):
+        CodigoDescuento.objects.create(
+            empresa=self.empresa, codigo="UNICO", descuento="10", tipo_descuento="porcentaje", cantidad=1,
+        )
+
+        def venta(items, **extra):
+            return {"uuid": str(uuid.uuid4()), "cliente": self.cliente.id, "almacen": self.almacen.id,
+                    "items": items, **extra}
+
+        con_cupon = venta([{"producto": self.agua.id, "cantidad": 5}], codigo_descuento="UNICO")
+        sin_stock = venta([{"producto": self.proteina.id, "cantidad": 500}])
+        cupon_agotado = venta([{"producto": self.agua.id, "cantidad": 3}], codigo_descuento="UNICO")
+        normal = venta([{"producto": self.agua.id, "cantidad": 2}])
+        lote = {"ventas": [con_cupon, sin_stock, cupon_agotado, normal]}
+
+        r = self.api.post(self.url, lote, format="json")
+        self.assertEqual(r.status_code, 200, r.content)
+        datos = r.json()
+        self.assertEqual((datos["creadas"], datos["duplicadas"], datos["errores"]), (2, 0, 2))
+        resultados = datos["resultados"]
+        self.assertEqual(
+            [resultados[v["uuid"]]["estado"] for v in lote["ventas"]], ["creada", "error", "error", "creada"],
+        )
+        self.assertEqual(resultados[con_cupon["uuid"]]["total"], "45.00")
+        self.assertIn("Stock insuficiente", resultados[sin_stock["uuid"]]["detail"])
+        self.assertEqual(resultados[cupon_agotado["uuid"]]["detail"], "El código no tiene usos disponibles.")
+
+        # Las fallidas no dejan stock, ventas ni rollup.
+        self.assertEqual((self.existencia(self.agua), self.existencia(self.proteina)), (93, 100))
+        kpis = self.api.get("/api/v1/ventas/kpis/").json()
+        self.assertEqual(kpis["totales"], {"ventas": 2, "importe": "65.00", "ticket_promedio": "32.50"})
+        self.assertEqual([(f["renglones"], f["cantidad"]) for f in kpis["por_item_tipo"]], [(2, 7)])
+
+        r = self.api.post(self.url, lote, format="json")
+        datos = r.json()
+        self.assertEqual((datos["creadas"], datos["duplicadas"], datos["errores"]), (0, 2, 2))
+        self.assertEqual(
+            datos["resultados"][normal["uuid"]],
+            {"estado": "duplicada", "venta_id": resultados[normal["uuid"]]["venta_id"]},
+        )
+        self.assertEqual(Venta.objects.count(), 2)
+        self.assertEqual(self.existencia(self.agua), 93)
+        self.assertEqual(self.api.get("/api/v1/ventas/kpis/").json()["totales"], kpis["totales"])
+
+
+class FoliosTests(VentasTestCase):
+    def configurar(self, **valor):
+        from empresas.models import Configuracion, ValorConfiguracion
+        from .folios import CLAVE_CONFIGURACION
+
+        configuracion, _ = Configuracion.objects.get_or_create(nombre=CLAVE_CONFIGURACION, defaults={"tipo_dato": "json"})
+        ValorConfiguracion.objects.update_or_create(
+            configuracion=configuracion, empresa=self.empresa, defaults={"valor": json.dumps(valor)},
+        )
+
+    def folios(self, n, sucursal=None):
+        from .folios import asignar_folio
+        return [asignar_folio(self.empresa.id, sucursal or self.sucursal.id)[1] for _ in range(n)]
+
+    def test_folios_consecutivos_por_periodo(self):
+        periodo = f"{timezone.localdate():%Y%m}"
+        primera = self.vender([{"producto": self.agua.id, "cantidad": 1}])
+        segunda = self.vender([{"producto": self.agua.id, "cantidad": 1}])
+        self.assertEqual((primera.serie, primera.folio), ("VTA", f"VTA-{periodo}-0001"))
+        self.assertEqual(segunda.folio, f"VTA-{periodo}-0002")
+
+    def test_secuencia_por_sucursal(self):
+        norte = Sucursal.objects.create(empresa=self.empresa, nombre="Norte")
+        self.configurar(formato="{serie}{sucursal}-{numero}", sucursales={str(norte.id): {"serie": "NTE"}})
+        self.assertEqual(self.folios(2), [f"VTA{self.sucursal.id}-1", f"VTA{self.sucursal.id}-2"])
+        self.assertEqual(self.folios(1, sucursal=norte.id), [f"NTE{norte.id}-1"])
+
+        self.configurar(formato="{serie}-{numero}", por_sucursal=False)
+        self.assertEqual(self.folios(1) + self.folios(1, sucursal=norte.id), ["VTA-1", "VTA-2"])
+
+    def test_bloques_por_proceso(self):
+        from .folios import _bloques
+
+        self.addCleanup(_bloques.clear)
+        self.configurar(formato="{numero}", bloque=5)
+        # El primer número crea la secuencia (no se guarda bloque); luego se reparte de 5 en 5.
+        self.assertEqual(self.folios(7), ["1", "6", "7", "8", "9", "10", "11"])
+
+    def test_secuencia_creada_en_transaccion_revertida(self):
+        from .folios import _bloques
+
+        self.addCleanup(_bloques.clear)
+        self.configurar(formato="{numero}", bloque=5)
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.assertEqual(self.folios(1), ["1"])
+            raise RuntimeError
+        # La secuencia se revirtió y se vuelve a crear; no hay bloque viejo en memoria.
+        self.assertEqual(self.folios(3), ["1", "6", "7"])
+
+    def test_formato_que_no_cabe_se_rechaza(self):
+        self.configurar(serie="SUCURSAL-CENTRO-PONIENTE", formato="{serie}-{periodo}-{numero:04d}")
+        r = self.api.post("/api/v1/ventas/pos-checkout/", {
+            "cliente": self.cliente.id, "almacen": self.almacen.id,
+            "items": [{"producto": self.agua.id, "cantidad": 1}],
+        }, format="json")
+        self.assertEqual(r.status_code, 400)
+        self.assertIn("excede 30 caracteres", r.json()["detail"])
+        self.assertEqual(Venta.objects.count(), 0)
+        self.assertEqual(self.existencia(self.agua), 100)
+
+
+@override_settings(TIME_ZONE="America/Mexico_City")
+class ExportarTests(VentasTestCase):
+    url = "/api/v1/ventas/exportar/"
+
+    def setUp(self):
+        super().setUp()
+        raro = Cliente.objects.create(nombre="Pérez & <Hijos>", apellidos='"SA"')
+        self.venta = self.vender(
+            [{"producto": self.agua.id, "cantidad": 2}, {"producto": self.proteina.id, "cantidad": 1}],
+            pagos=[{"forma_pago": "efectivo", "importe": "100.00"}, {"forma_pago": "tarjeta", "importe": "20.00"}],
+            cliente=raro,
+        )
+        self.fecha_local = timezone.localtime(self.venta.fecha).isoformat()
+
+    def test_csv_con_detalles_y_pagos(self):
+        r = self.api.get(self.url, {"incluir": "detalles,pagos"})
+        self.assertEqual(r.status_code, 200)
+        filas = list(csv.DictReader(io.StringIO(b"".join(r.streaming_content).decode("utf-8"))))
+        self.assertEqual([f["linea"] for f in filas], ["venta", "detalle", "detalle", "pago", "pago"])
+        self.assertEqual({f["id"] for f in filas}, {str(self.venta.id)})
+        self.assertEqual({f["fecha"] for f in filas}, {self.fecha_local})
+        self.assertTrue(self.fecha_local.endswith("-06:00"))
+        self.assertEqual(filas[0]["cliente"], 'Pérez & <Hijos> "SA"')
+        self.assertEqual([(f["detalle_item_id"], f["detalle_cantidad"]) for f in filas[1:3]],
+                         [(str(self.agua.id), "2"), (str(self.proteina.id), "1")])
+        self.assertEqual([(f["pago_forma_pago"], f["pago_importe"]) for f in filas[3:]],
+                         [("efectivo", "100.00"), ("tarjeta", "20.00")])
+
+    def test_xlsx_bien_formado(self):
+        r = self.api.get(self.url, {"formato": "xlsx", "incluir": "pagos"})
+        self.assertEqual(r.status_code, 200)
+        libro = zipfile.ZipFile(io.BytesIO(b"".join(r.streaming_content)))
+        self.assertIsNone(libro.testzip())
+        for nombre in libro.namelist():
+            ElementTree.fromstring(libro.read(nombre))  # XML bien formado
+
+        ns = {"x": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+        hoja = ElementTree.fromstring(libro.read("xl/worksheets/sheet1.xml"))
+        filas = [
+            ["".join(c.itertext()) for c in row.findall("x:c", ns)]
+            for row in hoja.iterfind("x:sheetData/x:row", ns)
+        ]
+        encabezado = filas[0]
+        self.assertEqual(len(filas), 4)  # encabezado + venta + 2 pagos
+        venta = dict(zip(encabezado, filas[1]))
+        self.assertEqual((venta["cliente"], venta["fecha"], venta["total"]), ('Pérez & <Hijos> "SA"', self.fecha_local, "120.00"))
+        self.assertIn(b"P\xc3\xa9rez &amp; &lt;Hijos&gt;", libro.read("xl/worksheets/sheet1.xml"))
+
+
+class VentaFilterTests(VentasTestCase):
+    def ids(self, **params):
+        r = self.api.get("/api/v1/ventas/", {"paginacion": "cursor", **params})
+        self.assertEqual(r.status_code, 200, r.content)
+        return [v["id"] for v in r.json()["results"]]
+
+    def test_exists_sin_repetidos_y_con_indice(self):
+        from .filters import VentaFilter
+
+        dos_pagos = self.vender(
+            [{"producto": self.agua.id, "cantidad": 1}],
+            pagos=[{"forma_pago": "efectivo", "importe": "4.00"}, {"forma_pago": "Efectivo", "importe": "6.00"}],
+        )
+        self.vender([{"producto": self.agua.id, "cantidad": 1}], pagos=[{"forma_pago": "tarjeta", "importe": "10.00"}])
+
+        self.assertEqual(self.ids(forma_pago="EFECTIVO"), [dos_pagos.id])
+        self.assertEqual(len(self.ids(item_tipo="producto")), 2)
+        self.assertEqual(self.ids(forma_pago="cheque"), [])
+
+        # UPPER(...) = UPPER(...) del iexact se resuelve con los índices funcionales.
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        for params, indice in (
+            ({"forma_pago": "efectivo"}, "pago_venta_forma_upper_idx"),
+            ({"item_tipo": "producto"}, "detalle_venta_tipo_upper_idx"),
+        ):
+            self.assertIn(indice, VentaFilter(params, queryset=Venta.objects.all()).qs.explain())
+
+
+class PagosTests(VentasTestCase):
+    url = "/api/v1/ventas/pagos/"
+
+    def test_alta_cambio_y_baja_mantienen_el_saldo(self):
+        from .services import recalcular_resumen
+
+        venta = self.vender([{"producto": self.proteina.id, "cantidad": 1}])
+
+        def saldos():
+            venta.refresh_from_db()
+            return venta.total_pagado, venta.saldo
+
+        r = self.api.post(self.url, {"venta": venta.id, "forma_pago": "efectivo", "importe": "30.00"}, format="json")
+        self.assertEqual(r.status_code, 201, r.content)
+        pago_id = r.json()["id"]
+        self.assertEqual(saldos(), (Decimal("30.00"), Decimal("70.00")))
+
+        r = self.api.patch(f"{self.url}{pago_id}/", {"importe": "45.00", "forma_pago": "tarjeta"}, format="json")
+        self.assertEqual(r.status_code, 200, r.content)
+        self.assertEqual(saldos(), (Decimal("45.00"), Decimal("55.00")))
+        MetodoPago.objects.create(venta=venta, forma_pago="efectivo", importe="55.00")
+        self.assertEqual(saldos(), (Decimal("100.00"), Decimal("0.00")))
+
+        self.assertEqual(self.api.delete(f"{self.url}{pago_id}/").status_code, 204)
+        self.assertEqual(saldos(), (Decimal("55.00"), Decimal("45.00")))
+
+        # El rollup por forma de pago siguió los cambios: igual a un backfill.
+        kpis = self.api.get("/api/v1/ventas/kpis/").json()["por_forma_pago"]
+        self.assertEqual(
+            [(f["forma_pago"], f["pagos"], f["importe"]) for f in kpis if f["pagos"]], [("efectivo", 1, "55.00")],
+        )
+        hoy = timezone.localdate()
+        recalcular_resumen(self.empresa.id, hoy, hoy)
+        self.assertEqual(
+            [(f["forma_pago"], f["pagos"], f["importe"]) for f in self.api.get("/api/v1/ventas/kpis/").json()["por_forma_pago"]],
+            [("efectivo", 1, "55.00")],
+        )
+
+    def test_reconciliar_corrige_desfases(self):
+        from django.core.management import call_command
+
+        pagada = self.vender([{"producto": self.agua.id, "cantidad": 2}], pagos=[{"forma_pago": "efectivo", "importe": "20.00"}])
+        a_credito = self.vender([{"producto": self.agua.id, "cantidad": 1}])
+        sana = self.vender([{"producto": self.agua.id, "cantidad": 3}])
+        # Desfases que dejaría una escritura que no pasó por MetodoPago.save.
+        Venta.objects.filter(pk=pagada.pk).update(total_pagado=0, saldo=20)
+        MetodoPago.objects.bulk_create([MetodoPago(venta=a_credito, forma_pago="efectivo", importe="4.00")])
+
+        salida = io.StringIO()
+        call_command("reconciliar_pagos_ventas", "--dry-run", empresa=self.empresa.id, stdout=salida)
+        self.assertIn("detectadas: 2", salida.getvalue())
+        pagada.refresh_from_db()
+        self.assertEqual(pagada.total_pagado, Decimal("0.00"))
+
+        call_command("reconciliar_pagos_ventas", empresa=self.empresa.id, stdout=io.StringIO())
+        esperados = {pagada.id: ("20.00", "0.00"), a_credito.id: ("4.00", "6.00"), sana.id: ("0.00", "30.00")}
+        for venta in Venta.objects.all():
+            self.assertEqual((str(venta.total_pagado), str(venta.saldo)), esperados[venta.id])
+
+
+class TimbradoTests(VentasTestCase):
+    def setUp(self):
+        super().setUp()
+        self.venta = self.vender(
+            [{"producto": self.agua.id, "cantidad": 1}], pagos=[{"forma_pago": "efectivo", "importe": "10.00"}],
+            facturar=True, uso_cfdi="G03",
+        )
+
+    def test_cola_timbra_y_guarda_el_uuid(self):
+        from .pac import FakePACClient
+        from .timbrado import procesar_lote, tomar_trabajos
+
+        self.assertEqual(self.venta.timbrado.estado, TrabajoTimbrado.Estado.PENDIENTE)
+        conteo = procesar_lote(FakePACClient(), tomar_trabajos(10))
+        self.assertEqual(conteo, {"timbrados": 1, "reintentos": 0, "errores": 0, "cancelados": 0})
+        self.assertEqual(tomar_trabajos(10), [])
+        self.venta.refresh_from_db()
+        self.assertTrue(self.venta.uuid_cfdi)
+        self.assertEqual(self.venta.folio_fiscal, self.venta.uuid_cfdi)
+        self.assertEqual((self.venta.timbrado.estado, self.venta.timbrado.intentos), (TrabajoTimbrado.Estado.TIMBRADO, 1))
+
+    @override_settings(TIMBRADO_BACKOFF_BASE=60, TIMBRADO_MAX_INTENTOS=3)
+    def test_reintentos_con_backoff(self):
+        from .pac import PACClient, PACError
+        from .timbrado import procesar_lote, tomar_trabajos
+
+        class PACCaido(PACClient):
+            def __init__(self, error):
+                self.error = error
+
+            def timbrar(self, comprobantes):
+                raise self.error
+
+        trabajo = self.venta.timbrado
+        for intento, error in enumerate((PACError("Servicio no disponible."), ConnectionError("timeout"), PACError("otra vez")), 1):
+            antes = timezone.now()
+            trabajos = tomar_trabajos(10)
+            self.assertEqual(len(trabajos), 1)
+            # Las fallas que no son PACError (red, timeout) se registran y se reintentan igual.
+            registro = self.assertLogs("ventas.timbrado", "ERROR") if not isinstance(error, PACError) else nullcontext()
+            with registro:
+                conteo = procesar_lote(PACCaido(error), trabajos)
+            trabajo.refresh_from_db()
+            if intento < 3:
+                self.assertEqual(conteo["reintentos"], 1)
+                self.assertEqual((trabajo.estado, trabajo.intentos), (TrabajoTimbrado.Estado.PENDIENTE, intento))
+                # Exponencial (60s, 120s, ...) con ±20% de jitter; mientras no vence, nadie lo toma.
+                espera = (trabajo.proximo_intento - antes).total_seconds()
+                self.assertTrue(60 * 2 ** (intento - 1) * 0.8 <= espera <= 60 * 2 ** (intento - 1) * 1.2 + 5, espera)
+                self.assertEqual(tomar_trabajos(10), [])
+                TrabajoTimbrado.objects.filter(pk=trabajo.pk).update(proximo_intento=timezone.now())
+            else:
+                # Se agotaron los intentos.
+                self.assertEqual(conteo["errores"], 1)
+                self.assertEqual((trabajo.estado, trabajo.ultimo_error), (TrabajoTimbrado.Estado.ERROR, "otra vez"))
+        self.venta.refresh_from_db()
+        self.assertIsNone(self.venta.uuid_cfdi)
+
+    def test_rechazo_definitivo_total_cero(self):
+        from .pac import FakePACClient
+        from .timbrado import procesar_lote, tomar_trabajos
+
+        Venta.objects.filter(pk=self.venta.pk).update(total=0)
+        conteo = procesar_lote(FakePACClient(), tomar_trabajos(10))
+        self.assertEqual((conteo["errores"], conteo["reintentos"]), (1, 0))
+        trabajo = TrabajoTimbrado.objects.get(venta=self.venta)
+        self.assertEqual((trabajo.estado, trabajo.intentos), (TrabajoTimbrado.Estado.ERROR, 1))
+        self.assertIn("mayor a 0", trabajo.ultimo_error)
+        self.assertEqual(tomar_trabajos(10), [])
+
+
+class TimbrarVentasComandoTests(VentasMixin, TransactionTestCase):
+    def test_workers_en_paralelo_timbran_cada_venta_una_vez(self):
+        from django.core.management import call_command
+
+        ventas = [
+            self.vender([{"producto": self.agua.id, "cantidad": 1}], facturar=True, uso_cfdi="G03")
+            for _ in range(5)
+        ]
+        salida = io.StringIO()
+        call_command("timbrar_ventas", "--una-vez", workers=3, lote=2, stdout=salida)
+        self.assertIn("Timbrados: 5, reintentos: 0, errores: 0, cancelados: 0.", salida.getvalue())
+        uuids = set(Venta.objects.filter(pk__in=[v.pk for v in ventas]).values_list("uuid_cfdi", flat=True))
+        self.assertEqual(len(uuids), 5)
+        self.assertEqual(
+            set(TrabajoTimbrado.objects.values_list("estado", "intentos")), {(TrabajoTimbrado.Estado.TIMBRADO, 1)},
+        )
+
+
+class AnulacionTimbradoTests(VentasTestCase):
+    def setUp(self):
+        super().setUp()
+        self.venta = self.vender(
+            [{"producto": self.agua.id, "cantidad": 1}], pagos=[{"forma_pago": "efectivo", "importe": "10.00"}],
+            facturar=True, uso_cfdi="G03",
+        )
+
+    def anular(self):
+        from .services import devolver_venta
+        devolver_venta(self.empresa.id, self.venta.id)
+
+    def test_trabajo_en_proceso_no_timbra_venta_anulada(self):
+        from .pac import FakePACClient
+        from .timbrado import procesar_lote, tomar_trabajos
+
+        trabajos = tomar_trabajos(10)
+        self.anular()
+        conteo = procesar_lote(FakePACClient(), trabajos)
+        self.assertEqual((conteo["timbrados"], conteo["cancelados"]), (0, 1))
+        self.venta.refresh_from_db()
+        self.assertIsNone(self.venta.uuid_cfdi)
+        self.assertEqual(self.venta.timbrado.estado, TrabajoTimbrado.Estado.CANCELADO)
+        self.assertEqual(tomar_trabajos(10), [])
+
+    def test_anulada_durante_la_llamada_al_pac(self):
+        from .pac import FakePACClient
+        from .timbrado import procesar_lote, tomar_trabajos
+
+        prueba = self
+
+        class PACLento(FakePACClient):
+            def timbrar(self, comprobantes):
+                prueba.anular()
+                return super().timbrar(comprobantes)
+
+        conteo = procesar_lote(PACLento(), tomar_trabajos(10))
+        self.assertEqual((conteo["timbrados"], conteo["cancelados"]), (0, 1))
+        self.venta.refresh_from_db()
+        self.assertIsNone(self.venta.uuid_cfdi)
+        self.assertIn("cancelar el CFDI", self.venta.timbrado.ultimo_error)
+
+
+class CotizarTests(VentasTestCase):
+    def test_cotiza_con_el_catalogo_de_la_empresa_activa(self):
+        otra = Empresa.objects.create(nombre="Otra")
+        r = self.api.post("/api/v1/ventas/cotizar/", {
+            "empresa": otra.id, "items": [{"producto": self.proteina.id, "cantidad": 2}],
+        }, format="json")
+        self.assertEqual(r.status_code, 200, r.content)
+        self.assertEqual(r.json()["total"], "200.00")
+
+    def test_producto_de_otra_empresa(self):
+        otra = Empresa.objects.create(nombre="Otra")
+        categoria = CategoriaProducto.objects.create(empresa=otra, nombre="Varios")
+        ajeno = Producto.objects.create(empresa=otra, categoria=categoria, nombre="Ajeno", codigo_barras="999", precio="1.00")
+        r = self.api.post("/api/v1/ventas/cotizar/", {"items": [{"producto": ajeno.id, "cantidad": 1}]}, format="json")
+        self.assertEqual(r.status_code, 400)
+
+
+class CursorPaginacionTests(VentasTestCase):
+    def recorrer(self, url):
+        ids = []
+        while url:
+            r = self.api.get(url)
+            self.assertEqual(r.status_code, 200, r.content)
+            ids += [v["id"] for v in r.json()["results"]]
+            url = r.json()["next"]
+            if len(ids) == 3:
+                # Una venta nueva a mitad del recorrido no desplaza ni repite filas.
+                self.vender([{"producto": self.agua.id, "cantidad": 1}])
+        return ids
+
+    def test_recorrido_completo_sin_repetidos(self):
+        ventas = [self.vender([{"producto": self.agua.id, "cantidad": 1}]) for _ in range(7)]
+        # Empates de fecha: el id desempata.
+        Venta.objects.filter(pk__in=[v.pk for v in ventas[2:5]]).update(fecha=ventas[2].fecha)
+        esperados = list(
+            Venta.objects.filter(pk__in=[v.pk for v in ventas]).order_by("-fecha", "-id").values_list("id", flat=True)
+        )
+        self.assertEqual(self.recorrer("/api/v1/ventas/?paginacion=cursor&page_size=3"), esperados)
+
+    def test_cursor_invalido(self):
+        self.assertEqual(self.api.get("/api/v1/ventas/", {"cursor": "alterado"}).status_code, 400)
+
+
+class IdempotenciaTests(VentasTestCase):
+    url = "/api/v1/ventas/pos-checkout/"
+
+    def carrito(self, cantidad=2):
+        return {
+            "empresa": self.empresa.id, "cliente": self.cliente.id, "almacen": self.almacen.id,
+            "items": [{"producto": self.agua.id, "cantidad": cantidad}],
+        }
+
+    def test_reintento_reproduce_la_respuesta(self):
+        primera = self.api.post(self.url, self.carrito(), format="json", HTTP_IDEMPOTENCY_KEY="caja1-0001")
+        reintento = self.api.post(self.url, self.carrito(), format="json", HTTP_IDEMPOTENCY_KEY="caja1-0001")
+        self.assertEqual((primera.status_code, reintento.status_code), (201, 201))
+        self.assertEqual(primera.json(), reintento.json())
+        self.assertEqual(reintento["Idempotent-Replayed"], "true")
+        self.assertEqual(Venta.objects.count(), 1)
+        self.assertEqual(self.existencia(self.agua), 98)
+
+    def test_clave_con_otro_cuerpo(self):
+        self.api.post(self.url, self.carrito(), format="json", HTTP_IDEMPOTENCY_KEY="caja1-0002")
+        r = self.api.post(self.url, self.carrito(cantidad=1), format="json", HTTP_IDEMPOTENCY_KEY="caja1-0002")
+        self.assertEqual(r.status_code, 422)
+        self.assertEqual(Venta.objects.count(), 1)
+
+    def test_error_no_se_guarda(self):
+        r = self.api.post(self.url, self.carrito(cantidad=500), format="json", HTTP_IDEMPOTENCY_KEY="caja1-0003")
+        self.assertEqual(r.status_code, 400)
+        self.assertFalse(SolicitudIdempotente.objects.filter(clave="caja1-0003").exists())
+        r = self.api.post(self.url, self.carrito(), format="json", HTTP_IDEMPOTENCY_KEY="caja1-0003")
+        self.assertEqual(r.status_code, 201)
+
+    def test_pago_repetido(self):
+        venta = self.vender([{"producto": self.agua.id, "cantidad": 2}])
+        for _ in range(2):
+            r = self.api.post("/api/v1/ventas/pagos/", {"venta": venta.id, "forma_pago": "efectivo", "importe": "5.00"},
+                              format="json", HTTP_IDEMPOTENCY_KEY="pago-0001")
+            self.assertEqual(r.status_code, 201, r.content)
+        venta.refresh_from_db()
+        self.assertEqual((venta.pagos.count(), venta.saldo), (1, Decimal("15.00")))
+
+
+class IdempotenciaConcurrenteTests(VentasMixin, TransactionTestCase):
+    def test_reintentos_simultaneos_crean_una_venta(self):
+        carrito = {
+            "empresa": self.empresa.id, "cliente": self.cliente.id, "almacen": self.almacen.id,
+            "items": [{"producto": self.agua.id, "cantidad": 1}],
+        }
+        barrera = threading.Barrier(2)
+        respuestas = []
+
+        def enviar():
+            try:
+                api = APIClient()
+                api.force_authenticate(self.usuario)
+                api.credentials(HTTP_X_EMPRESA_ID=str(self.empresa.id))
+                barrera.wait()
+                r = api.post("/api/v1/ventas/pos-checkout/", carrito, format="json", HTTP_IDEMPOTENCY_KEY="caja2-0001")
+                respuestas.append((r.status_code, r.json()["venta_id"]))
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=enviar) for _ in range(2)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        self.assertEqual([codigo for codigo, _ in respuestas], [201, 201])
+        self.assertEqual(len({venta_id for _, venta_id in respuestas}), 1)
+        self.assertEqual(Venta.objects.count(), 1)
+
+
+class CheckoutEmpresaTests(VentasTestCase):
+    def test_registra_en_la_empresa_activa(self):
+        otra = Empresa.objects.create(nombre="Otra")
+        venta = self.vender([{"producto": self.agua.id, "cantidad": 1}], empresa=otra.id)
+        self.assertEqual(venta.empresa_id, self.empresa.id)
 
-# Create your tests here.
@@ -0,0 +1,214 @@
+# ventas/timbrado.py
+"""
+Pipeline asíncrono de timbrado CFDI:
+  - `encolar_timbrado` inserta un TrabajoTimbrado (el checkout solo hace eso).
+  - `tomar_trabajos` reclama un lote con SELECT ... FOR UPDATE SKIP LOCKED,
+    así varios workers (hilos o procesos) no se pisan ni se esperan.
+  - `procesar_lote` llama al PAC fuera de toda transacción y escribe el
+    resultado en la venta; las fallas reintentables se reprograman con backoff
+    exponencial hasta TIMBRADO_MAX_INTENTOS.
+  - `ejecutar_worker` es el ciclo que corre `manage.py timbrar_ventas`.
+"""
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Prefetch, Q
+from django.utils import timezone
+
+from .models import Venta, DetalleVenta, TrabajoTimbrado
+from .pac import PACError, RFC_PUBLICO_GENERAL
+
+
+logger = logging.getLogger(__name__)
+
+
+def encolar_timbrado(venta, uso_cfdi=None):
+    """
+    Encola la venta para timbrar (o la reencola si quedó en error). Se puede
+    llamar dentro de la transacción de la venta. Devuelve el TrabajoTimbrado.
+    """
+    from .services import VentaError
+
+    if venta.uuid_cfdi:
+        raise VentaError("La venta ya está timbrada.")
+    if venta.estado == Venta.Estado.ANULADA:
+        raise VentaError("La venta está anulada.")
+    if uso_cfdi and uso_cfdi != venta.uso_cfdi:
+        venta.uso_cfdi = uso_cfdi
+        Venta.objects.filter(pk=venta.pk).update(uso_cfdi=uso_cfdi)
+
+    trabajo, creado = TrabajoTimbrado.objects.get_or_create(
+        venta_id=venta.pk, defaults={"empresa_id": venta.empresa_id},
+    )
+    if not creado and trabajo.estado == TrabajoTimbrado.Estado.ERROR:
+        trabajo.estado = TrabajoTimbrado.Estado.PENDIENTE
+        trabajo.intentos = 0
+        trabajo.proximo_intento = timezone.now()
+        trabajo.ultimo_error = ""
+        trabajo.save(update_fields=["estado", "intentos", "proximo_intento", "ultimo_error", "updated_at"])
+    return trabajo
+
+
+def tomar_trabajos(lote):
+    """
+    Reclama hasta `lote` trabajos listos (pendientes cuyo backoff ya venció, o
+    en proceso con el lease vencido por un worker caído) y los marca en proceso.
+    Devuelve los trabajos con su venta, detalles y datos fiscales precargados.
+    """
+    ahora = timezone.now()
+    Estado = TrabajoTimbrado.Estado
+    listos = (
+        Q(estado=Estado.PENDIENTE, proximo_intento__lte=ahora)
+        | Q(estado=Estado.PROCESANDO, tomado_en__lt=ahora - timedelta(seconds=settings.TIMBRADO_LEASE))
+    )
+    with transaction.atomic():
+        ids = list(
+            TrabajoTimbrado.objects.select_for_update(skip_locked=True)
+            .filter(listos)
+            .order_by("proximo_intento")
+            .values_list("id", flat=True)[:lote]
+        )
+        if not ids:
+            return []
+        TrabajoTimbrado.objects.filter(id__in=ids).update(
+            estado=Estado.PROCESANDO, tomado_en=ahora, intentos=F("intentos") + 1, updated_at=ahora,
+        )
+    return list(
+        TrabajoTimbrado.objects.filter(id__in=ids)
+        .select_related("venta__empresa", "venta__cliente__datos_fiscales")
+        .prefetch_related(Prefetch("venta__detalles", queryset=DetalleVenta.objects.order_by("id")))
+    )
+
+
+def comprobante_venta(venta):
+    """Datos del CFDI de una venta, en el formato que reciben los PACClient."""
+    fiscales = getattr(venta.cliente, "datos_fiscales", None)
+    return {
+        "venta_id": venta.id,
+        "emisor_rfc": venta.empresa.rfc,
+        "receptor_rfc": (fiscales.rfc if fiscales else "") or RFC_PUBLICO_GENERAL,
+        "receptor_nombre": (fiscales.razon_social if fiscales else "") or str(venta.cliente),
+        "uso_cfdi": venta.uso_cfdi,
+        "serie": venta.serie,
+        "folio": venta.folio,
+        "fecha": venta.fecha,
+        "subtotal": venta.subtotal,
+        "descuento": venta.descuento_monto,
+        "impuestos": venta.impuesto_monto,
+        "total": venta.total,
+        "conceptos": [
+            {
+                "item_tipo": d.item_tipo,
+                "item_id": d.item_id,
+                "descripcion": d.descripcion,
+                "cantidad": d.cantidad,
+                "precio_unitario": d.precio_unitario,
+                "importe": d.total,
+            }
+            for d in venta.detalles.all()
+        ],
+    }
+
+
+def _backoff(intentos):
+    """Espera antes del siguiente intento: exponencial con tope y ±20% de jitter."""
+    segundos = min(settings.TIMBRADO_BACKOFF_BASE * 2 ** max(intentos - 1, 0), settings.TIMBRADO_BACKOFF_MAX)
+    return timedelta(seconds=segundos * random.uniform(0.8, 1.2))
+
+
+def procesar_lote(cliente, trabajos):
+    """
+    Timbra `trabajos` (ya reclamados) en una sola llamada al PAC y guarda cada
+    resultado. Solo escribe si el trabajo sigue siendo de este worker (mismo
+    `tomado_en`) y la venta no se anuló entretanto. Devuelve
+    {"timbrados": n, "reintentos": n, "errores": n, "cancelados": n}.
+    """
+    conteo = {"timbrados": 0, "reintentos": 0, "errores": 0, "cancelados": 0}
+    Estado = TrabajoTimbrado.Estado
+    ahora = timezone.now()
+
+    # Ventas anuladas después de tomar el trabajo: no se mandan al PAC.
+    anuladas = set(
+        Venta.objects.filter(pk__in=[t.venta_id for t in trabajos], estado=Venta.Estado.ANULADA)
+        .values_list("id", flat=True)
+    )
+    for trabajo in [t for t in trabajos if t.venta_id in anuladas]:
+        TrabajoTimbrado.objects.filter(pk=trabajo.pk, estado=Estado.PROCESANDO, tomado_en=trabajo.tomado_en).update(
+            estado=Estado.CANCELADO, ultimo_error="Venta anulada.", updated_at=ahora,
+        )
+        conteo["cancelados"] += 1
+    trabajos = [t for t in trabajos if t.venta_id not in anuladas]
+    if not trabajos:
+        return conteo
+    try:
+        resultados = cliente.timbrar([comprobante_venta(t.venta) for t in trabajos])
+    except PACError as e:
+        resultados = {t.venta_id: e for t in trabajos}
+    except Exception as e:  # red, timeout, respuesta inválida: se reintenta el lote
+        logger.exception("Falla del PAC al timbrar %s comprobantes", len(trabajos))
+        resultados = {t.venta_id: PACError(str(e) or e.__class__.__name__) for t in trabajos}
+
+    ahora = timezone.now()
+    for trabajo in trabajos:
+        propio = TrabajoTimbrado.objects.filter(pk=trabajo.pk, estado=Estado.PROCESANDO, tomado_en=trabajo.tomado_en)
+        resultado = resultados.get(trabajo.venta_id) or PACError("El PAC no devolvió resultado.")
+        if isinstance(resultado, PACError):
+            if resultado.reintentable and trabajo.intentos < settings.TIMBRADO_MAX_INTENTOS:
+                propio.update(
+                    estado=Estado.PENDIENTE, proximo_intento=ahora + _backoff(trabajo.intentos),
+                    ultimo_error=resultado.detail, updated_at=ahora,
+                )
+                conteo["reintentos"] += 1
+            else:
+                propio.update(estado=Estado.ERROR, ultimo_error=resultado.detail, updated_at=ahora)
+                conteo["errores"] += 1
+            continue
+
+        with transaction.atomic():
+            # Lock de la venta primero (mismo orden que devolver_venta): una anulación
+            # concurrente espera a este commit o ya marcó el trabajo como cancelado.
+            estado_venta = (
+                Venta.objects.select_for_update().filter(pk=trabajo.venta_id)
+                .values_list("estado", flat=True).first()
+            )
+            if estado_venta == Venta.Estado.ANULADA:
+                # El PAC ya timbró: el CFDI queda registrado para cancelarlo ante el SAT
+                # (devolver_venta pudo haber marcado ya el trabajo como cancelado).
+                TrabajoTimbrado.objects.filter(
+                    pk=trabajo.pk, tomado_en=trabajo.tomado_en, estado__in=[Estado.PROCESANDO, Estado.CANCELADO],
+                ).update(
+                    estado=Estado.CANCELADO, updated_at=ahora,
+                    ultimo_error=f"Venta anulada durante el timbrado; cancelar el CFDI {resultado['uuid']} ante el SAT.",
+                )
+                conteo["cancelados"] += 1
+            elif propio.update(estado=Estado.TIMBRADO, ultimo_error="", updated_at=ahora):
+                Venta.objects.filter(pk=trabajo.venta_id).update(
+                    uuid_cfdi=resultado["uuid"],
+                    folio_fiscal=resultado.get("folio_fiscal") or resultado["uuid"],
+                    updated_at=ahora,
+                )
+                conteo["timbrados"] += 1
+    return conteo
+
+
+def ejecutar_worker(cliente, lote, detener, una_vez=False, espera=5):
+    """
+    Ciclo de un worker: toma lotes y los procesa hasta que `detener`
+    (threading.Event) se active, o hasta vaciar la cola con una_vez=True.
+    Devuelve los conteos acumulados.
+    """
+    total = {"timbrados": 0, "reintentos": 0, "errores": 0, "cancelados": 0}
+    while not detener.is_set():
+        close_old_connections()
+        trabajos = tomar_trabajos(lote)
+        if not trabajos:
+            if una_vez:
+                break
+            detener.wait(espera)
+            continue
+        for clave, n in procesar_lote(cliente, trabajos).items():
+            total[clave] += n
+    return total
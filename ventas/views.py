@@ -1,18 +1,26 @@
 # views.py
+from datetime import timedelta
 from decimal import Decimal
 from django.db import transaction
+from django.db.models import Prefetch
+from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from django.db.models import Sum, Case, When, IntegerField, F, Value, DecimalField
-from django.db.models.functions import Coalesce
+from django.utils.dateparse import parse_date
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets, permissions, decorators, response, status
 from rest_framework import filters as drf_filters
 from rest_framework.pagination import PageNumberPagination
 from core.mixins import CompanyScopedQuerysetMixin
 from core.permissions import IsAuthenticatedInCompany
-
-from .models import CodigoDescuento, Venta, DetalleVenta, MetodoPago
-from inventario.models import MovimientoProducto, Almacen
+from core.idempotency import idempotente
+from core.pagination import KeysetListMixin, KeysetPagination, usa_keyset
+from core.streaming import streaming_csv_response, streaming_xlsx_response
+
+from .models import CodigoDescuento, Venta, DetalleVenta, MetodoPago, TrabajoTimbrado
+from .services import (
+    VentaError, registrar_venta_pos, cotizar_venta, sincronizar_ventas, kpis_ventas, devolver_venta,
+    canjear_codigo, liberar_reservas,
+)
 from .serializers import (
     CodigoDescuentoSerializer,
     MetodoPagoSerializer,
@@ -22,6 +30,10 @@ from .serializers import (
     VentaDetailSerializer,
 )
 from .filters import VentaFilter
+from .reportes import (
+    REPORTES, CAMPOS_ANTIGUEDAD, reporte_ventas, antiguedad_saldos, fila_antiguedad, totales_antiguedad,
+)
+from .timbrado import encolar_timbrado
 
 class DefaultPagination(PageNumberPagination):
     page_size = 50
@@ -85,7 +97,7 @@ class CodigoDescuentoViewSet(BaseAuthViewSet):
                 {"valid": False, "reason": "No existe o no pertenece a tu empresa."}, status=200
             )
 
-        if cd.restantes <= 0:
+        if cd.usos_disponibles() <= 0:
             return response.Response({"valid": False, "reason": "Sin usos restantes."}, status=200)
 
         data = {"valid": True, "codigo": cd.codigo, "tipo": cd.tipo_descuento, "descuento": str(cd.descuento)}
@@ -118,20 +130,31 @@ class CodigoDescuentoViewSet(BaseAuthViewSet):
     def canjear(self, request, pk=None):
         """
         POST /api/v1/ventas/codigos-descuento/{id}/canjear/
+        Body opcional: {"sucursal": <id>} para consumir de la reserva de la sucursal.
+        El uso se descuenta con un UPDATE condicional (sin leer-modificar-escribir).
         """
         cd = self.get_object()
-        if not cd.is_active or cd.restantes <= 0:
+        if not cd.is_active or not canjear_codigo(cd, sucursal_id=request.data.get("sucursal") or None):
             return response.Response({"ok": False, "detail": "Código no usable."}, status=400)
-        cd.restantes = cd.restantes - 1
-        cd.updated_by = request.user
-        cd.save(update_fields=["restantes", "updated_by", "updated_at"])
-        return response.Response({"ok": True, "restantes": cd.restantes}, status=200)
+        cd.refresh_from_db(fields=["restantes"])
+        return response.Response({"ok": True, "restantes": cd.usos_disponibles()}, status=200)
 
+    @decorators.action(detail=True, methods=["post"], url_path="liberar-reservas")
+    def liberar_reservas(self, request, pk=None):
+        """
+        POST /api/v1/ventas/codigos-descuento/{id}/liberar-reservas/
+        Devuelve a `restantes` los usos reservados por sucursal sin canjear (fin de promo).
+        """
+        cd = self.get_object()
+        liberados = liberar_reservas(cd)
+        cd.refresh_from_db(fields=["restantes"])
+        return response.Response({"ok": True, "liberados": liberados, "restantes": cd.restantes}, status=200)
 
-class VentaViewSet(CompanyScopedQuerysetMixin, viewsets.ModelViewSet):
+
+class VentaViewSet(CompanyScopedQuerysetMixin, KeysetListMixin, viewsets.ModelViewSet):
     """
-    - list: 2 etapas -> (1) IDs ya filtrados y ordenados, limit 1000; (2) fetch con annotate(total_pagado).
-      Evita escanear tablas completas y duplicados por joins (pagos/detalles).
+    - list: queryset ligero filtrado; total_pagado/saldo son columnas de Venta
+      (sin annotate ni joins a pagos). Modo página con tope de 1000 o modo cursor.
     - retrieve: serializer completo con prefetch de detalles/pagos.
     """
     permission_classes = [IsAuthenticatedInCompany]
@@ -140,6 +163,7 @@ class VentaViewSet(CompanyScopedQuerysetMixin, viewsets.ModelViewSet):
     ordering_fields   = ["id", "fecha", "importe", "total"]
     ordering          = ["-fecha"]
     pagination_class  = DefaultPagination
+    keyset_fields     = ("-fecha", "-id")
 
     def get_serializer_class(self):
         return VentaListSerializer if self.action == "list" else VentaDetailSerializer
@@ -152,7 +176,7 @@ class VentaViewSet(CompanyScopedQuerysetMixin, viewsets.ModelViewSet):
             .only(
                 "id", "folio", "fecha", "empresa", "cliente",
                 "subtotal", "descuento_monto", "impuesto_monto",
-                "total", "importe", "tipo_venta"
+                "total", "importe", "tipo_venta", "estado", "total_pagado", "saldo",
             )
         )
 
@@ -167,46 +191,32 @@ class VentaViewSet(CompanyScopedQuerysetMixin, viewsets.ModelViewSet):
     def get_queryset(self):
         # DRF usará este queryset también para retrieve
         if self.action == "retrieve":
-            return self.detail_queryset()
-        return self.base_queryset()
+            return self.filter_queryset_by_company(self.detail_queryset())
+        return self.filter_queryset_by_company(self.base_queryset())
 
     def list(self, request, *args, **kwargs):
         """
-        1) Aplica filtros/ordering sobre queryset ligero (sin annotate).
-        2) Evita duplicados si vienen filtros many-to-one (forma_pago, item_tipo).
-        3) Toma solo los 1000 IDs más recientes.
-        4) Reconsulta esas ventas con annotate(total_pagado) y responde (paginado).
+        Modo cursor (?paginacion=cursor, luego ?cursor=<token>): keyset sobre
+        (fecha, id) desc sin tope de 1000; cada página lee solo sus filas del
+        índice (empresa, fecha).
+
+        Modo página (por defecto, compatibilidad):
+        1) Aplica filtros/ordering sobre queryset ligero de la empresa activa
+           (forma_pago/item_tipo son EXISTS: no duplican filas, sin DISTINCT).
+        2) Toma solo las 1000 ventas más recientes y pagina dentro de ellas.
         """
         # 1) filtros (DjangoFilterBackend + OrderingFilter)
-        qs_light = self.filter_queryset(self.base_queryset())
+        qs = self.filter_queryset(self.get_queryset())
 
-        # 2) ordering por defecto estable si no envían ?ordering=
-        if not request.query_params.get("ordering"):
-            qs_light = qs_light.order_by("-fecha", "-id")
+        if usa_keyset(request):
+            return self.keyset_list(qs)
 
-        # Evitar duplicados si se filtra por relaciones many (pagos/detalles)
-        if "forma_pago" in request.query_params or "item_tipo" in request.query_params:
-            qs_light = qs_light.distinct()
+        # ordering por defecto estable si no envían ?ordering=
+        if not request.query_params.get("ordering"):
+            qs = qs.order_by("-fecha", "-id")
 
-        # 3) limitar a 1000 IDs ya filtrados/ordenados
-        ids_subquery = qs_light.values_list("id", flat=True)[:1000]
-
-        # 4) fetch final de esas ventas + annotate
-        qs = (
-            Venta.objects.filter(id__in=ids_subquery)
-            .select_related("empresa", "cliente")
-            .only(
-                "id", "folio", "fecha", "empresa", "cliente",
-                "subtotal", "descuento_monto", "impuesto_monto",
-                "total", "importe", "tipo_venta"
-            )
-            .annotate( total_pagado=Coalesce(
-            Sum("pagos__importe"),
-            Value(0),
-            output_field=DecimalField(max_digits=12, decimal_places=2),
-        ))
-            .order_by("-fecha", "-id")
-        )
+        # 2) límite duro
+        qs = qs[:1000]
 
         page = self.paginate_queryset(qs)
         if page is not None:
@@ -216,210 +226,425 @@ class VentaViewSet(CompanyScopedQuerysetMixin, viewsets.ModelViewSet):
         return response.Response(ser.data)
 
     @decorators.action(detail=False, methods=["post"], url_path="pos-checkout")
+    @idempotente
     def pos_checkout(self, request):
         """
-        Cierra una venta con múltiples pagos.
+        Cierra una venta con múltiples pagos (ver ventas.services.registrar_venta_pos:
+        un solo bloqueo de saldos y bulk_create de detalles/movimientos/pagos).
+        Precios e impuestos los resuelve el servidor (ver `cotizar`); `precio_unit` se ignora.
+        Acepta header Idempotency-Key: un reintento devuelve la misma respuesta
+        sin crear otra venta.
+        La venta se registra en la empresa activa (se ignora "empresa" del body).
         Payload esperado:
         {
-          "empresa": 1,
           "cliente": 123,
           "almacen": 5,                 # opcional si hay productos
           "codigo_descuento": "ABC10",  # opcional
           "items": [
-            {"producto": 10, "plan": null, "cantidad": 2, "precio_unit": "199.00"},
-            {"producto": null, "plan": 3,  "cantidad": 1, "precio_unit": "499.00"}
+            {"producto": 10, "cantidad": 2},
+            {"plan": 3, "esquema": "individual", "tipo": "mensual", "cantidad": 1}   # o "precio_plan": <id>
           ],
           "pagos": [
             {"forma_pago": "efectivo", "importe": "300.00"},
             {"forma_pago": "tarjeta",  "importe": "597.00"}
           ],
-          "fecha": null
+          "fecha": null,
+          "facturar": false,            # opcional: encola el timbrado CFDI (asíncrono)
+          "uso_cfdi": "G03"             # opcional
         }
         """
-        data        = request.data
-        empresa_id  = data.get("empresa")
-        cliente_id  = data.get("cliente")
-        almacen_id  = data.get("almacen")
-        codigo_str  = (data.get("codigo_descuento") or "").strip().upper()
-        items       = data.get("items") or []
-        pagos_in    = data.get("pagos") or []
-        fecha       = data.get("fecha") or timezone.now()
-
-        if not empresa_id or not cliente_id or not items:
-            return response.Response({"detail": "Faltan campos obligatorios (empresa, cliente, items)."}, status=400)
-
+        empresa_id = self.get_active_company_id()
+        if not empresa_id:
+            return response.Response({"detail": "Empresa no definida."}, status=status.HTTP_400_BAD_REQUEST)
+        data = request.data
         try:
-            almacen = Almacen.objects.get(pk=almacen_id, empresa_id=empresa_id) if almacen_id else None
-        except Almacen.DoesNotExist:
-            return response.Response({"detail": "Almacén inválido."}, status=400)
-
-        # Subtotal
-        subtotal = Decimal("0.00")
-        for it in items:
-            try:
-                qty = int(it.get("cantidad", 0))
-                pu  = Decimal(str(it.get("precio_unit", "0")))
-            except Exception:
-                return response.Response({"detail": "cantidad/precio_unit inválidos."}, status=400)
-            if qty <= 0 or pu < 0:
-                return response.Response({"detail": "Cantidad o precio inválidos."}, status=400)
-            subtotal += (pu * qty)
-
-        # Descuento
-        descuento_aplicado = Decimal("0.00")
-        cd = None
-        if codigo_str:
-            try:
-                cd = CodigoDescuento.objects.select_for_update().get(
-                    empresa_id=empresa_id, codigo=codigo_str, is_active=True
-                )
-            except CodigoDescuento.DoesNotExist:
-                return response.Response({"detail": "Código de descuento inválido."}, status=400)
+            venta, detalles, pagos = registrar_venta_pos(
+                empresa_id=empresa_id,
+                cliente_id=data.get("cliente"),
+                items=data.get("items") or [],
+                pagos=data.get("pagos") or [],
+                almacen_id=data.get("almacen"),
+                codigo_descuento=data.get("codigo_descuento"),
+                fecha=data.get("fecha"),
+                usuario=request.user,
+                facturar=data.get("facturar"),
+                uso_cfdi=data.get("uso_cfdi"),
+            )
+        except VentaError as e:
+            return response.Response({"detail": e.detail, **e.extra}, status=status.HTTP_400_BAD_REQUEST)
 
-            if cd.restantes <= 0:
-                return response.Response({"detail": "El código no tiene usos disponibles."}, status=400)
+        return response.Response({
+            "ok": True,
+            "venta_id": venta.id,
+            "detalles": [d.id for d in detalles],
+            "pagos": [p.id for p in pagos],
+            "subtotal": str(venta.subtotal),
+            "descuento": str(venta.descuento_monto),
+            "impuestos": str(venta.impuesto_monto),
+            "total": str(venta.total),
+        }, status=status.HTTP_201_CREATED)
 
-            if cd.tipo_descuento == CodigoDescuento.Tipo.PORCENTAJE:
-                descuento_aplicado = (subtotal * cd.descuento) / Decimal("100")
-            else:
-                descuento_aplicado = cd.descuento
+    @decorators.action(detail=False, methods=["post"], url_path="cotizar")
+    def cotizar(self, request):
+        """
+        Cotiza un carrito del POS sin registrar nada (mismo cálculo que pos-checkout).
+        POST /api/v1/ventas/cotizar/
+        {"codigo_descuento": "ABC10", "items": [{"producto": 10, "cantidad": 2}, ...]}
+        Usa el catálogo de la empresa activa (se ignora "empresa" del body).
+        Respuesta: renglones con precio, descuento prorrateado, IVA/IEPS y totales (texto).
+        """
+        empresa_id = self.get_active_company_id()
+        if not empresa_id:
+            return response.Response({"detail": "Empresa no definida."}, status=status.HTTP_400_BAD_REQUEST)
+        data = request.data
+        try:
+            cot = cotizar_venta(
+                empresa_id=empresa_id,
+                items=data.get("items") or [],
+                codigo_descuento=data.get("codigo_descuento"),
+            )
+        except VentaError as e:
+            return response.Response({"detail": e.detail, **e.extra}, status=status.HTTP_400_BAD_REQUEST)
 
-            if descuento_aplicado > subtotal:
-                descuento_aplicado = subtotal
+        return response.Response({
+            "codigo_descuento": cot["codigo_descuento"],
+            "subtotal": str(cot["subtotal"]),
+            "descuento": str(cot["descuento"]),
+            "impuestos": str(cot["impuestos"]),
+            "total": str(cot["total"]),
+            "lineas": [
+                {
+                    "producto": ln["producto_id"],
+                    "plan": ln["plan_id"],
+                    "precio_plan": ln["precio_plan_id"],
+                    "descripcion": ln["descripcion"],
+                    "cantidad": ln["cantidad"],
+                    "precio_unitario": str(ln["precio_unitario"]),
+                    "subtotal": str(ln["subtotal"]),
+                    "descuento": str(ln["descuento_monto"]),
+                    "iva_pct": str(ln["iva_pct"]),
+                    "iva": str(ln["iva_monto"]),
+                    "ieps_pct": str(ln["ieps_pct"]),
+                    "ieps": str(ln["ieps_monto"]),
+                    "total": str(ln["total"]),
+                }
+                for ln in cot["lineas"]
+            ],
+        })
+
+    @decorators.action(detail=False, methods=["post"], url_path="sync")
+    def sync(self, request):
+        """
+        Sube en bloque las ventas que una caja capturó sin conexión
+        (ver ventas.services.sincronizar_ventas).
+        POST /api/v1/ventas/sync/
+        {
+          "ventas": [
+            {"uuid": "0b7c...", "cliente": 123, "almacen": 5, "codigo_descuento": "",
+             "items": [...], "pagos": [...], "fecha": "2025-10-01T12:30:00"},
+            ...
+          ]
+        }
+        Cada venta usa el payload de pos-checkout más `uuid` (generado por la caja).
+        Reenviar un lote es seguro: los uuid ya registrados se reportan como "duplicada".
+        Respuesta: {"resultados": {uuid: {"estado": "creada"|"duplicada"|"error", ...}},
+                    "creadas": n, "duplicadas": n, "errores": n}
+        """
+        empresa_id = self.get_active_company_id()
+        if not empresa_id:
+            return response.Response({"detail": "Empresa no definida."}, status=status.HTTP_400_BAD_REQUEST)
+        ventas = request.data.get("ventas")
+        if not isinstance(ventas, list) or not ventas:
+            return response.Response({"detail": "`ventas` debe ser una lista no vacía."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ventas) > SYNC_MAX_VENTAS:
+            return response.Response(
+                {"detail": f"Máximo {SYNC_MAX_VENTAS} ventas por lote."}, status=status.HTTP_400_BAD_REQUEST,
+            )
 
-        total = (subtotal - descuento_aplicado).quantize(Decimal("0.01"))
-        if total < 0:
-            total = Decimal("0.00")
+        resultados = sincronizar_ventas(empresa_id, ventas, usuario=request.user)
+        conteo = {"creada": 0, "duplicada": 0, "error": 0}
+        for r in resultados.values():
+            conteo[r["estado"]] += 1
+        return response.Response({
+            "resultados": resultados,
+            "creadas": conteo["creada"],
+            "duplicadas": conteo["duplicada"],
+            "errores": conteo["error"],
+        }, status=status.HTTP_200_OK)
+
+    @decorators.action(detail=True, methods=["post"], url_path="anular")
+    def anular(self, request, pk=None):
+        """
+        POST /api/v1/ventas/{id}/anular/
+        Body opcional: {"motivo": "...", "reembolsos": [{"forma_pago": "efectivo", "importe": "100.00"}]}
+        Devuelve todo lo pendiente de la venta (ver ventas.services.devolver_venta).
+        """
+        return self._devolver(request, pk, renglones=None)
 
-        # Validar pagos
-        total_pagos = Decimal("0.00")
-        for p in pagos_in:
+    @decorators.action(detail=True, methods=["post"], url_path="devolucion")
+    def devolucion(self, request, pk=None):
+        """
+        POST /api/v1/ventas/{id}/devolucion/
+        {"renglones": [{"detalle": 55, "cantidad": 1}], "motivo": "...", "reembolsos": [...]}
+        Devolución parcial: reingresa el stock, registra el reembolso como pago
+        negativo y deja los totales de la venta netos.
+        """
+        renglones = request.data.get("renglones")
+        if not isinstance(renglones, list) or not renglones:
+            return response.Response({"detail": "`renglones` debe ser una lista no vacía."}, status=status.HTTP_400_BAD_REQUEST)
+        return self._devolver(request, pk, renglones=renglones)
+
+    def _devolver(self, request, pk, renglones):
+        data = request.data
+        reembolsos = data.get("reembolsos")
+        try:
+            venta, movimientos, pagos = devolver_venta(
+                empresa_id=self.get_active_company_id(),
+                venta_id=pk,
+                renglones=renglones,
+                reembolsos=reembolsos if isinstance(reembolsos, list) else None,
+                usuario=request.user,
+                motivo=(data.get("motivo") or "").strip(),
+            )
+        except VentaError as e:
+            return response.Response({"detail": e.detail, **e.extra}, status=status.HTTP_400_BAD_REQUEST)
+        return response.Response({
+            "ok": True,
+            "venta_id": venta.id,
+            "estado": venta.estado,
+            "movimientos": [m.id for m in movimientos],
+            "pagos": [p.id for p in pagos],
+            "reembolsado": str(-sum((p.importe for p in pagos), Decimal("0.00"))),
+            "total": str(venta.total),
+            "saldo": str(venta.saldo),
+        }, status=status.HTTP_200_OK)
+
+    @decorators.action(detail=True, methods=["get", "post"], url_path="facturar")
+    def facturar(self, request, pk=None):
+        """
+        POST /api/v1/ventas/{id}/facturar/  Body: {"uso_cfdi": "G03"}
+        Encola el timbrado CFDI de la venta y responde 202 sin esperar al PAC
+        (lo procesa `manage.py timbrar_ventas`). Reencola si quedó en error.
+        GET: estado del timbrado.
+        """
+        venta = get_object_or_404(self.filter_queryset_by_company(Venta.objects.all()), pk=pk)
+        if request.method == "POST":
+            uso_cfdi = (request.data.get("uso_cfdi") or "").strip().upper() or None
+            if not (uso_cfdi or venta.uso_cfdi):
+                return response.Response({"detail": "uso_cfdi es requerido."}, status=status.HTTP_400_BAD_REQUEST)
             try:
-                imp = Decimal(str(p.get("importe", "0")))
-                if imp <= 0:
-                    return response.Response({"detail": "Importe de pago debe ser > 0."}, status=400)
-                total_pagos += imp
-            except Exception:
-                return response.Response({"detail": "Importe de pago inválido."}, status=400)
+                with transaction.atomic():
+                    trabajo = encolar_timbrado(venta, uso_cfdi=uso_cfdi)
+            except VentaError as e:
+                return response.Response({"detail": e.detail, **e.extra}, status=status.HTTP_400_BAD_REQUEST)
+            codigo = status.HTTP_202_ACCEPTED
+        else:
+            trabajo = TrabajoTimbrado.objects.filter(venta=venta).first()
+            if trabajo is None:
+                return response.Response({"detail": "La venta no tiene timbrado solicitado."}, status=status.HTTP_404_NOT_FOUND)
+            codigo = status.HTTP_200_OK
+        return response.Response({
+            "venta": venta.id,
+            "estado": trabajo.estado,
+            "intentos": trabajo.intentos,
+            "ultimo_error": trabajo.ultimo_error,
+            "uso_cfdi": venta.uso_cfdi,
+            "uuid_cfdi": venta.uuid_cfdi,
+            "folio_fiscal": venta.folio_fiscal,
+        }, status=codigo)
+
+    @decorators.action(detail=False, methods=["get"], url_path="kpis")
+    def kpis(self, request):
+        """
+        KPIs del tablero desde el rollup diario (no escanea ventas/pagos/detalles).
+        GET /api/v1/ventas/kpis/?desde=YYYY-MM-DD&hasta=YYYY-MM-DD[&sucursal=<id>]
+        Por defecto: últimos 30 días.
+        """
+        empresa_id = self.get_active_company_id()
+        if not empresa_id:
+            return response.Response({"detail": "Empresa no definida."}, status=status.HTTP_400_BAD_REQUEST)
+        desde, hasta = self._rango_fechas(request)
+        if desde is None:
+            return response.Response({"detail": "Rango de fechas inválido."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            sucursal_id = int(request.query_params["sucursal"]) if request.query_params.get("sucursal") else None
+        except ValueError:
+            return response.Response({"detail": "sucursal debe ser entero."}, status=status.HTTP_400_BAD_REQUEST)
+        return response.Response(kpis_ventas(empresa_id, desde, hasta, sucursal_id=sucursal_id))
 
-        # Exigir cobertura exacta (opcional)
-        if pagos_in and total_pagos != total:
+    @decorators.action(detail=False, methods=["get"], url_path=r"reportes/(?P<reporte>[a-z]+)")
+    def reportes(self, request, reporte=None):
+        """
+        Reportes de gerencia con cache por empresa/rango (ver ventas.reportes).
+        GET /api/v1/ventas/reportes/<productos|planes|cajeros|sucursales>/
+            ?desde=YYYY-MM-DD&hasta=YYYY-MM-DD[&sucursal=<id>][&limite=N]
+        Por defecto: últimos 30 días. `limite` (top N) aplica a productos y planes.
+        """
+        empresa_id = self.get_active_company_id()
+        if not empresa_id:
+            return response.Response({"detail": "Empresa no definida."}, status=status.HTTP_400_BAD_REQUEST)
+        if reporte not in REPORTES:
             return response.Response(
-                {"detail": f"La suma de pagos ({total_pagos}) debe ser igual al total ({total})."},
-                status=400
+                {"detail": f"Reporte desconocido. Opciones: {', '.join(REPORTES)}."},
+                status=status.HTTP_404_NOT_FOUND,
             )
+        desde, hasta = self._rango_fechas(request)
+        if desde is None:
+            return response.Response({"detail": "Rango de fechas inválido."}, status=status.HTTP_400_BAD_REQUEST)
+        params = request.query_params
+        try:
+            sucursal_id = int(params["sucursal"]) if params.get("sucursal") else None
+            limite = int(params["limite"]) if params.get("limite") else None
+        except ValueError:
+            return response.Response({"detail": "sucursal y limite deben ser enteros."}, status=status.HTTP_400_BAD_REQUEST)
+        if limite is not None and limite < 1:
+            return response.Response({"detail": "limite debe ser mayor a 0."}, status=status.HTTP_400_BAD_REQUEST)
+        return response.Response(reporte_ventas(empresa_id, reporte, desde, hasta, sucursal_id, limite))
+
+    @decorators.action(detail=False, methods=["get"], url_path="antiguedad-saldos")
+    def antiguedad_saldos(self, request):
+        """
+        Antigüedad de saldos por cliente (0-30, 31-60, 61-90 y más de 90 días), en SQL.
+        GET /api/v1/ventas/antiguedad-saldos/?[corte=YYYY-MM-DD][&sucursal=<id>][&cliente=<id>][&formato=csv]
+        - JSON: paginación por cursor sobre el id del cliente ({"next", "results"});
+          la primera página agrega "totales" de la empresa.
+        - formato=csv: todos los clientes en streaming (.iterator), sin paginar.
+        """
+        empresa_id = self.get_active_company_id()
+        if not empresa_id:
+            return response.Response({"detail": "Empresa no definida."}, status=status.HTTP_400_BAD_REQUEST)
+        params = request.query_params
+        try:
+            corte = parse_date(params["corte"]) if params.get("corte") else timezone.localdate()
+        except ValueError:
+            corte = None
+        if corte is None:
+            return response.Response({"detail": "corte debe ser una fecha YYYY-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            sucursal_id = int(params["sucursal"]) if params.get("sucursal") else None
+            cliente_id = int(params["cliente"]) if params.get("cliente") else None
+        except ValueError:
+            return response.Response({"detail": "sucursal y cliente deben ser enteros."}, status=status.HTTP_400_BAD_REQUEST)
+        formato = (params.get("formato") or "json").lower()
+        if formato not in ("json", "csv"):
+            return response.Response({"detail": "formato debe ser json o csv."}, status=status.HTTP_400_BAD_REQUEST)
+
+        qs = antiguedad_saldos(empresa_id, corte, sucursal_id=sucursal_id, cliente_id=cliente_id)
+        if formato == "csv":
+            filas = (
+                list(fila_antiguedad(c).values())
+                for c in qs.order_by("id").iterator(chunk_size=EXPORT_CHUNK_SIZE)
+            )
+            header = [nombre for nombre, _ in CAMPOS_ANTIGUEDAD]
+            return streaming_csv_response(filas, header=header, filename=f"antiguedad_saldos_{corte}.csv")
+
+        paginator = KeysetPagination()
+        paginator.keyset_fields = ("id",)
+        page = paginator.paginate_queryset(qs, request)
+        resp = paginator.get_paginated_response([fila_antiguedad(c) for c in page])
+        if not params.get("cursor"):
+            resp.data["corte"] = corte
+            resp.data["totales"] = totales_antiguedad(empresa_id, corte, sucursal_id=sucursal_id, cliente_id=cliente_id)
+        return resp
+
+    def _rango_fechas(self, request):
+        """(desde, hasta) de los query params; por defecto los últimos KPIS_DIAS_DEFAULT días. (None, None) si es inválido."""
+        params = request.query_params
+        hoy = timezone.localdate()
+        try:
+            desde = parse_date(params["desde"]) if params.get("desde") else hoy - timedelta(days=KPIS_DIAS_DEFAULT)
+            hasta = parse_date(params["hasta"]) if params.get("hasta") else hoy
+        except ValueError:
+            desde = hasta = None
+        if desde is None or hasta is None or desde > hasta:
+            return None, None
+        return desde, hasta
 
-        # Stock
-        for it in items:
-            prod_id = it.get("producto")
-            qty     = int(it.get("cantidad", 0))
-            if prod_id and almacen:
-                stock = MovimientoProducto.objects.filter(
-                    empresa_id=empresa_id,
-                    producto_id=prod_id,
-                    almacen_id=almacen.id,
-                ).aggregate(
-                    s=Sum(
-                        Case(
-                            When(tipo_movimiento=MovimientoProducto.TipoMovimiento.ENTRADA, then='cantidad'),
-                            When(tipo_movimiento=MovimientoProducto.TipoMovimiento.SALIDA,  then=-1 * F('cantidad')),
-                            When(tipo_movimiento=MovimientoProducto.TipoMovimiento.AJUSTE,  then='cantidad'),
-                            default=0,
-                            output_field=IntegerField(),
-                        )
-                    )
-                )["s"] or 0
-                if stock < qty:
-                    return response.Response(
-                        {"detail": f"Stock insuficiente para producto {prod_id}. Disponible: {stock}, requerido: {qty}"},
-                        status=400
-                    )
-
-        # Transacción
-        with transaction.atomic():
-            venta = Venta.objects.create(
-                empresa_id=empresa_id,
-                cliente_id=cliente_id,
-                fecha=fecha,
-                importe=total,
-                subtotal=subtotal,
-                descuento_monto=descuento_aplicado,
-                total=total,
-                created_by=request.user,
-                updated_by=request.user,
+
+    @decorators.action(detail=False, methods=["get"], url_path="exportar")
+    def exportar(self, request):
+        """
+        Exporta TODAS las ventas que cumplen los filtros de VentaFilter (sin tope).
+        GET /api/v1/ventas/exportar/?formato=csv|xlsx[&incluir=detalles,pagos][&<filtros>]
+        - Lee con cursor del servidor (.iterator(chunk_size)) y escribe el archivo
+          en streaming: la memoria no depende del número de filas.
+        - incluir: agrega renglones aplanados (columna `linea` = venta/detalle/pago);
+          detalles/pagos se precargan por bloque de ventas.
+        """
+        formato = (request.query_params.get("formato") or "csv").lower()
+        if formato not in ("csv", "xlsx"):
+            return response.Response({"detail": "formato debe ser csv o xlsx."}, status=status.HTTP_400_BAD_REQUEST)
+        incluir = {x.strip() for x in (request.query_params.get("incluir") or "").split(",") if x.strip()}
+        if incluir - {"detalles", "pagos"}:
+            return response.Response({"detail": "incluir admite: detalles, pagos."}, status=status.HTTP_400_BAD_REQUEST)
+
+        qs = (
+            self.filter_queryset(self.filter_queryset_by_company(Venta.objects.all()))
+            .select_related("cliente")
+            .only(*EXPORT_CAMPOS_VENTA, "cliente__nombre", "cliente__apellidos")
+            .order_by("fecha", "id")
+        )
+        if "detalles" in incluir:
+            qs = qs.prefetch_related(Prefetch(
+                "detalles", queryset=DetalleVenta.objects.only("venta_id", *EXPORT_CAMPOS_DETALLE).order_by("id"),
+            ))
+        if "pagos" in incluir:
+            qs = qs.prefetch_related(Prefetch(
+                "pagos", queryset=MetodoPago.objects.only("venta_id", *EXPORT_CAMPOS_PAGO).order_by("id"),
+            ))
+
+        header = list(EXPORT_CAMPOS_VENTA) + ["cliente"]
+        if incluir:
+            header = (
+                ["linea"] + header
+                + [f"detalle_{c}" for c in EXPORT_CAMPOS_DETALLE]
+                + [f"pago_{c}" for c in EXPORT_CAMPOS_PAGO]
             )
 
-            # Detalles + movimientos
-            detalles_out = []
-            for it in items:
-                prod_id = it.get("producto")
-                plan_id = it.get("plan")
-                qty     = int(it.get("cantidad", 0))
-                pu      = Decimal(str(it.get("precio_unit", "0")))
-
-                line_subtotal = (pu * qty).quantize(Decimal('0.01'))
-                det = DetalleVenta.objects.create(
-                    venta=venta,
-                    producto_id=prod_id or None,
-                    plan_id=plan_id or None,
-                    cantidad=qty,
-                    precio_unitario=pu,
-                    descuento_monto=Decimal('0.00'),
-                    impuesto_pct=Decimal('0.00'),
-                    impuesto_monto=Decimal('0.00'),
-                    subtotal=line_subtotal,
-                    total=line_subtotal,
-                    created_by=request.user,
-                    updated_by=request.user,
-                )
-                detalles_out.append(det.id)
-
-                if prod_id and almacen:
-                    MovimientoProducto.objects.create(
-                        empresa_id=empresa_id,
-                        producto_id=prod_id,
-                        almacen_id=almacen.id,
-                        tipo_movimiento=MovimientoProducto.TipoMovimiento.SALIDA,
-                        cantidad=qty,
-                        fecha=fecha,
-                        created_by=request.user,
-                        updated_by=request.user,
-                    )
-
-            # Pagos
-            pagos_out = []
-            for p in pagos_in:
-                mp = MetodoPago.objects.create(
-                    venta=venta,
-                    forma_pago=(p.get("forma_pago") or "").strip().lower(),
-                    importe=Decimal(str(p.get("importe"))),
-                    created_by=request.user,
-                    updated_by=request.user,
-                )
-                pagos_out.append(mp.id)
-
-            # Canjear descuento
-            if cd:
-                cd.restantes -= 1
-                cd.updated_by = request.user
-                cd.save(update_fields=["restantes", "updated_by", "updated_at"])
+        def filas():
+            vacio_det = [""] * len(EXPORT_CAMPOS_DETALLE)
+            vacio_pago = [""] * len(EXPORT_CAMPOS_PAGO)
+            i_fecha = EXPORT_CAMPOS_VENTA.index("fecha")
+            for venta in qs.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+                base = [getattr(venta, c) for c in EXPORT_CAMPOS_VENTA] + [str(venta.cliente)]
+                # Fecha local ISO 8601, igual que en las respuestas JSON (no UTC crudo).
+                base[i_fecha] = timezone.localtime(venta.fecha).isoformat()
+                if not incluir:
+                    yield base
+                    continue
+                yield ["venta"] + base + vacio_det + vacio_pago
+                if "detalles" in incluir:
+                    for det in venta.detalles.all():
+                        yield ["detalle"] + base + [getattr(det, c) for c in EXPORT_CAMPOS_DETALLE] + vacio_pago
+                if "pagos" in incluir:
+                    for pago in venta.pagos.all():
+                        yield ["pago"] + base + vacio_det + [getattr(pago, c) for c in EXPORT_CAMPOS_PAGO]
+
+        nombre = f"ventas_{timezone.localdate():%Y%m%d}.{formato}"
+        if formato == "xlsx":
+            return streaming_xlsx_response(filas(), header=header, filename=nombre)
+        return streaming_csv_response(filas(), header=header, filename=nombre)
+
+
+KPIS_DIAS_DEFAULT = 30
+SYNC_MAX_VENTAS = 1000
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_CAMPOS_VENTA = (
+    "id", "folio", "fecha", "sucursal_id", "cliente_id", "tipo_venta",
+    "subtotal", "descuento_monto", "impuesto_monto", "total", "total_pagado", "saldo",
+)
+EXPORT_CAMPOS_DETALLE = ("item_tipo", "item_id", "descripcion", "cantidad", "precio_unitario", "descuento_monto", "total")
+EXPORT_CAMPOS_PAGO = ("forma_pago", "importe")
 
-        return response.Response({
-            "ok": True,
-            "venta_id": venta.id,
-            "detalles": detalles_out,
-            "pagos": pagos_out,
-            "subtotal": str(subtotal),
-            "descuento": str(descuento_aplicado),
-            "total": str(total),
-        }, status=status.HTTP_201_CREATED)
 
 # -----------------------------
 # Detalles de venta
 # -----------------------------
-class DetalleVentaViewSet(CompanyScopedQuerysetMixin, BaseAuthViewSet):
+class DetalleVentaViewSet(CompanyScopedQuerysetMixin, KeysetListMixin, BaseAuthViewSet):
     permission_classes = [IsAuthenticatedInCompany]
     serializer_class = DetalleVentaSerializer
+    company_filter_path = "venta__empresa"
     filter_backends = [DjangoFilterBackend, drf_filters.OrderingFilter]
     filterset_fields = ["venta", "producto", "plan", "codigo_descuento"]
     ordering_fields = ["id", "total", "precio_unitario", "cantidad"]
@@ -434,6 +659,8 @@ class DetalleVentaViewSet(CompanyScopedQuerysetMixin, BaseAuthViewSet):
 
     def list(self, request, *args, **kwargs):
         qs = self.filter_queryset(self.get_queryset())
+        if usa_keyset(request):
+            return self.keyset_list(qs)  # sin tope: keyset sobre id
         if not request.query_params.get("ordering"):
             qs = qs.order_by("-id")
         qs = qs[:1000]  # límite duro
@@ -448,10 +675,11 @@ class DetalleVentaViewSet(CompanyScopedQuerysetMixin, BaseAuthViewSet):
 # -----------------------------
 # Métodos de pago
 # -----------------------------
-class MetodoPagoViewSet(CompanyScopedQuerysetMixin, BaseAuthViewSet):
+class MetodoPagoViewSet(CompanyScopedQuerysetMixin, KeysetListMixin, BaseAuthViewSet):
     """CRUD de pagos por venta."""
     permission_classes = [IsAuthenticatedInCompany]
     serializer_class = MetodoPagoSerializer
+    company_filter_path = "venta__empresa"
     filter_backends = [DjangoFilterBackend, drf_filters.OrderingFilter]
     filterset_fields = ["venta", "forma_pago"]
     ordering_fields = ["id", "importe"]
@@ -460,8 +688,15 @@ class MetodoPagoViewSet(CompanyScopedQuerysetMixin, BaseAuthViewSet):
 
     queryset = MetodoPago.objects.select_related("venta").all()
 
+    @idempotente
+    def create(self, request, *args, **kwargs):
+        """Alta de pago; acepta header Idempotency-Key para reintentos seguros."""
+        return super().create(request, *args, **kwargs)
+
     def list(self, request, *args, **kwargs):
         qs = self.filter_queryset(self.get_queryset())
+        if usa_keyset(request):
+            return self.keyset_list(qs)  # sin tope: keyset sobre id
         if not request.query_params.get("ordering"):
             qs = qs.order_by("-id")
         qs = qs[:1000]  # límite duro